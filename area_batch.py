@@ -0,0 +1,240 @@
+"""Batch analysis of whole directories of field images.
+
+Usage:
+    python area_batch.py IMAGE_DIR --profile profile.json --out results.csv [--workers N]
+        [--fields parcels.geojson [--world-file auto|FILE]] [--cache [FILE] [--cache-size MB]]
+
+The profile is a JSON file with the same settings the GUI uses:
+
+    {
+        "highlight": {"color": [120, 96, 70], "sensitivity": 60, "strict": 3},
+        "transient": {"color": [150, 130, 100], "sensitivity": 40, "strict": null},
+        "polygon": [[10, 10], [400, 20], [380, 300], [15, 280]],
+        "polygons": {"frame_0002.jpg": [[0, 0], [50, 0], [50, 50]]}
+    }
+
+"polygon" is shared by every image, "polygons" overrides it per file name.
+Omit a layer (or set "enabled": false) to switch it off. A layer may also set
+"metric" to "l1" (default), "chebyshev" or "euclidean". Without any polygon
+the whole frame is analyzed.
+
+"classes" adds further color classes below transient in priority, each a
+layer with a "name" (and optionally an "overlay" color), and one column each:
+
+    "classes": [{"name": "severe", "color": [90, 60, 40], "sensitivity": 30},
+                {"name": "deposition", "color": [200, 180, 150], "sensitivity": 45, "strict": 2}]
+
+--fields reads field boundaries from a GeoJSON/WKT file (see area_geo) and
+writes one row per image and field instead. The coordinates are pixels, or map
+coordinates with --world-file (a file, or "auto" for each image's sidecar).
+
+--cache keeps every image's result in the result cache (see area_cache), the
+GUI's by default, so rerunning a profile over unchanged images skips them.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+import argparse, csv, json, os, sys, time
+import cv2
+import area_cache, area_engine as engine, area_geo, area_store, area_tiles
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".npy")
+FIELDS = ("image", "field", "field_pixels", "highlight", "transient", "manual", "combined", "error")
+
+
+def columns_for(profile):
+    """FIELDS with a column per further class of the profile (before "manual")."""
+    names = [c.name for c in engine.AnalysisParams.from_dict(profile).classes]
+    i = FIELDS.index("manual")
+    return FIELDS[:i] + tuple(names) + FIELDS[i:]
+
+
+def load_profile(profile_path):
+    with open(profile_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_images(image_dir):
+    return sorted(
+        path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def load_image(file_path):
+    """The whole image through area_store, so .npy/.raw files load like in the GUI."""
+    store = area_store.open_image_store(file_path)
+    try:
+        return store.full()
+    finally:
+        store.close()
+
+
+def params_for_image(profile, file_path, shape):
+    """The profile's parameters for one image; without a polygon the whole frame of shape (None: left empty)."""
+    params = engine.AnalysisParams.from_dict(profile)
+    polygons = profile.get("polygons") or {}
+    name = path.basename(file_path)
+    if name in polygons:
+        params.polygon = [(int(x), int(y)) for x, y in polygons[name]]
+    if not params.polygon and shape is not None:
+        h, w = shape[:2]
+        params.polygon = [(0, 0), (w - 1, 0), (w - 1, h - 1), (0, h - 1)]
+    return params
+
+
+def analyze_file(file_path, profile, memory_budget=None, cache=None):
+    """One output row for one image. Errors are reported in the row, not raised.
+
+    With a memory_budget (bytes) the image is opened as a store and analyzed
+    tile by tile instead of being decoded into memory at once. With a cache
+    (area_cache.ResultCache) an image analyzed before is not decoded at all.
+    """
+    row = {"image": path.basename(file_path)}
+    try:
+        if cache is not None:
+            # Keyed before decoding: the whole frame is implied by the file digest
+            digest, key_params = area_cache.file_digest(file_path), params_for_image(profile, file_path, None)
+            result = area_cache.load_result(cache, digest, key_params)
+            if result is not None:
+                row.update(result.as_dict())
+                return row
+        if memory_budget:
+            store = area_store.open_image_store(file_path)
+            try:
+                params = params_for_image(profile, file_path, store.shape)
+                result = area_tiles.analyze_field_tiled(store, params, memory_budget)
+            finally:
+                store.close()
+        else:
+            rgba = load_image(file_path)
+            result = engine.analyze_field(rgba, params_for_image(profile, file_path, rgba.shape))
+        if cache is not None:
+            area_cache.store_result(cache, digest, key_params, result)
+        row.update(result.as_dict())
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+def analyze_file_fields(file_path, profile, fieldset, world_file=None, memory_budget=None):
+    """One output row per field of fieldset (an area_geo.FieldSet) for one image."""
+    name = path.basename(file_path)
+    try:
+        if world_file == "auto":
+            world_file = area_geo.world_file_for(file_path)
+            if world_file is None:
+                raise ValueError("No world file next to the image")
+        fields = fieldset.fields(area_geo.read_world_file(world_file))
+        if memory_budget:
+            store = area_store.open_image_store(file_path)
+            try:
+                params = params_for_image(profile, file_path, store.shape)
+                results = area_tiles.analyze_fields_tiled(store, params, fields, memory_budget)
+            finally:
+                store.close()
+        else:
+            rgba = load_image(file_path)
+            results = engine.analyze_fields(rgba, params_for_image(profile, file_path, rgba.shape), fields)
+    except Exception as e:
+        return [{"image": name, "error": str(e)}]
+    rows = []
+    for f, result in zip(fields, results):
+        row = {"image": name, "field": f.name}
+        if result is None:
+            row["error"] = "Polygon mask is empty"
+        else:
+            row.update(result.as_dict())
+        rows.append(row)
+    return rows
+
+
+def _init_worker():
+    # One OpenCV thread per process, the pool already uses every core
+    cv2.setNumThreads(1)
+
+
+def run_batch(files, profile, workers=None, memory_budget=None, fieldset=None, world_file=None, cache=None):
+    """Analyze files on a process pool. Yields rows in input order.
+
+    With a fieldset every image yields one row per field (not cached). The
+    workers share the cache's file.
+    """
+    workers = workers or os.cpu_count() or 1
+    if fieldset is not None:
+        n = len(files)
+        args = (files, [profile] * n, [fieldset] * n, [world_file] * n, [memory_budget] * n)
+        if workers == 1:
+            for rows in map(analyze_file_fields, *args):
+                yield from rows
+            return
+        chunksize = max(1, n // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for rows in pool.map(analyze_file_fields, *args, chunksize=chunksize):
+                yield from rows
+        return
+    if workers == 1:
+        for f in files:
+            yield analyze_file(f, profile, memory_budget, cache)
+        return
+    n = len(files)
+    chunksize = max(1, n // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        yield from pool.map(analyze_file, files, [profile] * n, [memory_budget] * n, [cache] * n,
+                            chunksize=chunksize)
+
+
+def write_rows(rows, out_path, fmt, columns=FIELDS):
+    if fmt == "json":
+        rows = list(rows)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        return len(rows)
+    count = 0
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch area analysis over a directory of images.")
+    parser.add_argument("image_dir")
+    parser.add_argument("--profile", required=True, help="JSON parameter profile")
+    parser.add_argument("--out", required=True, help="output .csv or .json file")
+    parser.add_argument("--format", choices=("csv", "json"), help="defaults to the --out extension")
+    parser.add_argument("--workers", type=int, default=None, help="process count (default: all cores)")
+    parser.add_argument("--memory-budget", type=int, default=None, metavar="MB",
+                        help="analyze tile by tile within this much memory per worker "
+                             "(plus 1 byte per pixel of a field's bounding box while it is rasterized)")
+    parser.add_argument("--fields", help="GeoJSON/WKT file of field boundaries, one row per field")
+    parser.add_argument("--world-file", help='world file of the field coordinates, or "auto" for each image\'s sidecar')
+    parser.add_argument("--cache", nargs="?", const=area_cache.default_path(), metavar="FILE",
+                        help="reuse and keep results in this cache file (default: the GUI's)")
+    parser.add_argument("--cache-size", type=int, default=area_cache.DEFAULT_MAX_BYTES // (1024 * 1024), metavar="MB",
+                        help="evict least recently used cache entries beyond this size")
+    args = parser.parse_args(argv)
+
+    profile = load_profile(args.profile)
+    files = list_images(args.image_dir)
+    if not files:
+        print(f"No images found in {args.image_dir}", file=sys.stderr)
+        return 1
+    fmt = args.format or ("json" if args.out.lower().endswith(".json") else "csv")
+    fieldset = area_geo.FieldSet.load(args.fields) if args.fields else None
+    cache = area_cache.ResultCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+
+    start = time.perf_counter()
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    rows = run_batch(files, profile, args.workers, memory_budget, fieldset, args.world_file, cache)
+    count = write_rows(rows, args.out, fmt, columns_for(profile))
+    elapsed = time.perf_counter() - start
+    rate = len(files) / elapsed if elapsed > 0 else float("inf")
+    print(f"{len(files)} images, {count} rows in {elapsed:.2f} s ({rate:.2f} images/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
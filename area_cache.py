@@ -0,0 +1,241 @@
+"""Persistent cache of analysis results and layer masks.
+
+Entries are keyed by a content hash of the image file plus the exact
+parameters they depend on (colors, sensitivities, strict levels, metrics,
+polygon and rings, manual patches) and live in one SQLite file. Several
+processes (GUI windows, batch workers) can share it: SQLite serializes the
+writers and a reader never sees a half-written entry. Lookups only read (WAL
+lets them run while another process writes); how recently an entry was used
+is updated at most every TOUCH_INTERVAL seconds and skipped while the file is
+busy. Once the entries exceed max_bytes the least recently used ones are
+evicted.
+
+    cache = area_cache.ResultCache()
+    digest = area_cache.file_digest("ortho.tif")
+    result = area_cache.analyze_field(rgba, params, cache, digest)
+
+A cache that cannot be opened or written behaves as an empty one, so the
+analysis never fails because of it.
+"""
+from dataclasses import asdict
+from os import path
+import hashlib, io, json, os, sqlite3, threading, time, zipfile
+import numpy as np
+import area_engine as engine
+
+# Bump when an engine change alters results, so older entries are never returned
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+_READ_CHUNK = 1 << 20
+READ_TIMEOUT = 1.0  # s; with WAL a reader only waits out a checkpoint
+WRITE_TIMEOUT = 30.0
+TOUCH_INTERVAL = 600  # s between updates of an entry's last use
+
+
+def default_path():
+    """results.sqlite in the user's cache directory."""
+    root = os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA") or path.join(path.expanduser("~"), ".cache")
+    return path.join(root, "area_calculator", "results.sqlite")
+
+
+# ---------- Keys ----------
+def file_digest(file_path):
+    """blake2b hex digest of a file's bytes."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FileDigest:
+    """file_digest computed once: on first use of value, or in the background after start()."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._value = None
+        self.lock = threading.Lock()
+
+    @property
+    def value(self):
+        with self.lock:
+            if self._value is None:
+                self._value = file_digest(self.file_path)
+            return self._value
+
+    def start(self):
+        """Compute the digest on a background thread."""
+        threading.Thread(target=lambda: self.value, daemon=True).start()
+        return self
+
+    def peek(self):
+        """The digest if it is known already, else None (never waits)."""
+        return self._value
+
+
+def layer_key(layer):
+    """The settings of an auto layer that decide its mask (None when it is off)."""
+    if not layer.active:
+        return None
+    return [list(layer.color), int(layer.sensitivity), layer.strict, layer.metric]
+
+
+def params_key(params):
+    """Everything in AnalysisParams that decides an analysis result (overlay colors do not)."""
+    return {
+        "classes": [[c.name, layer_key(c.layer)] for c in params.color_classes()],
+        "manual": [[*p.center, p.radius, p.sensitivity, p.strict] for p in params.manual_patches]
+        if params.manual_enabled else None,
+        "polygon": [list(v) for v in params.polygon],
+        "rings": [[list(v) for v in ring] for ring in params.rings],
+    }
+
+
+def entry_key(kind, digest, key):
+    blob = json.dumps([CACHE_VERSION, kind, digest, key], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def layer_entry_key(digest, layer):
+    return entry_key("layer", digest, layer_key(layer))
+
+
+# ---------- Store ----------
+class ResultCache:
+    """Size-bounded LRU store of byte payloads in a SQLite file.
+
+    Every call opens its own short-lived connection, so one instance can be
+    used from several threads and pickled to worker processes.
+    """
+
+    def __init__(self, file_path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.file_path = file_path or default_path()
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(path.dirname(path.abspath(self.file_path)), exist_ok=True)
+            db = sqlite3.connect(self.file_path, timeout=WRITE_TIMEOUT, isolation_level=None)
+            try:
+                # WAL (kept in the file) lets readers of other processes go on while one writes
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                           "key TEXT PRIMARY KEY, size INTEGER NOT NULL, used REAL NOT NULL, data BLOB NOT NULL)")
+                db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+            finally:
+                db.close()
+        except (OSError, sqlite3.Error):
+            self.file_path = None
+
+    def _read(self, fn):
+        """fn(connection) in one read transaction; None when the database is unusable."""
+        if self.file_path is None:
+            return None
+        try:
+            db = sqlite3.connect(self.file_path, timeout=READ_TIMEOUT, isolation_level=None)
+            try:
+                db.execute("BEGIN")  # deferred: takes no write lock
+                return fn(db)
+            finally:
+                db.close()
+        except sqlite3.Error:
+            return None
+
+    def _write(self, fn, timeout=WRITE_TIMEOUT):
+        """fn(connection) in one write transaction; None when the database is unusable or stays busy."""
+        if self.file_path is None:
+            return None
+        try:
+            db = sqlite3.connect(self.file_path, timeout=timeout, isolation_level=None)
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                out = fn(db)
+                db.execute("COMMIT")
+                return out
+            finally:
+                db.close()  # an uncommitted transaction is rolled back
+        except sqlite3.Error:
+            return None
+
+    def get(self, key):
+        """Payload stored under key, or None."""
+        row = self._read(lambda db: db.execute("SELECT data, used FROM entries WHERE key = ?", (key,)).fetchone())
+        if row is None:
+            return None
+        data, used = row
+        now = time.time()
+        if now - used > TOUCH_INTERVAL:
+            # Eviction only needs coarse recency: never wait for another writer for it
+            self._write(lambda db: db.execute("UPDATE entries SET used = ? WHERE key = ?", (now, key)), timeout=0)
+        return bytes(data)
+
+    def __contains__(self, key):
+        return bool(self._read(lambda db: db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()))
+
+    def put(self, key, data):
+        """Store a payload, then evict least recently used entries beyond max_bytes."""
+        if len(data) > self.max_bytes:
+            return
+
+        def write(db):
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, len(data), time.time(), data))
+            total = db.execute("SELECT SUM(size) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for old, size in db.execute("SELECT key, size FROM entries ORDER BY used").fetchall():
+                db.execute("DELETE FROM entries WHERE key = ?", (old,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        self._write(write)
+
+    def clear(self):
+        self._write(lambda db: db.execute("DELETE FROM entries"))
+
+
+# ---------- Results and masks ----------
+def load_result(cache, digest, params):
+    """The cached result, or None (also for an unreadable entry)."""
+    data = cache.get(entry_key("analysis", digest, params_key(params)))
+    if data is None:
+        return None
+    try:
+        return engine.AnalysisResult(**json.loads(data))
+    except (ValueError, TypeError):
+        return None
+
+
+def store_result(cache, digest, params, result):
+    cache.put(entry_key("analysis", digest, params_key(params)), json.dumps(asdict(result)).encode("utf-8"))
+
+
+def analyze_field(base_arr, params, cache, digest, distances=None, timer=engine.NO_TIMER):
+    """engine.analyze_field, answered from the cache when the same image and parameters were analyzed before."""
+    result = load_result(cache, digest, params)
+    timer.lap("cache_lookup")
+    if result is None:
+        result = engine.analyze_field(base_arr, params, distances, timer)
+        store_result(cache, digest, params, result)
+        timer.lap("cache_store")
+    return result
+
+
+def load_layer(cache, digest, layer):
+    """Full-resolution mask of an auto layer (engine.build_color_layer), or None (also for an unreadable entry)."""
+    data = cache.get(layer_entry_key(digest, layer))
+    if data is None:
+        return None
+    try:
+        with np.load(io.BytesIO(data)) as npz:
+            h, w = npz["shape"]
+            return np.unpackbits(npz["bits"], count=h * w).reshape(h, w).view(bool)
+    except (ValueError, KeyError, OSError, EOFError, zipfile.BadZipFile):
+        return None
+
+
+def store_layer(cache, digest, layer, mask):
+    """Store a layer mask bit-packed and compressed, unless it is already cached."""
+    key = layer_entry_key(digest, layer)
+    if key in cache:
+        return
+    buf = io.BytesIO()
+    np.savez_compressed(buf, shape=np.array(mask.shape), bits=np.packbits(mask, axis=None))
+    cache.put(key, buf.getvalue())
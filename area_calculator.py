@@ -1,1482 +1,1970 @@
-from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QPushButton, QLabel,
-    QHBoxLayout, QVBoxLayout, QSlider, QCheckBox, QFileDialog, QScrollArea,
-    QShortcut, QSizePolicy, QDialog, QDialogButtonBox
-)
-from PyQt5.QtCore import Qt, QTimer, QSettings, QEvent
-from PyQt5.QtGui import QPixmap, QKeySequence, QImage
-from os import path
-import sys, numpy as np, cv2
-
-class SoilErosionUI(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Area Calculator")
-        self.setGeometry(100, 100, 1280, 720)
-
-        # Variables
-        self.settings = QSettings("esemkej", "Area Calculator")
-        self.qimage = None
-        self.picked_color = None
-        self.tool_mode = None
-        self.debug = False
-        self.sensitivity = 100
-        self.anchors = []
-        self.temp_mouse_pos = None
-        self.first_plot_point = True
-        self.point_distance = 10  # Distance from which a click counts as an anchor click
-        self.hovered_anchor_index = None
-        self.strict_sensitivity = 5
-        self.polygon_closed = False
-        self.delay = 3000
-        self.transient_sensitivity = 100
-        self.transient_strict = 5
-        self.transient_color = None
-        self.non_resizable_labels = [] # Labels inside of the area calculation layout that don't answer to global font size changes unless manually updated
-        self.cache = {
-            "highlight_mask": None,
-            "highlight_overlay": None,
-            "manual_mask": None,
-            "manual_overlay": None,
-            "transient_mask": None,
-            "transient_overlay": None,
-            "line_overlay": None
-        }
-        self.dirty = {
-            "highlight": True,
-            "manual": True,
-            "transient": True,
-            "lines": True
-        }
-
-        # Repaint throttles
-        self.repaint_timer = QTimer(self)
-        self.repaint_timer.setSingleShot(True)
-        self.repaint_timer.timeout.connect(self.update_final_image)
-
-        # Live preview throttle for manual patch dialog
-        self.manual_preview_timer = QTimer(self)
-        self.manual_preview_timer.setSingleShot(True)
-        self.manual_preview_timer.timeout.connect(self.update_final_image)
-
-        # Persistent UI vars
-        self.line_width = int(self.settings.value("var/line_width", 2))
-        self.preview_line_width = int(self.settings.value("var/preview_line_width", 1))
-        self.anchor_radius = int(self.settings.value("var/anchor_radius", 4))
-        self.quick_settings = self.settings.value("ui/quick_settings", True, type=bool)
-
-        app = QApplication.instance()
-        self.text_size = int(self.settings.value("ui/text_size", app.font().pointSize() or 8))
-
-        # Manual patches
-        self.manual_patches = []
-        self.manual_pick_radius = 10
-        self.manual_preview = None
-
-        # Font size init
-        f = app.font()
-        f.setPointSize(self.text_size)
-        app.setFont(f)
-
-        # Info timer
-        self.timer = QTimer()
-        self.timer.setSingleShot(True)
-
-        # === CENTRAL WIDGET ===
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        main_layout = QVBoxLayout(central_widget)
-
-        # === TOP BAR ===
-        top_bar = QHBoxLayout()
-        self.load_button = QPushButton("Open Image")
-        self.toggle_checkbox = QCheckBox("Show Highlighted Layer")
-        self.sensitivity_slider = QSlider(Qt.Horizontal)
-        self.sensitivity_slider.setMinimum(0)
-        self.sensitivity_slider.setMaximum(255)
-        self.sensitivity_slider.setValue(self.sensitivity)
-        self.sensitivity_label = QLabel(f"Sensitivity: {self.sensitivity}")
-
-        top_bar.addWidget(self.load_button)
-        top_bar.addWidget(self.toggle_checkbox)
-        top_bar.addWidget(self.sensitivity_label)
-        top_bar.addWidget(self.sensitivity_slider)
-
-        # === MAIN BODY ===
-        body_layout = QHBoxLayout()
-
-        # Left tool panel
-        tool_panel = QVBoxLayout()
-        self.pick_color_button = QPushButton("Pick a color")
-        self.pick_transient_color_button = QPushButton("Pick transient color")
-        self.plot_line_button = QPushButton("Plot a line")
-        self.delete_line_button = QPushButton("Delete line")
-        self.manual_mode_button = QPushButton("Manual mode")
-        self.calculate_area_button = QPushButton("Calculate area")
-        self.settings_button = QPushButton("Settings")
-        self.pick_color_button.setCheckable(True)
-        self.pick_transient_color_button.setCheckable(True)
-        self.plot_line_button.setCheckable(True)
-        self.manual_mode_button.setCheckable(True)
-
-        # Color display
-        self.color_parent = QWidget()
-        self.color_parent.setLayout(QHBoxLayout())
-        self.color_parent.layout().setContentsMargins(0, 0, 0, 0)
-        self.color_layout_0 = QWidget()
-        self.color_layout_0.setStyleSheet("background-color: #000000;")
-        self.color_layout_0.setLayout(QHBoxLayout())
-        self.color_layout_0.layout().setContentsMargins(1, 1, 1, 1)
-        self.color_layout_1 = QWidget()
-        self.color_layout_1.setStyleSheet("background-color: #ffffff;")
-        self.color_layout_1.setLayout(QHBoxLayout())
-        self.color_layout_1.layout().setContentsMargins(1, 1, 1, 1)
-        self.color_container = QWidget()
-        self.color_container.setFixedSize(int(self.text_size * 2), int(self.text_size * 2))
-        self.color_layout_1.layout().addWidget(self.color_container)
-        self.color_layout_0.layout().addWidget(self.color_layout_1)
-        self.color_parent.layout().addWidget(self.color_layout_0, alignment=Qt.AlignHCenter)
-        self.color_label = QLabel()
-
-        self.strict_checkbox = QCheckBox("Strict mode")
-        self.strict_slider = QSlider(Qt.Horizontal)
-        self.strict_slider.setMinimum(0)
-        self.strict_slider.setMaximum(10)
-        self.strict_slider.setValue(self.strict_sensitivity)
-        self.strict_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-        self.strict_label = QLabel(f"Sensitivity: {self.strict_sensitivity}")
-
-        # Transient
-        self.line_checkbox = QCheckBox("Line")
-        self.manual_checkbox = QCheckBox("Manual layer")
-        self.transient_checkbox = QCheckBox("Transient layer")
-
-        # Transient color display
-        self.transient_color_parent = QWidget()
-        self.transient_color_parent.setLayout(QHBoxLayout())
-        self.transient_color_parent.layout().setContentsMargins(0, 0, 0, 0)
-        self.transient_color_layout_0 = QWidget()
-        self.transient_color_layout_0.setStyleSheet("background-color: #000000;")
-        self.transient_color_layout_0.setLayout(QHBoxLayout())
-        self.transient_color_layout_0.layout().setContentsMargins(1, 1, 1, 1)
-        self.transient_color_layout_1 = QWidget()
-        self.transient_color_layout_1.setStyleSheet("background-color: #ffffff;")
-        self.transient_color_layout_1.setLayout(QHBoxLayout())
-        self.transient_color_layout_1.layout().setContentsMargins(1, 1, 1, 1)
-        self.transient_color_container = QWidget()
-        self.transient_color_container.setFixedSize(int(self.text_size * 2), int(self.text_size * 2))
-        self.transient_color_layout_1.layout().addWidget(self.transient_color_container)
-        self.transient_color_layout_0.layout().addWidget(self.transient_color_layout_1)
-        self.transient_color_parent.layout().addWidget(self.transient_color_layout_0, alignment=Qt.AlignHCenter)
-        self.transient_color_label = QLabel()
-
-        # Transient controls
-        self.transient_label = QLabel(f"Sensitivity: {self.transient_sensitivity}")
-        self.transient_slider = QSlider(Qt.Horizontal)
-        self.transient_slider.setMinimum(1)
-        self.transient_slider.setMaximum(255)
-        self.transient_slider.setValue(self.transient_sensitivity)
-        self.transient_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-        self.transient_strict_label = QLabel(f"Strict sensitivity: {self.transient_strict}")
-        self.transient_strict_slider = QSlider(Qt.Horizontal)
-        self.transient_strict_slider.setMinimum(0)
-        self.transient_strict_slider.setMaximum(10)
-        self.transient_strict_slider.setValue(self.transient_strict)
-        self.transient_strict_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-        self.compare_checkbox = QCheckBox("Comparison image")
-
-        self.line_width_label = QLabel(f"Line width: {self.line_width}")
-        self.line_width_slider = QSlider(Qt.Horizontal)
-        self.line_width_slider.setMinimum(1)
-        self.line_width_slider.setMaximum(10)
-        self.line_width_slider.setValue(self.line_width)
-        self.line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        self.preview_line_width_label = QLabel(f"Preview line width: {self.preview_line_width}")
-        self.preview_line_width_slider = QSlider(Qt.Horizontal)
-        self.preview_line_width_slider.setMinimum(1)
-        self.preview_line_width_slider.setMaximum(10)
-        self.preview_line_width_slider.setValue(self.preview_line_width)
-        self.preview_line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        self.anchor_radius_label = QLabel(f"Anchor radius: {self.anchor_radius}")
-        self.anchor_radius_slider = QSlider(Qt.Horizontal)
-        self.anchor_radius_slider.setMinimum(1)
-        self.anchor_radius_slider.setMaximum(20)
-        self.anchor_radius_slider.setValue(self.anchor_radius)
-        self.anchor_radius_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        self.text_size_label = QLabel(f"Text size: {self.text_size}")
-        self.text_size_slider = QSlider(Qt.Horizontal)
-        self.text_size_slider.setMinimum(6)
-        self.text_size_slider.setMaximum(24)
-        self.text_size_slider.setValue(self.text_size)
-        self.text_size_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        # Area panel
-        self.area_main_layout = QWidget()
-        self.area_main_layout.setSizePolicy(QSizePolicy.Maximum, QSizePolicy.Preferred)
-        self.area_main_layout.setStyleSheet("background:#000000;")
-        self.area_main_layout.setLayout(QHBoxLayout())
-        self.area_main_layout.layout().setContentsMargins(0, 0, 0, 0)
-        self.area_main_layout.layout().setSpacing(0)
-
-        # left_texts_layout (column)
-        left_texts_layout = QVBoxLayout()
-        left_texts_layout.setContentsMargins(0, 0, 0, 0)
-        left_texts_layout.setSpacing(0)
-        self.area_main_layout.layout().addLayout(left_texts_layout, 1)
-
-        # --- left_highlight_layout ---
-        left_highlight_wrapper = QWidget()
-        left_highlight_wrapper.setLayout(QHBoxLayout())
-        left_highlight_wrapper.layout().setContentsMargins(2, 2, 1, 1)  # margins outside white cell
-        left_highlight_wrapper.layout().setSpacing(0)
-
-        left_highlight_layout = QWidget()
-        left_highlight_layout.setStyleSheet("background:#FFFFFF;")
-        left_highlight_layout.setLayout(QHBoxLayout())
-        left_highlight_layout.layout().setContentsMargins(8, 8, 8, 8)   # padding
-        left_highlight_layout.layout().setSpacing(0)
-
-        highlight_label = QLabel("Highlight area:")
-        left_highlight_layout.layout().addWidget(highlight_label)
-        self.non_resizable_labels.append(highlight_label)
-
-        left_highlight_wrapper.layout().addWidget(left_highlight_layout)
-        left_texts_layout.addWidget(left_highlight_wrapper)
-
-        # --- left_manual_layout ---
-        left_manual_wrapper = QWidget()
-        left_manual_wrapper.setLayout(QHBoxLayout())
-        left_manual_wrapper.layout().setContentsMargins(2, 1, 1, 1)
-        left_manual_wrapper.layout().setSpacing(0)
-
-        left_manual_layout = QWidget()
-        left_manual_layout.setStyleSheet("background:#FFFFFF;")
-        left_manual_layout.setLayout(QHBoxLayout())
-        left_manual_layout.layout().setContentsMargins(8, 8, 8, 8)
-        left_manual_layout.layout().setSpacing(0)
-
-        manual_label = QLabel("Manual area:")
-        left_manual_layout.layout().addWidget(manual_label)
-        self.non_resizable_labels.append(manual_label)
-
-        left_manual_wrapper.layout().addWidget(left_manual_layout)
-        left_texts_layout.addWidget(left_manual_wrapper)
-
-        # --- left_transcient_layout ---
-        left_transcient_wrapper = QWidget()
-        left_transcient_wrapper.setLayout(QHBoxLayout())
-        left_transcient_wrapper.layout().setContentsMargins(2, 1, 1, 1)
-        left_transcient_wrapper.layout().setSpacing(0)
-
-        left_transcient_layout = QWidget()
-        left_transcient_layout.setStyleSheet("background:#FFFFFF;")
-        left_transcient_layout.setLayout(QHBoxLayout())
-        left_transcient_layout.layout().setContentsMargins(8, 8, 8, 8)
-        left_transcient_layout.layout().setSpacing(0)
-
-        transcient_label = QLabel("Transcient area:")
-        left_transcient_layout.layout().addWidget(transcient_label)
-        self.non_resizable_labels.append(transcient_label)
-
-        left_transcient_wrapper.layout().addWidget(left_transcient_layout)
-        left_texts_layout.addWidget(left_transcient_wrapper)
-
-        # --- left_combined_layout ---
-        left_combined_wrapper = QWidget()
-        left_combined_wrapper.setLayout(QHBoxLayout())
-        left_combined_wrapper.layout().setContentsMargins(2, 1, 1, 2)
-        left_combined_wrapper.layout().setSpacing(0)
-
-        left_combined_layout = QWidget()
-        left_combined_layout.setStyleSheet("background:#FFFFFF;")
-        left_combined_layout.setLayout(QHBoxLayout())
-        left_combined_layout.layout().setContentsMargins(8, 8, 8, 8)
-        left_combined_layout.layout().setSpacing(0)
-
-        combined_area_label = QLabel("Combined area:")
-        left_combined_layout.layout().addWidget(combined_area_label)
-        self.non_resizable_labels.append(combined_area_label)
-
-        left_combined_wrapper.layout().addWidget(left_combined_layout)
-        left_texts_layout.addWidget(left_combined_wrapper)
-
-        # right_texts_layout (column)
-        right_texts_layout = QVBoxLayout()
-        right_texts_layout.setContentsMargins(0, 0, 0, 0)
-        right_texts_layout.setSpacing(0)
-        self.area_main_layout.layout().addLayout(right_texts_layout, 1)
-
-        # --- right_highlight_layout ---
-        right_highlight_wrapper = QWidget()
-        right_highlight_wrapper.setLayout(QHBoxLayout())
-        right_highlight_wrapper.layout().setContentsMargins(1, 2, 2, 1)
-        right_highlight_wrapper.layout().setSpacing(0)
-
-        right_highlight_layout = QWidget()
-        right_highlight_layout.setStyleSheet("background:#FFFFFF;")
-        right_highlight_layout.setLayout(QHBoxLayout())
-        right_highlight_layout.layout().setContentsMargins(8, 8, 8, 8)
-        right_highlight_layout.layout().setSpacing(0)
-
-        self.highlight_perc = QLabel("None")
-        right_highlight_layout.layout().addWidget(self.highlight_perc)
-        self.non_resizable_labels.append(self.highlight_perc)
-
-        right_highlight_wrapper.layout().addWidget(right_highlight_layout)
-        right_texts_layout.addWidget(right_highlight_wrapper)
-
-        # --- right_manual_layout ---
-        right_manual_wrapper = QWidget()
-        right_manual_wrapper.setLayout(QHBoxLayout())
-        right_manual_wrapper.layout().setContentsMargins(1, 1, 2, 1)
-        right_manual_wrapper.layout().setSpacing(0)
-
-        right_manual_layout = QWidget()
-        right_manual_layout.setStyleSheet("background:#FFFFFF;")
-        right_manual_layout.setLayout(QHBoxLayout())
-        right_manual_layout.layout().setContentsMargins(8, 8, 8, 8)
-        right_manual_layout.layout().setSpacing(0)
-
-        self.manual_perc = QLabel("None")
-        right_manual_layout.layout().addWidget(self.manual_perc)
-        self.non_resizable_labels.append(self.manual_perc)
-
-        right_manual_wrapper.layout().addWidget(right_manual_layout)
-        right_texts_layout.addWidget(right_manual_wrapper)
-
-        # --- right_transcient_layout ---
-        right_transcient_wrapper = QWidget()
-        right_transcient_wrapper.setLayout(QHBoxLayout())
-        right_transcient_wrapper.layout().setContentsMargins(1, 1, 2, 1)
-        right_transcient_wrapper.layout().setSpacing(0)
-
-        right_transcient_layout = QWidget()
-        right_transcient_layout.setStyleSheet("background:#FFFFFF;")
-        right_transcient_layout.setLayout(QHBoxLayout())
-        right_transcient_layout.layout().setContentsMargins(8, 8, 8, 8)
-        right_transcient_layout.layout().setSpacing(0)
-
-        self.transcient_perc = QLabel("None")
-        right_transcient_layout.layout().addWidget(self.transcient_perc)
-        self.non_resizable_labels.append(self.transcient_perc)
-
-        right_transcient_wrapper.layout().addWidget(right_transcient_layout)
-        right_texts_layout.addWidget(right_transcient_wrapper)
-
-        # --- right_combined_layout ---
-        right_combined_wrapper = QWidget()
-        right_combined_wrapper.setLayout(QHBoxLayout())
-        right_combined_wrapper.layout().setContentsMargins(1, 1, 2, 2)
-        right_combined_wrapper.layout().setSpacing(0)
-
-        right_combined_layout = QWidget()
-        right_combined_layout.setStyleSheet("background:#FFFFFF;")
-        right_combined_layout.setLayout(QHBoxLayout())
-        right_combined_layout.layout().setContentsMargins(8, 8, 8, 8)
-        right_combined_layout.layout().setSpacing(0)
-
-        self.combined_perc = QLabel("None")
-        right_combined_layout.layout().addWidget(self.combined_perc)
-        self.non_resizable_labels.append(self.combined_perc)
-
-        right_combined_wrapper.layout().addWidget(right_combined_layout)
-        right_texts_layout.addWidget(right_combined_wrapper)
-
-        tool_panel.addWidget(self.pick_color_button)
-        tool_panel.addWidget(self.color_parent)
-        tool_panel.addWidget(self.color_label)
-        tool_panel.addWidget(self.pick_transient_color_button)
-        tool_panel.addWidget(self.plot_line_button)
-        tool_panel.addWidget(self.delete_line_button)
-        tool_panel.addWidget(self.manual_mode_button)
-        tool_panel.addWidget(self.calculate_area_button)
-        tool_panel.addWidget(self.settings_button)
-        tool_panel.addWidget(self.strict_checkbox)
-        tool_panel.addWidget(self.strict_label)
-        tool_panel.addWidget(self.strict_slider)
-        tool_panel.addWidget(self.line_checkbox)
-        tool_panel.addWidget(self.manual_checkbox)
-        tool_panel.addWidget(self.transient_checkbox)
-        tool_panel.addWidget(self.transient_color_parent)
-        tool_panel.addWidget(self.transient_color_label)
-        tool_panel.addWidget(self.transient_label)
-        tool_panel.addWidget(self.transient_slider)
-        tool_panel.addWidget(self.transient_strict_label)
-        tool_panel.addWidget(self.transient_strict_slider)
-        tool_panel.addWidget(self.compare_checkbox)
-        tool_panel.addWidget(self.line_width_label)
-        tool_panel.addWidget(self.line_width_slider)
-        tool_panel.addWidget(self.preview_line_width_label)
-        tool_panel.addWidget(self.preview_line_width_slider)
-        tool_panel.addWidget(self.anchor_radius_label)
-        tool_panel.addWidget(self.anchor_radius_slider)
-        tool_panel.addWidget(self.text_size_label)
-        tool_panel.addWidget(self.text_size_slider)
-        tool_panel.addWidget(self.area_main_layout)
-
-        self.color_parent.hide()
-        self.color_label.hide()
-        self.delete_line_button.hide()
-        self.strict_label.hide()
-        self.strict_slider.hide()
-        self.transient_color_parent.hide()
-        self.transient_color_label.hide()
-        self.transient_label.hide()
-        self.transient_slider.hide()
-        self.transient_strict_label.hide()
-        self.transient_strict_slider.hide()
-        self.line_checkbox.hide()
-        if not self.quick_settings:
-            self.line_width_label.hide()
-            self.line_width_slider.hide()
-            self.preview_line_width_label.hide()
-            self.preview_line_width_slider.hide()
-            self.anchor_radius_label.hide()
-            self.anchor_radius_slider.hide()
-            self.text_size_label.hide()
-            self.text_size_slider.hide()
-        tool_panel.addStretch()
-
-        tool_widget = QWidget()
-        tool_widget.setLayout(tool_panel)
-
-        # Image display
-        self.image_label = ClickableLabel("Image will appear here")
-        self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
-        self.image_label.setAlignment(Qt.AlignCenter)
-        self.image_label.mouse_moved_callback = self.mouse_moved
-        self.compare_image_label = QLabel("Comparison image will appear here")
-        self.compare_image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
-        self.compare_image_label.setAlignment(Qt.AlignCenter)
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.scroll_area.setWidget(self.image_label)
-        self.compare_scroll_area = QScrollArea()
-        self.compare_scroll_area.setWidgetResizable(True)
-        self.compare_scroll_area.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.compare_scroll_area.setWidget(self.compare_image_label)
-
-        # Info display
-        info_layout = QVBoxLayout()
-        info_layout.setContentsMargins(0, 0, 0, 0)
-        self.info_label = QLabel()
-        info_layout.addWidget(self.info_label, alignment=Qt.AlignHCenter)
-
-        right_scroll_layout = QHBoxLayout()
-        right_scroll_layout.setContentsMargins(0, 0, 0, 0)
-        right_scroll_layout.addWidget(self.scroll_area, 1)
-        right_scroll_layout.addWidget(self.compare_scroll_area, 1)
-
-        right_body_layout = QVBoxLayout()
-        right_body_layout.setContentsMargins(0, 0, 0, 0)
-        right_body_layout.addLayout(right_scroll_layout)
-        right_body_layout.addLayout(info_layout)
-
-        body_layout.addWidget(tool_widget)
-        body_layout.addLayout(right_body_layout)
-        self.compare_scroll_area.hide()
-
-        # === Assemble Layouts ===
-        main_layout.addLayout(top_bar)
-        main_layout.addLayout(body_layout)
-
-        # Binds
-        self.load_button.clicked.connect(self.load_image)
-        self.toggle_checkbox.stateChanged.connect(self.toggle_highlight_layer)
-        self.sensitivity_slider.valueChanged.connect(self.update_sensitivity)
-        self.pick_color_button.toggled.connect(self.pick_color)
-        self.pick_transient_color_button.toggled.connect(self.pick_transient_color)
-        self.plot_line_button.toggled.connect(self.plot_line)
-        self.delete_line_button.clicked.connect(self.delete_line)
-        self.manual_mode_button.toggled.connect(self.manual_mode)
-        self.calculate_area_button.clicked.connect(self.analyze_field)
-        self.settings_button.clicked.connect(self.open_settings_dialog)
-        self.strict_checkbox.stateChanged.connect(self.strict_mode)
-        self.strict_slider.valueChanged.connect(self.update_strict)
-        self.line_checkbox.stateChanged.connect(self.toggle_line_layer)
-        self.manual_checkbox.stateChanged.connect(self.toggle_manual_layer)
-        self.transient_checkbox.stateChanged.connect(self.toggle_transient)
-        self.transient_slider.valueChanged.connect(self.update_transient_sensitivity)
-        self.transient_strict_slider.valueChanged.connect(self.update_transient_strict)
-        self.compare_checkbox.stateChanged.connect(self.compare_image)
-        self.line_width_slider.valueChanged.connect(self.update_line_width)
-        self.preview_line_width_slider.valueChanged.connect(self.update_preview_line_width)
-        self.anchor_radius_slider.valueChanged.connect(self.update_anchor_radius)
-        self.text_size_slider.sliderReleased.connect(self.update_global_font)
-        self.text_size_slider.valueChanged.connect(self.update_text_size_label)
-        self.timer.timeout.connect(self.remove_hint)
-
-        shortcut_open = QShortcut(QKeySequence("Ctrl+O"), self)
-        shortcut_open.activated.connect(self.load_image)
-
-    # ---------- Logic ----------
-    def request_repaint(self):
-        if not self.repaint_timer.isActive():
-            self.repaint_timer.start(16)
-
-    def load_image(self):
-        if self.debug:
-            file_path = path.join(path.dirname(__file__), "debug_image.png")
-            if not path.exists(file_path):
-                self.path_label.setText("[DEBUG] debug_image.png not found")
-                return
-        else:
-            file_path, _ = QFileDialog.getOpenFileName(
-                self, "Select Image", "", "Image Files (*.png *.jpg *.jpeg *.bmp)"
-            )
-        if file_path:
-            self.pixmap = QPixmap(file_path)
-            self.qimage = self.pixmap.toImage()
-            self.base_rgba = self.qimage_to_array(self.qimage)
-            self.invalidate_all()
-            vw = self.scroll_area.viewport().width()
-            vh = self.scroll_area.viewport().height()
-            self.image_label.setPixmap(
-                self.pixmap.scaled(vw, vh, Qt.KeepAspectRatio, Qt.FastTransformation)
-            )
-            self.compare_image_label.setPixmap(
-                self.pixmap.scaled(vw, vh, Qt.KeepAspectRatio, Qt.FastTransformation)
-            )
-            self.hint(f"Loaded: {file_path}", True)
-            self.request_repaint()
-
-    def update_sensitivity(self, value):
-        self.sensitivity = value
-        self.sensitivity_label.setText(f"Sensitivity: {value}")
-        self.invalidate("highlight")
-        if self.toggle_checkbox.isChecked():
-            self.request_repaint()
-
-    def qimage_to_array(self, qimage):
-        qimg = qimage.convertToFormat(QImage.Format_RGBA8888)
-        w, h = qimg.width(), qimg.height()
-        ptr = qimg.bits()
-        ptr.setsize(qimg.byteCount())
-        arr = np.array(ptr, dtype=np.uint8).reshape((h, w, 4))
-        return arr  # RGBA
-
-    def get_color_mask(self, image_arr, target_color, tolerance):
-        if image_arr.shape[2] == 4:
-            image_arr = image_arr[:, :, :3]  # drop alpha
-        r, g, b = target_color
-        diff = np.abs(image_arr - np.array([r, g, b]))
-        distance = np.sum(diff, axis=2)
-        return distance <= tolerance
-
-    def create_highlight_overlay(self, mask, highlight_color=(204, 199, 34)):
-        h, w = mask.shape
-        overlay = np.zeros((h, w, 4), dtype=np.uint8)
-        overlay[mask] = [*highlight_color, 150]
-        return overlay
-
-    def merge_overlay_with_image(self, base_rgba, overlay_rgba):
-        if base_rgba.shape[2] == 3:  # just in case
-            base_rgba = np.dstack((base_rgba, np.full(base_rgba.shape[:2], 255, dtype=np.uint8)))
-        zeroa = overlay_rgba[:, :, 3] == 0
-        overlay_rgba[zeroa] = [0, 0, 0, 0]
-        base = base_rgba.astype(np.float32)
-        over = overlay_rgba.astype(np.float32)
-        a = (over[:, :, 3:4] / 255.0)
-        out = base * (1.0 - a) + over * a
-        return out.astype(np.uint8)
-
-    def arr_to_qpixmap(self, arr):
-        h, w, _ = arr.shape
-        image = QImage(arr.data, w, h, QImage.Format_RGBA8888)
-        return QPixmap.fromImage(image.copy())
-
-    def map_click_to_image_coords(self, pos):
-        label_w, label_h = self.image_label.width(), self.image_label.height()
-        img_w, img_h = self.qimage.width(), self.qimage.height()
-        scale = min(label_w / img_w, label_h / img_h)
-        disp_w, disp_h = img_w * scale, img_h * scale
-        offset_x = (label_w - disp_w) / 2
-        offset_y = (label_h - disp_h) / 2
-        x = int((pos.x() - offset_x) / scale)
-        y = int((pos.y() - offset_y) / scale)
-        if 0 <= x < img_w and 0 <= y < img_h:
-            return x, y
-        return None
-
-    def update_final_image(self):
-        if not self.qimage:
-            return
-
-        base_arr = getattr(self, "base_rgba", self.qimage_to_array(self.qimage))
-        h, w = base_arr.shape[:2]
-
-        # --- HIGHLIGHT ---
-        if self.dirty["highlight"]:
-            hm, hov = self.build_highlight(base_arr)
-            self.cache["highlight_mask"] = hm
-            self.cache["highlight_overlay"] = hov
-            self.dirty["highlight"] = False
-            # downstream dependencies
-            self.dirty["transient"] = True
-            self.dirty["manual"] = True
-
-        # --- TRANSIENT (exclude highlight) ---
-        if self.dirty["transient"]:
-            tm, tov = self.build_transient(base_arr, forbid_mask=self.cache["highlight_mask"])
-            self.cache["transient_mask"] = tm
-            self.cache["transient_overlay"] = tov
-            self.dirty["transient"] = False
-            # manual depends on highlight+transient
-            self.dirty["manual"] = True
-
-        # --- MANUAL (exclude highlight | transient) ---
-        if self.dirty["manual"]:
-            # build a combined forbid mask (higher-priority union)
-            forbid = None
-            if self.cache["highlight_mask"] is not None:
-                forbid = self.cache["highlight_mask"].copy()
-            if self.cache["transient_mask"] is not None:
-                forbid = self.cache["transient_mask"] if forbid is None else np.logical_or(forbid, self.cache["transient_mask"])
-
-            mm, mov = self.build_manual(base_arr, forbid_mask=forbid)
-            self.cache["manual_mask"] = mm
-            self.cache["manual_overlay"] = mov
-            self.dirty["manual"] = False
-
-        # --- LINES ---
-        if self.dirty["lines"]:
-            lov = self.build_lines((h, w))
-            self.cache["line_overlay"] = lov
-            self.dirty["lines"] = False
-
-        # --- COMBINE OVERLAYS ---
-        combined_overlay = np.zeros((h, w, 4), dtype=np.uint8)
-
-        def _blend_on_top(dst, src):
-            mask = src[:, :, 3] > 0
-            if not mask.any():
-                return dst
-            dst_alpha = dst[mask, 3]
-            src_alpha = src[mask, 3]
-            dst[mask, 3] = np.maximum(dst_alpha, src_alpha)
-            a = (src_alpha.astype(np.float32) / 255.0)[:, None]
-            dst[mask, :3] = (dst[mask, :3].astype(np.float32) * (1.0 - a) +
-                            src[mask, :3].astype(np.float32) * a).astype(np.uint8)
-            return dst
-
-        combined_overlay = _blend_on_top(combined_overlay, self.cache["highlight_overlay"])
-        combined_overlay = _blend_on_top(combined_overlay, self.cache["transient_overlay"])
-        combined_overlay = _blend_on_top(combined_overlay, self.cache["manual_overlay"])
-        combined_overlay = _blend_on_top(combined_overlay, self.cache["line_overlay"])
-
-        # --- COMPOSITE OVER BASE ---
-        final = self.merge_overlay_with_image(base_arr, combined_overlay)
-        pixmap = self.arr_to_qpixmap(final)
-        vw = self.scroll_area.viewport().width()
-        vh = self.scroll_area.viewport().height()
-        self.image_label.setPixmap(
-            pixmap.scaled(vw, vh, Qt.KeepAspectRatio, Qt.FastTransformation)
-        )
-        if self.compare_checkbox.isChecked():
-            self.compare_image_label.setPixmap(
-                self.pixmap.scaled(vw, vh, Qt.KeepAspectRatio, Qt.FastTransformation)
-            )
-
-    def pick_color(self, checked):
-        if checked:
-            self.tool_mode = "color"
-            self.plot_line_button.setChecked(False)
-            self.manual_mode_button.setChecked(False)
-            self.hint("Click on a color you want to highlight", True)
-        elif not checked and not self.plot_line_button.isChecked() and not self.manual_mode_button.isChecked():
-            self.tool_mode = None
-
-    def plot_line(self, checked):
-        if checked:
-            self.tool_mode = "plot"
-            self.pick_color_button.setChecked(False)
-            self.manual_mode_button.setChecked(False)
-            self.hint("Click anywhere to start plotting a line", True)
-        elif not checked and not self.pick_color_button.isChecked() and not self.manual_mode_button.isChecked():
-            self.tool_mode = None
-            if not self.polygon_closed:
-                self.delete_line()
-
-    def delete_line(self):
-        if self.anchors:
-            self.anchors = []
-            self.temp_mouse_pos = None
-            self.hovered_anchor_index = None
-            self.polygon_closed = False
-            self.first_plot_point = True
-            self.line_checkbox.hide()
-            self.delete_line_button.hide()
-            self.plot_line_button.setChecked(False)
-            self.invalidate("lines")
-            self.request_repaint()
-            if self.polygon_closed:
-                self.hint("Line deleted", True)
-            else:
-                self.hint("Line deleted - polygon not closed", True)
-        else:
-            self.hint("No line drawn", True)
-
-    def create_field_mask(self, shape):
-        mask = np.zeros((shape[0], shape[1]), dtype=np.uint8)
-        if len(self.anchors) >= 3:
-            pts = np.array([self.anchors], dtype=np.int32)
-            cv2.fillPoly(mask, pts, 255)
-        return mask
-
-    def apply_field_mask(self, base_arr, field_mask):
-        if base_arr.shape[2] == 4:
-            base_rgba = base_arr.copy()
-        else:
-            base_rgba = np.dstack((base_arr, np.full(base_arr.shape[:2], 255, dtype=np.uint8)))
-        base_rgba[field_mask == 0] = [0, 0, 0, 0]
-        return base_rgba
-
-    def crop_to_field(self, img_with_alpha, field_mask):
-        coords = cv2.findNonZero(field_mask)
-        x, y, w, h = cv2.boundingRect(coords)
-        return img_with_alpha[y:y+h, x:x+w], field_mask[y:y+h, x:x+w]
-
-    def calculate_pixel_percentage(self, cropped_img, highlight_mask):
-        field_pixels = np.count_nonzero(cropped_img[:, :, 3])
-        colored_pixels = np.count_nonzero(highlight_mask[:, :, 3])
-        percent = (colored_pixels / field_pixels) * 100 if field_pixels else 0
-        return percent
-
-    def analyze_field(self):
-        # must have an image and a closed polygon
-        if not self.qimage or len(self.anchors) < 3 or not self.polygon_closed:
-            self.hint("Image not loaded or polygon not defined/closed", True)
-            return
-
-        base_arr = self.base_rgba
-
-        # --- build field mask and crop to its bbox ---
-        field_mask_u8 = self.create_field_mask(base_arr.shape[:2])  # 0/255
-        coords = cv2.findNonZero(field_mask_u8)
-        if coords is None:
-            self.hint("Polygon mask is empty", True)
-            return
-
-        x, y, w, h = cv2.boundingRect(coords)
-        field_roi = field_mask_u8[y:y+h, x:x+w] > 0
-
-        # Field-only image (for denominator via alpha>0 in percentage)
-        field_only_rgba = self.apply_field_mask(base_arr, field_mask_u8)
-        cropped_img = field_only_rgba[y:y+h, x:x+w]
-
-        # ---------- HIGHLIGHT (raw) ----------
-        highlight_full = None
-        if self.toggle_checkbox.isChecked() and self.picked_color is not None:
-            highlight_full = self.get_color_mask(base_arr[:, :, :3], self.picked_color, int(self.sensitivity))
-            if self.strict_checkbox.isChecked():
-                highlight_full = self.apply_strict_filter(highlight_full, int(self.strict_sensitivity))
-            high_cropped = highlight_full[y:y+h, x:x+w] & field_roi
-            p_high = self.calculate_pixel_percentage(cropped_img, self.create_highlight_overlay(high_cropped))
-            self.highlight_perc.setText(f"{p_high:.2f}%")
-        else:
-            high_cropped = np.zeros((h, w), dtype=bool)
-            self.highlight_perc.setText("None")
-
-        # ---------- TRANSIENT (raw -> disjoint by removing highlight) ----------
-        trans_full = None
-        if self.transient_checkbox.isChecked() and (self.transient_color is not None):
-            trans_full = self.get_color_mask(base_arr[:, :, :3], self.transient_color, int(self.transient_sensitivity))
-            if int(self.transient_strict) > 0:
-                trans_full = self.apply_strict_filter(trans_full, int(self.transient_strict))
-            if highlight_full is not None:
-                trans_full = trans_full & (~highlight_full)  # disjoint from highlight
-            trans_cropped = trans_full[y:y+h, x:x+w] & field_roi
-            p_trans = self.calculate_pixel_percentage(cropped_img, self.create_highlight_overlay(trans_cropped, highlight_color=(186, 113, 0)))
-            self.transcient_perc.setText(f"{p_trans:.2f}%")
-        else:
-            trans_cropped = np.zeros((h, w), dtype=bool)
-            self.transcient_perc.setText("None")
-
-        # ---------- MANUAL (raw -> disjoint by removing highlight|transient) ----------
-        man_cropped = np.zeros((h, w), dtype=bool)
-        if self.manual_checkbox.isChecked():
-            manual_full = self.recompute_manual_mask()
-            forbid = None
-            if highlight_full is not None:
-                forbid = highlight_full.copy()
-            if trans_full is not None:
-                forbid = trans_full if forbid is None else np.logical_or(forbid, trans_full)
-            if forbid is not None:
-                manual_full = manual_full & (~forbid)  # disjoint from higher-priority classes
-            man_cropped = manual_full[y:y+h, x:x+w] & field_roi
-            p_manual = self.calculate_pixel_percentage(cropped_img, self.create_highlight_overlay(man_cropped, highlight_color=(0, 0, 255)))
-            self.manual_perc.setText(f"{p_manual:.2f}%")
-        else:
-            self.manual_perc.setText("None")
-
-        # ---------- COMBINED (union of disjoint classes) ----------
-        combined_cropped = high_cropped | trans_cropped | man_cropped
-        p_combined = self.calculate_pixel_percentage(cropped_img, self.create_highlight_overlay(combined_cropped))
-        self.combined_perc.setText(f"{p_combined:.2f}%")
-
-    def strict_mode(self, checked):
-        if checked:
-            self.strict_slider.show()
-            self.strict_label.show()
-        else:
-            self.strict_slider.hide()
-            self.strict_label.hide()
-        self.invalidate("highlight")
-        self.request_repaint()
-
-    def update_strict(self, value):
-        self.strict_sensitivity = value
-        if value == 0:
-            self.strict_label.setText("Sensitivity: Off")
-        else:
-            self.strict_label.setText(f"Sensitivity: {value}")
-        self.invalidate("highlight")
-        if self.strict_checkbox.isChecked():
-            self.request_repaint()
-
-    def apply_strict_filter(self, mask: np.ndarray, level: int) -> np.ndarray:
-        m = (mask.astype(np.uint8) > 0).astype(np.uint8)
-        k = max(1, int(2 * level + 1))
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
-        opened = cv2.morphologyEx(m, cv2.MORPH_OPEN, kernel)
-        min_frac = 0.001 + 0.004 * ((level - 1) / 9.0)
-        min_size = int(opened.size * min_frac)
-        num, labels, stats, _ = cv2.connectedComponentsWithStats(opened, connectivity=8)
-        keep = np.zeros_like(opened, dtype=np.uint8)
-        for i in range(1, num):
-            if stats[i, cv2.CC_STAT_AREA] >= min_size:
-                keep[labels == i] = 1
-        return keep.astype(bool)
-
-    def manual_mode(self, checked):
-        if checked:
-            self.tool_mode = "manual"
-            self.pick_color_button.setChecked(False)
-            self.plot_line_button.setChecked(False)
-            self.manual_checkbox.setChecked(True)
-            self.hint("Click on specific patches to add them manually", False)
-        elif not checked and not self.pick_color_button.isChecked() and not self.plot_line_button.isChecked():
-            self.tool_mode = None
-            self.remove_hint()
-            if not self.manual_patches:
-                self.manual_checkbox.setChecked(False)
-
-    def update_line_width(self, value):
-        print("update")
-        self.line_width = value
-        self.line_width_label.setText(f"Line width: {value}")
-        self.settings.setValue("var/line_width", value)
-        if (self.plot_line_button.isChecked() or self.anchors):
-            self.invalidate("lines")
-            self.request_repaint()
-
-    def update_preview_line_width(self, value):
-        self.preview_line_width = value
-        self.preview_line_width_label.setText(f"Preview line width: {value}")
-        self.settings.setValue("var/preview_line_width", value)
-        if (self.plot_line_button.isChecked() or self.anchors):
-            self.invalidate("lines")
-            self.request_repaint()
-
-    def update_anchor_radius(self, value):
-        self.anchor_radius = value
-        self.anchor_radius_label.setText(f"Anchor radius: {value}")
-        self.settings.setValue("var/anchor_radius", value)
-        if (self.plot_line_button.isChecked() or self.anchors):
-            self.invalidate("lines")
-            self.request_repaint()
-
-    def update_global_font(self):
-        app = QApplication.instance()
-        f = app.font()
-        f.setPointSize(self.text_size_slider.value())
-        app.setFont(f)
-
-        for i in self.non_resizable_labels:
-            i.setFont(f)
-
-        self.settings.setValue("ui/text_size", self.text_size_slider.value())
-        self.color_container.setFixedSize(int(self.text_size * 2), int(self.text_size * 2))
-        self.request_repaint()
-
-    def update_text_size_label(self, value):
-        self.text_size = value
-        self.text_size_label.setText(f"Text size: {value}")
-
-    def recompute_manual_mask(self):
-        h, w = self.base_rgba.shape[:2]
-        acc = np.zeros((h, w), dtype=bool)
-        for p in self.manual_patches:
-            acc = np.logical_or(acc, p["mask"])
-        if self.manual_preview is not None:
-            acc = np.logical_or(acc, self.manual_preview["mask"])
-        return acc
-
-    def make_patch_mask(self, center, radius, sensitivity, strict_sensitivity):
-        h, w = self.base_rgba.shape[:2]
-        roi = np.zeros((h, w), dtype=np.uint8)
-        cv2.circle(roi, center, int(radius), 1, -1)
-
-        y = np.clip(center[1], 0, h-1)
-        x = np.clip(center[0], 0, w-1)
-        target_rgb = tuple(int(v) for v in self.base_rgba[y, x, :3])
-
-        color_mask = self.get_color_mask(self.base_rgba, target_rgb, int(sensitivity))
-        color_mask &= roi.astype(bool)
-
-        if strict_sensitivity and strict_sensitivity > 0:
-            color_mask = self.apply_strict_filter(color_mask, int(strict_sensitivity))
-        return color_mask
-
-    def add_manual_patch(self, center):
-        dlg = QDialog(self)
-        dlg.setWindowTitle("Manual patch")
-        lay = QVBoxLayout(dlg)
-
-        def mk(label_text, mn, mx, val):
-            lab = QLabel(f"{label_text}: {val}")
-            s = QSlider(Qt.Horizontal)
-            s.setMinimum(mn); s.setMaximum(mx); s.setValue(val)
-            s.valueChanged.connect(lambda v, L=lab, T=label_text: L.setText(f"{T}: {v}"))
-            lay.addWidget(lab); lay.addWidget(s)
-            return s, lab
-
-        # defaults
-        s_radius, _ = mk("Radius", 5, 200, 30)
-        s_sens,   _ = mk("Sensitivity", 0, 255, self.sensitivity)
-        s_strict, _ = mk("Strict sensitivity", 0, 10, 0)
-
-        # initialize preview
-        self.update_manual_preview(center, s_radius.value(), s_sens.value(), s_strict.value())
-
-        # live update preview on slider changes
-        s_radius.valueChanged.connect(lambda v: self.update_manual_preview(center, v, s_sens.value(), s_strict.value()))
-        s_sens.valueChanged.connect(  lambda v: self.update_manual_preview(center, s_radius.value(), v, s_strict.value()))
-        s_strict.valueChanged.connect(lambda v: self.update_manual_preview(center, s_radius.value(), s_sens.value(), v))
-
-        btns = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=dlg)
-        lay.addWidget(btns)
-        btns.accepted.connect(dlg.accept)
-        btns.rejected.connect(dlg.reject)
-
-        if dlg.exec_() == QDialog.Accepted:
-            p = self.manual_preview
-            if p is not None:
-                self.manual_patches.append(p)
-                added = int(np.count_nonzero(p["mask"]))
-                self.hint(f"[Manual] Patch added at {p['center']} | Radius: {p['radius']}, Sensitivity: {p['sensitivity']}, Strict sensitivity: {p['strict']} | Pixels: {added}", True)
-            self.manual_preview = None
-            self.invalidate("manual")
-            self.request_repaint()
-        else:
-            self.manual_preview = None
-            self.invalidate("manual")
-            self.request_repaint()
-
-    def remove_manual_patch_near(self, pos):
-        if not self.manual_patches:
-            return False
-        x, y = pos
-        for i in range(len(self.manual_patches)-1, -1, -1):
-            cx, cy = self.manual_patches[i]["center"]
-            if np.hypot(x - cx, y - cy) < max(self.manual_pick_radius, self.manual_patches[i]["radius"] * 0.5):
-                self.manual_patches.pop(i)
-                self.invalidate("manual")
-                self.request_repaint()
-                return True
-        return False
-
-    def update_manual_preview(self, center, radius, sensitivity, strict):
-        mask = self.make_patch_mask(center, radius, sensitivity, strict)
-        self.manual_preview = {
-            "center": center,
-            "radius": radius,
-            "sensitivity": sensitivity,
-            "strict": strict,
-            "mask": mask
-        }
-        self.invalidate("manual")
-        if not self.manual_preview_timer.isActive():
-            self.manual_preview_timer.start(16)
-
-    def compare_image(self, checked):
-        if checked:
-            self.compare_scroll_area.show()
-            self.request_repaint()
-        else:
-            self.compare_scroll_area.hide()
-            self.request_repaint()
-
-    def hint(self, text, timed):
-        self.info_label.show()
-        self.info_label.setText(text)
-        if timed:
-            if self.timer.isActive():
-                self.timer.stop()
-            self.timer.start(self.delay)
-
-    def remove_hint(self):
-        self.info_label.setText("")
-
-    def update_transient_sensitivity(self, value):
-        self.transient_sensitivity = value
-        self.transient_label.setText(f"Sensitivity: {value}")
-        self.invalidate("transient", "manual")
-        self.request_repaint()
-
-    def update_transient_strict(self, value):
-        self.transient_strict = value
-        if value == 0:
-            self.transient_strict_label.setText("Strict sensitivity: Off")
-        else:
-            self.transient_strict_label.setText(f"Strict sensitivity: {value}")
-        self.invalidate("transient", "manual")
-        self.request_repaint()
-
-    def pick_transient_color(self, checked):
-        if checked:
-            self.tool_mode = "transient_color"
-            self.pick_color_button.setChecked(False)
-            self.plot_line_button.setChecked(False)
-            self.manual_mode_button.setChecked(False)
-            self.hint("Click on a color for the transient layer", False)
-        elif not checked and not self.plot_line_button.isChecked() and not self.manual_mode_button.isChecked():
-            self.tool_mode = None
-
-    def toggle_transient(self, checked):
-        if checked:
-            if self.transient_color:
-                self.transient_color_parent.show()
-                self.transient_color_label.show()
-            self.transient_label.show()
-            self.transient_slider.show()
-            self.transient_strict_label.show()
-            self.transient_strict_slider.show()
-        else:
-            self.transient_color_parent.hide()
-            self.transient_color_label.hide()
-            self.transient_label.hide()
-            self.transient_slider.hide()
-            self.transient_strict_label.hide()
-            self.transient_strict_slider.hide()
-        self.invalidate("transient", "manual")
-        self.request_repaint()
-
-    def build_transient_overlay(self, base_arr):
-        if self.transient_color is None:
-            h, w = base_arr.shape[:2]
-            return np.zeros((h, w, 4), dtype=np.uint8)
-
-        tol = int(getattr(self, "transient_sensitivity", 100))
-        mask = self.get_color_mask(base_arr, self.transient_color, tol)
-
-        if self.strict_checkbox.isChecked():
-            level = int(round(getattr(self, "transient_strict", self.transient_strict)))
-            mask = self.apply_strict_filter(mask, level)
-        
-        return self.create_highlight_overlay(mask, highlight_color=(186, 113, 0))
-
-    def invalidate(self, *layers):
-        for k in layers:
-            self.dirty[k] = True
-    
-    def invalidate_all(self):
-        for k in self.dirty:
-            self.dirty[k] = True
-
-    def build_highlight(self, base_arr):
-        """Returns (mask, overlay) for the main highlight layer."""
-        h, w = base_arr.shape[:2]
-        if not (self.toggle_checkbox.isChecked() and self.picked_color):
-            return np.zeros((h, w), dtype=bool), np.zeros((h, w, 4), dtype=np.uint8)
-
-        mask = self.get_color_mask(base_arr, self.picked_color, int(self.sensitivity))
-        if self.strict_checkbox.isChecked():
-            level = int(self.strict_sensitivity)
-            mask = self.apply_strict_filter(mask, level)
-        overlay = self.create_highlight_overlay(mask)  # gold default
-        return mask, overlay
-
-    def build_manual(self, base_arr, forbid_mask=None):
-        """Returns (mask, overlay) for manual layer (only if checkbox is on).
-        If forbid_mask is provided, manual excludes those pixels (disjoint)."""
-        h, w = base_arr.shape[:2]
-        if not self.manual_checkbox.isChecked():
-            return np.zeros((h, w), dtype=bool), np.zeros((h, w, 4), dtype=np.uint8)
-
-        mask = self.recompute_manual_mask()
-
-        # EXCLUDE higher-priority classes (highlight and/or transient) if provided
-        if forbid_mask is not None:
-            mask = np.logical_and(mask, np.logical_not(forbid_mask))
-
-        overlay = self.create_highlight_overlay(mask, highlight_color=(0, 0, 255))
-        return mask, overlay
-
-    def build_transient(self, base_arr, forbid_mask=None):
-        """
-        Second highlight layer (orange). Excludes any pixels already in forbid_mask (highlight),
-        so it never overlaps visually.
-        """
-        h, w = base_arr.shape[:2]
-        if not (self.transient_checkbox.isChecked() and self.transient_color is not None):
-            return np.zeros((h, w), dtype=bool), np.zeros((h, w, 4), dtype=np.uint8)
-
-        tol = int(self.transient_sensitivity)
-        tmask = self.get_color_mask(base_arr, self.transient_color, tol)
-
-        # independent strict for transient
-        level = int(self.transient_strict)
-        if level > 0:
-            tmask = self.apply_strict_filter(tmask, level)
-
-        # EXCLUDE highlight pixels if present
-        if forbid_mask is not None:
-            tmask = np.logical_and(tmask, np.logical_not(forbid_mask))
-
-        overlay = self.create_highlight_overlay(tmask, highlight_color=(186, 113, 0))  # #ba7100
-        return tmask, overlay
-
-    def build_lines(self, shape_hw):
-        """Returns overlay for lines/anchors if enabled."""
-        h, w = shape_hw
-        if not (self.line_checkbox.isChecked() and self.anchors):
-            return np.zeros((h, w, 4), dtype=np.uint8)
-
-        line_overlay = np.zeros((h, w, 4), dtype=np.uint8)
-        lw = int(self.line_width)
-        for i in range(1, len(self.anchors)):
-            cv2.line(line_overlay, self.anchors[i - 1], self.anchors[i], (0, 255, 0, 255), lw)
-        if getattr(self, "temp_mouse_pos", None):
-            plw = int(self.preview_line_width)
-            cv2.line(line_overlay, self.anchors[-1], self.temp_mouse_pos, (255, 255, 0, 255), plw)
-        ar = int(self.anchor_radius)
-        for i, (x, y) in enumerate(self.anchors):
-            color = (255, 255, 0, 255) if i == self.hovered_anchor_index else (0, 255, 0, 255)
-            cv2.circle(line_overlay, (x, y), ar, color, -1)
-        return line_overlay
-
-    def toggle_line_layer(self, _):
-        self.invalidate("lines")
-        self.request_repaint()
-
-    def toggle_manual_layer(self, _):
-        self.invalidate("manual")
-        self.request_repaint()
-
-    def toggle_highlight_layer(self, _):
-        self.invalidate("highlight", "transient", "manual")
-        self.request_repaint()
-
-    def open_settings_dialog(self):
-        dlg = QDialog(self)
-        dlg.setWindowTitle("Settings")
-        layout = QVBoxLayout(dlg)
-
-        s_line_width_label = QLabel(f"Line width: {self.line_width}")
-        line_width_slider = QSlider(Qt.Horizontal)
-        line_width_slider.setMinimum(1)
-        line_width_slider.setMaximum(10)
-        line_width_slider.setValue(self.line_width)
-        line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        s_preview_line_width_label = QLabel(f"Preview line width: {self.preview_line_width}")
-        preview_line_width_slider = QSlider(Qt.Horizontal)
-        preview_line_width_slider.setMinimum(1)
-        preview_line_width_slider.setMaximum(10)
-        preview_line_width_slider.setValue(self.preview_line_width)
-        preview_line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        s_anchor_radius_label = QLabel(f"Anchor radius: {self.anchor_radius}")
-        anchor_radius_slider = QSlider(Qt.Horizontal)
-        anchor_radius_slider.setMinimum(1)
-        anchor_radius_slider.setMaximum(20)
-        anchor_radius_slider.setValue(self.anchor_radius)
-        anchor_radius_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        s_text_size_label = QLabel(f"Text size: {self.text_size}")
-        text_size_slider = QSlider(Qt.Horizontal)
-        text_size_slider.setMinimum(6)
-        text_size_slider.setMaximum(24)
-        text_size_slider.setValue(self.text_size)
-        text_size_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
-
-        quick_settings_checkbox = QCheckBox("Show settings in tool panel")
-        quick_settings_checkbox.setChecked(self.quick_settings)
-
-        layout.addWidget(s_line_width_label)
-        layout.addWidget(line_width_slider)
-        layout.addWidget(s_preview_line_width_label)
-        layout.addWidget(preview_line_width_slider)
-        layout.addWidget(s_anchor_radius_label)
-        layout.addWidget(anchor_radius_slider)
-        layout.addWidget(s_text_size_label)
-        layout.addWidget(text_size_slider)
-        layout.addWidget(quick_settings_checkbox)
-
-        line_width_slider.valueChanged.connect(
-            lambda v: s_line_width_label.setText(f"Line width: {v}")
-        )
-        preview_line_width_slider.valueChanged.connect(
-            lambda v: s_preview_line_width_label.setText(f"Preview line width: {v}")
-        )
-        anchor_radius_slider.valueChanged.connect(
-            lambda v: s_anchor_radius_label.setText(f"Anchor radius: {v}")
-        )
-        text_size_slider.valueChanged.connect(
-            lambda v: s_text_size_label.setText(f"Text size: {v}")
-        )
-
-        # Button box
-        btns = QDialogButtonBox(
-            QDialogButtonBox.Ok | QDialogButtonBox.Apply | QDialogButtonBox.Cancel, parent=dlg
-        )
-        layout.addWidget(btns)
-
-        apply_button = btns.button(QDialogButtonBox.Apply)
-        if apply_button:
-            def _on_apply():
-                self.line_width_slider.setValue(line_width_slider.value())
-                self.preview_line_width_slider.setValue(preview_line_width_slider.value())
-                self.anchor_radius_slider.setValue(anchor_radius_slider.value())
-                self.text_size_slider.setValue(text_size_slider.value())
-                self.update_global_font()
-                if quick_settings_checkbox.isChecked():
-                    self.quick_settings = True
-                    self.settings.setValue("ui/quick_settings", True)
-                    self.line_width_label.show()
-                    self.line_width_slider.show()
-                    self.preview_line_width_label.show()
-                    self.preview_line_width_slider.show()
-                    self.anchor_radius_label.show()
-                    self.anchor_radius_slider.show()
-                    self.text_size_label.show()
-                    self.text_size_slider.show()
-                else:
-                    self.quick_settings = False
-                    self.settings.setValue("ui/quick_settings", False)
-                    self.line_width_label.hide()
-                    self.line_width_slider.hide()
-                    self.preview_line_width_label.hide()
-                    self.preview_line_width_slider.hide()
-                    self.anchor_radius_label.hide()
-                    self.anchor_radius_slider.hide()
-                    self.text_size_label.hide()
-                    self.text_size_slider.hide()
-
-            apply_button.clicked.connect(_on_apply)
-
-        # OK (call hook, then close)
-        def _on_ok():
-            self.line_width_slider.setValue(line_width_slider.value())
-            self.preview_line_width_slider.setValue(preview_line_width_slider.value())
-            self.anchor_radius_slider.setValue(anchor_radius_slider.value())
-            self.text_size_slider.setValue(text_size_slider.value())
-            self.update_global_font()
-            if quick_settings_checkbox.isChecked():
-                self.quick_settings = True
-                self.settings.setValue("ui/quick_settings", True)
-                self.line_width_label.show()
-                self.line_width_slider.show()
-                self.preview_line_width_label.show()
-                self.preview_line_width_slider.show()
-                self.anchor_radius_label.show()
-                self.anchor_radius_slider.show()
-                self.text_size_label.show()
-                self.text_size_slider.show()
-            else:
-                self.quick_settings = False
-                self.settings.setValue("ui/quick_settings", False)
-                self.line_width_label.hide()
-                self.line_width_slider.hide()
-                self.preview_line_width_label.hide()
-                self.preview_line_width_slider.hide()
-                self.anchor_radius_label.hide()
-                self.anchor_radius_slider.hide()
-                self.text_size_label.hide()
-                self.text_size_slider.hide()
-            dlg.accept()
-
-        btns.accepted.connect(_on_ok)
-
-        # Cancel (call hook, then close)
-        def _on_cancel():
-            dlg.reject()
-
-        btns.rejected.connect(_on_cancel)
-
-        dlg.exec_()
-        return None
-
-    # ---------- UX ----------
-    def keyPressEvent(self, event):
-        if event.key() == Qt.Key_L:
-            self.toggle_checkbox.toggle()
-
-    def mousePressEvent(self, event):
-        if self.tool_mode == "color":
-            if event.button() == Qt.LeftButton and self.qimage:
-                pos = self.image_label.mapFromGlobal(event.globalPos())
-                label_w, label_h = self.image_label.width(), self.image_label.height()
-                img_w, img_h = self.qimage.width(), self.qimage.height()
-                scale = min(label_w / img_w, label_h / img_h)
-                disp_w, disp_h = img_w * scale, img_h * scale
-                offset_x = (label_w - disp_w) / 2
-                offset_y = (label_h - disp_h) / 2
-                x = int((pos.x() - offset_x) / scale)
-                y = int((pos.y() - offset_y) / scale)
-                if 0 <= x < img_w and 0 <= y < img_h:
-                    color = self.qimage.pixelColor(x, y)
-                    r, g, b = color.red(), color.green(), color.blue()
-                    hexv = f"#{r:02x}{g:02x}{b:02x}"
-                    self.color_container.setStyleSheet(f"background-color: {hexv};")
-                    self.color_label.setText(f"RGB: ({r}, {g}, {b})\nHEX: {hexv}")
-                    self.color_parent.show()
-                    self.color_label.show()
-                    self.picked_color = (r, g, b)
-                    self.invalidate("highlight", "transient")
-                    self.request_repaint()
-                    self.toggle_checkbox.setChecked(True)
-                    self.pick_color_button.setChecked(False)
-                    self.remove_hint()
-                else:
-                    self.hint("Click was outside the image", True)
-        elif self.tool_mode == "plot":
-            if self.first_plot_point:
-                self.delete_line_button.show()
-                self.line_checkbox.show()
-                self.line_checkbox.setChecked(True)
-            if event.button() == Qt.LeftButton:
-                pos = self.image_label.mapFromGlobal(event.globalPos())
-                mapped = self.map_click_to_image_coords(pos)
-                if mapped:
-                    x, y = mapped
-                    if self.anchors:
-                        first_x, first_y = self.anchors[0]
-                        dist = np.hypot(x - first_x, y - first_y)
-                        if dist < self.point_distance:
-                            self.anchors.append((first_x, first_y))
-                            self.invalidate("lines")
-                            self.temp_mouse_pos = None
-                            self.request_repaint()
-                            self.polygon_closed = True
-                            self.plot_line_button.setChecked(False)
-                            self.hint("Polygon closed", True)
-                    was_empty = not self.anchors
-                    self.anchors.append((x, y))
-                    self.invalidate("lines")
-                    if was_empty:
-                        self.first_plot_point = False
-                    if not self.polygon_closed:
-                        self.hint(f"Added anchor at: ({x}, {y})", True)
-                    self.request_repaint()
-            elif event.button() == Qt.RightButton:
-                pos = self.image_label.mapFromGlobal(event.globalPos())
-                mapped = self.map_click_to_image_coords(pos)
-                if mapped:
-                    x, y = mapped
-                    for i, (ax, ay) in enumerate(self.anchors):
-                        dist = np.hypot(x - ax, y - ay)
-                        if dist < self.point_distance:
-                            removed = self.anchors.pop(i)
-                            self.invalidate("lines")
-                            self.request_repaint()
-                            self.hint(f"Removed anchor at: {removed}", True)
-                            return
-        elif self.tool_mode == "manual":
-            pos = self.image_label.mapFromGlobal(event.globalPos())
-            mapped = self.map_click_to_image_coords(pos)
-            if not mapped:
-                return
-            x, y = mapped
-            if event.button() == Qt.LeftButton:
-                self.add_manual_patch((x, y))
-            elif event.button() == Qt.RightButton:
-                removed = self.remove_manual_patch_near((x, y))
-                if removed:
-                    self.hint(f"Removed manual patch near: {(x, y)}", True)
-        elif self.tool_mode == "transient_color":
-            if event.button() == Qt.LeftButton and self.qimage:
-                pos = self.image_label.mapFromGlobal(event.globalPos())
-                label_w, label_h = self.image_label.width(), self.image_label.height()
-                img_w, img_h = self.qimage.width(), self.qimage.height()
-                scale = min(label_w / img_w, label_h / img_h)
-                disp_w, disp_h = img_w * scale, img_h * scale
-                offset_x = (label_w - disp_w) / 2
-                offset_y = (label_h - disp_h) / 2
-                x = int((pos.x() - offset_x) / scale)
-                y = int((pos.y() - offset_y) / scale)
-                if 0 <= x < img_w and 0 <= y < img_h:
-                    color = self.qimage.pixelColor(x, y)
-                    self.transient_color = (color.red(), color.green(), color.blue())
-                    hexv = f"#{color.red():02x}{color.green():02x}{color.blue():02x}"
-                    self.transient_color_container.setStyleSheet(f"background-color: {hexv};")
-                    self.transient_color_label.setText(f"Transient color:\nRGB: {self.transient_color}\nHEX: {hexv}")
-                    self.transient_color_parent.show()
-                    self.transient_color_label.show()
-                    self.invalidate("transient", "manual")
-                    self.request_repaint()
-                    self.transient_checkbox.setChecked(True)
-                    self.pick_transient_color_button.setChecked(False)
-                    self.remove_hint()
-
-    def mouseMoveEvent(self, event):
-        if self.tool_mode == "plot" and self.anchors:
-            pos = self.image_label.mapFromGlobal(event.globalPos())
-            mapped = self.map_click_to_image_coords(pos)
-            if mapped:
-                self.temp_mouse_pos = mapped
-                self.hovered_anchor_index = None
-                x, y = mapped
-                for i, (ax, ay) in enumerate(self.anchors):
-                    dist = np.hypot(x - ax, y - ay)
-                    if dist < self.point_distance:
-                        self.hovered_anchor_index = i
-                        break
-                self.invalidate("lines")
-                self.request_repaint()
-
-    def mouse_moved(self, event):
-        if self.tool_mode == "plot" and self.anchors:
-            pos = self.image_label.mapFromGlobal(event.globalPos())
-            mapped = self.map_click_to_image_coords(pos)
-            if mapped:
-                self.temp_mouse_pos = mapped
-                self.hovered_anchor_index = None
-                x, y = mapped
-                for i, (ax, ay) in enumerate(self.anchors):
-                    dist = np.hypot(x - ax, y - ay)
-                    if dist < self.point_distance:
-                        self.hovered_anchor_index = i
-                        break
-                self.invalidate("lines")
-                self.request_repaint()
-
-    def resizeEvent(self, event):
-        self.request_repaint()
-        super().resizeEvent(event)
-
-    def changeEvent(self, event):
-        if event.type() == QEvent.WindowStateChange:
-            self.request_repaint()
-        super().changeEvent(event)
-
-class ClickableLabel(QLabel):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setMouseTracking(True)
-        self.mouse_moved_callback = None
-
-    def mouseMoveEvent(self, event):
-        if self.mouse_moved_callback:
-            self.mouse_moved_callback(event)
-
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = SoilErosionUI()
-    window.show()
-    sys.exit(app.exec_())
+from PyQt5.QtWidgets import (
+    QApplication, QMainWindow, QWidget, QPushButton, QLabel,
+    QHBoxLayout, QVBoxLayout, QSlider, QCheckBox, QFileDialog, QScrollArea,
+    QShortcut, QSizePolicy, QDialog, QDialogButtonBox, QInputDialog
+)
+from PyQt5.QtCore import Qt, QTimer, QSettings, QEvent, QObject, QRunnable, QThreadPool, QPointF, pyqtSignal
+from PyQt5.QtGui import QPixmap, QKeySequence, QImage, QPainter, QPen, QColor, QFont
+from os import path
+import json, sys, threading, time, numpy as np, cv2
+import area_cache, area_engine as engine, area_geo, area_project, area_store
+
+IMAGE_FILTER = "Image Files (*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.npy)"
+PROJECT_FILTER = f"Area Calculator Project (*{area_project.PROJECT_EXTENSION})"
+IMAGE_CHANGED = " (the image changed since it was saved, layers are rebuilt)"
+DIGEST_POLL_MS = 200
+
+class SoilErosionUI(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Area Calculator")
+        self.setGeometry(100, 100, 1280, 720)
+
+        # Variables
+        self.settings = QSettings("esemkej", "Area Calculator")
+        self.image_store = None
+        self.image_path = None
+        self.image_digest = None  # area_cache.FileDigest of image_path
+        self.layer_misses = set()  # result cache keys of layer masks looked up in vain for this image
+        self.project_path = None  # project file the session was opened from / saved to
+        self.stored_layers = {}  # area_project.StoredMask of the open project by class name
+        self.stored_digest = None  # image digest the stored layers were built from
+        self.classes = []  # engine.ColorClass beyond highlight/transient, from the open project (no widgets)
+        self.last_result = None  # (area_cache.params_key, AnalysisResult) of the values shown
+        self.base_rgba = None
+        self.distances = None  # engine.DistanceCache of base_rgba
+        self.pyramid = None  # engine.ImagePyramid of base_rgba
+        self.original_view = None  # (view geometry, pixmap) of the untouched image
+        self.frame_view = None  # view geometry of the frame on screen (lines are painted over it)
+        self.render_view = None  # view geometry of the latest render job
+        # View: zoom relative to fit-to-viewport, center in image coordinates
+        self.zoom = 1.0
+        self.view_center = None
+        self.pan_origin = None  # (mouse pos, view center) while middle-dragging
+        self.picked_color = None
+        self.tool_mode = None
+        self.debug = False  # also shows per-stage timings over the image
+        self.profile_log = None  # path: append one JSON timing record per frame / analysis
+        self.stage_times = {}  # pipeline -> {stage: seconds} of the last profiled run
+        self.sensitivity = 100
+        self.temp_mouse_pos = None
+        self.first_plot_point = True
+        self.point_distance = 10  # Distance from which a click counts as an anchor click
+        self.anchors = engine.PointIndex(cell=self.point_distance)
+        self.field_rings = []  # holes / further parts of an imported field
+        self.hovered_anchor_index = None
+        self.strict_sensitivity = 5
+        self.polygon_closed = False
+        self.delay = 3000
+        self.transient_sensitivity = 100
+        self.transient_strict = 5
+        self.transient_color = None
+        self.non_resizable_labels = [] # Labels inside of the area calculation layout that don't answer to global font size changes unless manually updated
+        # Full-resolution class masks and their class-label image; overlays are
+        # composited per frame at viewport size
+        self.cache = {
+            "highlight_mask": None,  # before priority is resolved
+            "transient_mask": None,
+            "class_masks": {},  # further classes (self.classes) by name
+            "class_labels": None,  # uint8, see engine.stack_class_labels
+            "labels_pyramid": None,  # priority-pooled engine.ImagePyramid of class_labels
+            "view_base": None  # (view geometry, base image sampled to it)
+        }
+        self.dirty = {
+            "highlight": True,
+            "manual": True,
+            "transient": True,
+            "classes": True
+        }
+        self.layer_versions = {k: 0 for k in self.dirty}  # bumped on every invalidate
+
+        # Background rendering (layer builds + compositing run off the GUI thread)
+        self.render_pool = QThreadPool(self)
+        self.render_pool.setMaxThreadCount(1)
+        self.render_signals = RenderSignals()
+        self.render_signals.finished.connect(self.show_frame)
+        self.render_generation = 0
+        self.render_cancel = None  # threading.Event of the running job
+        # Result cache writes (compression + SQLite) run off the GUI thread, in order
+        self.cache_pool = QThreadPool(self)
+        self.cache_pool.setMaxThreadCount(1)
+
+        # Repaint throttles
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.timeout.connect(self.update_final_image)
+
+        # Live preview throttle for manual patch dialog
+        self.manual_preview_timer = QTimer(self)
+        self.manual_preview_timer.setSingleShot(True)
+        self.manual_preview_timer.timeout.connect(self.update_final_image)
+
+        # Persistent UI vars
+        self.line_width = int(self.settings.value("var/line_width", 2))
+        self.preview_line_width = int(self.settings.value("var/preview_line_width", 1))
+        self.anchor_radius = int(self.settings.value("var/anchor_radius", 4))
+        self.quick_settings = self.settings.value("ui/quick_settings", True, type=bool)
+        # Analysis results and layer masks on disk, shared with other windows and batch runs
+        self.result_cache = area_cache.ResultCache(max_bytes=int(self.settings.value("var/cache_mb", 512)) * 1024 * 1024)
+
+        app = QApplication.instance()
+        self.text_size = int(self.settings.value("ui/text_size", app.font().pointSize() or 8))
+
+        # Manual patches
+        self.manual_patches = []
+        self.manual_pick_radius = 10
+        self.manual_patch_index = engine.PointIndex(cell=64)  # patch centers, reach = radius / 2
+        self.manual_preview = None
+        self.manual_coverage = None  # engine.PatchCoverage of the applied patches + preview
+        self.manual_regions = []  # bounds of manual changes not on screen yet (None = whole layer)
+
+        # Font size init
+        f = app.font()
+        f.setPointSize(self.text_size)
+        app.setFont(f)
+
+        # Info timer
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+
+        # === CENTRAL WIDGET ===
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+
+        # === TOP BAR ===
+        top_bar = QHBoxLayout()
+        self.load_button = QPushButton("Open Image")
+        self.open_project_button = QPushButton("Open Project")
+        self.save_project_button = QPushButton("Save Project")
+        self.export_button = QPushButton("Export Image")
+        self.import_button = QPushButton("Import Field")
+        self.toggle_checkbox = QCheckBox("Show Highlighted Layer")
+        self.sensitivity_slider = QSlider(Qt.Horizontal)
+        self.sensitivity_slider.setMinimum(0)
+        self.sensitivity_slider.setMaximum(255)
+        self.sensitivity_slider.setValue(self.sensitivity)
+        self.sensitivity_label = QLabel(f"Sensitivity: {self.sensitivity}")
+
+        top_bar.addWidget(self.load_button)
+        top_bar.addWidget(self.open_project_button)
+        top_bar.addWidget(self.save_project_button)
+        top_bar.addWidget(self.export_button)
+        top_bar.addWidget(self.import_button)
+        top_bar.addWidget(self.toggle_checkbox)
+        top_bar.addWidget(self.sensitivity_label)
+        top_bar.addWidget(self.sensitivity_slider)
+
+        # === MAIN BODY ===
+        body_layout = QHBoxLayout()
+
+        # Left tool panel
+        tool_panel = QVBoxLayout()
+        self.pick_color_button = QPushButton("Pick a color")
+        self.pick_transient_color_button = QPushButton("Pick transient color")
+        self.plot_line_button = QPushButton("Plot a line")
+        self.delete_line_button = QPushButton("Delete line")
+        self.manual_mode_button = QPushButton("Manual mode")
+        self.calculate_area_button = QPushButton("Calculate area")
+        self.settings_button = QPushButton("Settings")
+        self.pick_color_button.setCheckable(True)
+        self.pick_transient_color_button.setCheckable(True)
+        self.plot_line_button.setCheckable(True)
+        self.manual_mode_button.setCheckable(True)
+
+        # Color display
+        self.color_parent = QWidget()
+        self.color_parent.setLayout(QHBoxLayout())
+        self.color_parent.layout().setContentsMargins(0, 0, 0, 0)
+        self.color_layout_0 = QWidget()
+        self.color_layout_0.setStyleSheet("background-color: #000000;")
+        self.color_layout_0.setLayout(QHBoxLayout())
+        self.color_layout_0.layout().setContentsMargins(1, 1, 1, 1)
+        self.color_layout_1 = QWidget()
+        self.color_layout_1.setStyleSheet("background-color: #ffffff;")
+        self.color_layout_1.setLayout(QHBoxLayout())
+        self.color_layout_1.layout().setContentsMargins(1, 1, 1, 1)
+        self.color_container = QWidget()
+        self.color_container.setFixedSize(int(self.text_size * 2), int(self.text_size * 2))
+        self.color_layout_1.layout().addWidget(self.color_container)
+        self.color_layout_0.layout().addWidget(self.color_layout_1)
+        self.color_parent.layout().addWidget(self.color_layout_0, alignment=Qt.AlignHCenter)
+        self.color_label = QLabel()
+
+        self.strict_checkbox = QCheckBox("Strict mode")
+        self.strict_slider = QSlider(Qt.Horizontal)
+        self.strict_slider.setMinimum(0)
+        self.strict_slider.setMaximum(10)
+        self.strict_slider.setValue(self.strict_sensitivity)
+        self.strict_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+        self.strict_label = QLabel(f"Sensitivity: {self.strict_sensitivity}")
+
+        # Transient
+        self.line_checkbox = QCheckBox("Line")
+        self.manual_checkbox = QCheckBox("Manual layer")
+        self.transient_checkbox = QCheckBox("Transient layer")
+
+        # Transient color display
+        self.transient_color_parent = QWidget()
+        self.transient_color_parent.setLayout(QHBoxLayout())
+        self.transient_color_parent.layout().setContentsMargins(0, 0, 0, 0)
+        self.transient_color_layout_0 = QWidget()
+        self.transient_color_layout_0.setStyleSheet("background-color: #000000;")
+        self.transient_color_layout_0.setLayout(QHBoxLayout())
+        self.transient_color_layout_0.layout().setContentsMargins(1, 1, 1, 1)
+        self.transient_color_layout_1 = QWidget()
+        self.transient_color_layout_1.setStyleSheet("background-color: #ffffff;")
+        self.transient_color_layout_1.setLayout(QHBoxLayout())
+        self.transient_color_layout_1.layout().setContentsMargins(1, 1, 1, 1)
+        self.transient_color_container = QWidget()
+        self.transient_color_container.setFixedSize(int(self.text_size * 2), int(self.text_size * 2))
+        self.transient_color_layout_1.layout().addWidget(self.transient_color_container)
+        self.transient_color_layout_0.layout().addWidget(self.transient_color_layout_1)
+        self.transient_color_parent.layout().addWidget(self.transient_color_layout_0, alignment=Qt.AlignHCenter)
+        self.transient_color_label = QLabel()
+
+        # Transient controls
+        self.transient_label = QLabel(f"Sensitivity: {self.transient_sensitivity}")
+        self.transient_slider = QSlider(Qt.Horizontal)
+        self.transient_slider.setMinimum(1)
+        self.transient_slider.setMaximum(255)
+        self.transient_slider.setValue(self.transient_sensitivity)
+        self.transient_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+        self.transient_strict_label = QLabel(f"Strict sensitivity: {self.transient_strict}")
+        self.transient_strict_slider = QSlider(Qt.Horizontal)
+        self.transient_strict_slider.setMinimum(0)
+        self.transient_strict_slider.setMaximum(10)
+        self.transient_strict_slider.setValue(self.transient_strict)
+        self.transient_strict_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+        self.compare_checkbox = QCheckBox("Comparison image")
+
+        self.line_width_label = QLabel(f"Line width: {self.line_width}")
+        self.line_width_slider = QSlider(Qt.Horizontal)
+        self.line_width_slider.setMinimum(1)
+        self.line_width_slider.setMaximum(10)
+        self.line_width_slider.setValue(self.line_width)
+        self.line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        self.preview_line_width_label = QLabel(f"Preview line width: {self.preview_line_width}")
+        self.preview_line_width_slider = QSlider(Qt.Horizontal)
+        self.preview_line_width_slider.setMinimum(1)
+        self.preview_line_width_slider.setMaximum(10)
+        self.preview_line_width_slider.setValue(self.preview_line_width)
+        self.preview_line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        self.anchor_radius_label = QLabel(f"Anchor radius: {self.anchor_radius}")
+        self.anchor_radius_slider = QSlider(Qt.Horizontal)
+        self.anchor_radius_slider.setMinimum(1)
+        self.anchor_radius_slider.setMaximum(20)
+        self.anchor_radius_slider.setValue(self.anchor_radius)
+        self.anchor_radius_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        self.text_size_label = QLabel(f"Text size: {self.text_size}")
+        self.text_size_slider = QSlider(Qt.Horizontal)
+        self.text_size_slider.setMinimum(6)
+        self.text_size_slider.setMaximum(24)
+        self.text_size_slider.setValue(self.text_size)
+        self.text_size_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        # Area panel
+        self.area_main_layout = QWidget()
+        self.area_main_layout.setSizePolicy(QSizePolicy.Maximum, QSizePolicy.Preferred)
+        self.area_main_layout.setStyleSheet("background:#000000;")
+        self.area_main_layout.setLayout(QHBoxLayout())
+        self.area_main_layout.layout().setContentsMargins(0, 0, 0, 0)
+        self.area_main_layout.layout().setSpacing(0)
+
+        # left_texts_layout (column)
+        left_texts_layout = QVBoxLayout()
+        left_texts_layout.setContentsMargins(0, 0, 0, 0)
+        left_texts_layout.setSpacing(0)
+        self.area_main_layout.layout().addLayout(left_texts_layout, 1)
+
+        # --- left_highlight_layout ---
+        left_highlight_wrapper = QWidget()
+        left_highlight_wrapper.setLayout(QHBoxLayout())
+        left_highlight_wrapper.layout().setContentsMargins(2, 2, 1, 1)  # margins outside white cell
+        left_highlight_wrapper.layout().setSpacing(0)
+
+        left_highlight_layout = QWidget()
+        left_highlight_layout.setStyleSheet("background:#FFFFFF;")
+        left_highlight_layout.setLayout(QHBoxLayout())
+        left_highlight_layout.layout().setContentsMargins(8, 8, 8, 8)   # padding
+        left_highlight_layout.layout().setSpacing(0)
+
+        highlight_label = QLabel("Highlight area:")
+        left_highlight_layout.layout().addWidget(highlight_label)
+        self.non_resizable_labels.append(highlight_label)
+
+        left_highlight_wrapper.layout().addWidget(left_highlight_layout)
+        left_texts_layout.addWidget(left_highlight_wrapper)
+
+        # --- left_manual_layout ---
+        left_manual_wrapper = QWidget()
+        left_manual_wrapper.setLayout(QHBoxLayout())
+        left_manual_wrapper.layout().setContentsMargins(2, 1, 1, 1)
+        left_manual_wrapper.layout().setSpacing(0)
+
+        left_manual_layout = QWidget()
+        left_manual_layout.setStyleSheet("background:#FFFFFF;")
+        left_manual_layout.setLayout(QHBoxLayout())
+        left_manual_layout.layout().setContentsMargins(8, 8, 8, 8)
+        left_manual_layout.layout().setSpacing(0)
+
+        manual_label = QLabel("Manual area:")
+        left_manual_layout.layout().addWidget(manual_label)
+        self.non_resizable_labels.append(manual_label)
+
+        left_manual_wrapper.layout().addWidget(left_manual_layout)
+        left_texts_layout.addWidget(left_manual_wrapper)
+
+        # --- left_transcient_layout ---
+        left_transcient_wrapper = QWidget()
+        left_transcient_wrapper.setLayout(QHBoxLayout())
+        left_transcient_wrapper.layout().setContentsMargins(2, 1, 1, 1)
+        left_transcient_wrapper.layout().setSpacing(0)
+
+        left_transcient_layout = QWidget()
+        left_transcient_layout.setStyleSheet("background:#FFFFFF;")
+        left_transcient_layout.setLayout(QHBoxLayout())
+        left_transcient_layout.layout().setContentsMargins(8, 8, 8, 8)
+        left_transcient_layout.layout().setSpacing(0)
+
+        transcient_label = QLabel("Transcient area:")
+        left_transcient_layout.layout().addWidget(transcient_label)
+        self.non_resizable_labels.append(transcient_label)
+
+        left_transcient_wrapper.layout().addWidget(left_transcient_layout)
+        left_texts_layout.addWidget(left_transcient_wrapper)
+
+        # --- left_combined_layout ---
+        left_combined_wrapper = QWidget()
+        left_combined_wrapper.setLayout(QHBoxLayout())
+        left_combined_wrapper.layout().setContentsMargins(2, 1, 1, 2)
+        left_combined_wrapper.layout().setSpacing(0)
+
+        left_combined_layout = QWidget()
+        left_combined_layout.setStyleSheet("background:#FFFFFF;")
+        left_combined_layout.setLayout(QHBoxLayout())
+        left_combined_layout.layout().setContentsMargins(8, 8, 8, 8)
+        left_combined_layout.layout().setSpacing(0)
+
+        combined_area_label = QLabel("Combined area:")
+        left_combined_layout.layout().addWidget(combined_area_label)
+        self.non_resizable_labels.append(combined_area_label)
+
+        left_combined_wrapper.layout().addWidget(left_combined_layout)
+        left_texts_layout.addWidget(left_combined_wrapper)
+
+        # right_texts_layout (column)
+        right_texts_layout = QVBoxLayout()
+        right_texts_layout.setContentsMargins(0, 0, 0, 0)
+        right_texts_layout.setSpacing(0)
+        self.area_main_layout.layout().addLayout(right_texts_layout, 1)
+
+        # --- right_highlight_layout ---
+        right_highlight_wrapper = QWidget()
+        right_highlight_wrapper.setLayout(QHBoxLayout())
+        right_highlight_wrapper.layout().setContentsMargins(1, 2, 2, 1)
+        right_highlight_wrapper.layout().setSpacing(0)
+
+        right_highlight_layout = QWidget()
+        right_highlight_layout.setStyleSheet("background:#FFFFFF;")
+        right_highlight_layout.setLayout(QHBoxLayout())
+        right_highlight_layout.layout().setContentsMargins(8, 8, 8, 8)
+        right_highlight_layout.layout().setSpacing(0)
+
+        self.highlight_perc = QLabel("None")
+        right_highlight_layout.layout().addWidget(self.highlight_perc)
+        self.non_resizable_labels.append(self.highlight_perc)
+
+        right_highlight_wrapper.layout().addWidget(right_highlight_layout)
+        right_texts_layout.addWidget(right_highlight_wrapper)
+
+        # --- right_manual_layout ---
+        right_manual_wrapper = QWidget()
+        right_manual_wrapper.setLayout(QHBoxLayout())
+        right_manual_wrapper.layout().setContentsMargins(1, 1, 2, 1)
+        right_manual_wrapper.layout().setSpacing(0)
+
+        right_manual_layout = QWidget()
+        right_manual_layout.setStyleSheet("background:#FFFFFF;")
+        right_manual_layout.setLayout(QHBoxLayout())
+        right_manual_layout.layout().setContentsMargins(8, 8, 8, 8)
+        right_manual_layout.layout().setSpacing(0)
+
+        self.manual_perc = QLabel("None")
+        right_manual_layout.layout().addWidget(self.manual_perc)
+        self.non_resizable_labels.append(self.manual_perc)
+
+        right_manual_wrapper.layout().addWidget(right_manual_layout)
+        right_texts_layout.addWidget(right_manual_wrapper)
+
+        # --- right_transcient_layout ---
+        right_transcient_wrapper = QWidget()
+        right_transcient_wrapper.setLayout(QHBoxLayout())
+        right_transcient_wrapper.layout().setContentsMargins(1, 1, 2, 1)
+        right_transcient_wrapper.layout().setSpacing(0)
+
+        right_transcient_layout = QWidget()
+        right_transcient_layout.setStyleSheet("background:#FFFFFF;")
+        right_transcient_layout.setLayout(QHBoxLayout())
+        right_transcient_layout.layout().setContentsMargins(8, 8, 8, 8)
+        right_transcient_layout.layout().setSpacing(0)
+
+        self.transcient_perc = QLabel("None")
+        right_transcient_layout.layout().addWidget(self.transcient_perc)
+        self.non_resizable_labels.append(self.transcient_perc)
+
+        right_transcient_wrapper.layout().addWidget(right_transcient_layout)
+        right_texts_layout.addWidget(right_transcient_wrapper)
+
+        # --- right_combined_layout ---
+        right_combined_wrapper = QWidget()
+        right_combined_wrapper.setLayout(QHBoxLayout())
+        right_combined_wrapper.layout().setContentsMargins(1, 1, 2, 2)
+        right_combined_wrapper.layout().setSpacing(0)
+
+        right_combined_layout = QWidget()
+        right_combined_layout.setStyleSheet("background:#FFFFFF;")
+        right_combined_layout.setLayout(QHBoxLayout())
+        right_combined_layout.layout().setContentsMargins(8, 8, 8, 8)
+        right_combined_layout.layout().setSpacing(0)
+
+        self.combined_perc = QLabel("None")
+        right_combined_layout.layout().addWidget(self.combined_perc)
+        self.non_resizable_labels.append(self.combined_perc)
+
+        right_combined_wrapper.layout().addWidget(right_combined_layout)
+        right_texts_layout.addWidget(right_combined_wrapper)
+
+        tool_panel.addWidget(self.pick_color_button)
+        tool_panel.addWidget(self.color_parent)
+        tool_panel.addWidget(self.color_label)
+        tool_panel.addWidget(self.pick_transient_color_button)
+        tool_panel.addWidget(self.plot_line_button)
+        tool_panel.addWidget(self.delete_line_button)
+        tool_panel.addWidget(self.manual_mode_button)
+        tool_panel.addWidget(self.calculate_area_button)
+        tool_panel.addWidget(self.settings_button)
+        tool_panel.addWidget(self.strict_checkbox)
+        tool_panel.addWidget(self.strict_label)
+        tool_panel.addWidget(self.strict_slider)
+        tool_panel.addWidget(self.line_checkbox)
+        tool_panel.addWidget(self.manual_checkbox)
+        tool_panel.addWidget(self.transient_checkbox)
+        tool_panel.addWidget(self.transient_color_parent)
+        tool_panel.addWidget(self.transient_color_label)
+        tool_panel.addWidget(self.transient_label)
+        tool_panel.addWidget(self.transient_slider)
+        tool_panel.addWidget(self.transient_strict_label)
+        tool_panel.addWidget(self.transient_strict_slider)
+        tool_panel.addWidget(self.compare_checkbox)
+        tool_panel.addWidget(self.line_width_label)
+        tool_panel.addWidget(self.line_width_slider)
+        tool_panel.addWidget(self.preview_line_width_label)
+        tool_panel.addWidget(self.preview_line_width_slider)
+        tool_panel.addWidget(self.anchor_radius_label)
+        tool_panel.addWidget(self.anchor_radius_slider)
+        tool_panel.addWidget(self.text_size_label)
+        tool_panel.addWidget(self.text_size_slider)
+        tool_panel.addWidget(self.area_main_layout)
+
+        self.color_parent.hide()
+        self.color_label.hide()
+        self.delete_line_button.hide()
+        self.strict_label.hide()
+        self.strict_slider.hide()
+        self.transient_color_parent.hide()
+        self.transient_color_label.hide()
+        self.transient_label.hide()
+        self.transient_slider.hide()
+        self.transient_strict_label.hide()
+        self.transient_strict_slider.hide()
+        self.line_checkbox.hide()
+        if not self.quick_settings:
+            self.line_width_label.hide()
+            self.line_width_slider.hide()
+            self.preview_line_width_label.hide()
+            self.preview_line_width_slider.hide()
+            self.anchor_radius_label.hide()
+            self.anchor_radius_slider.hide()
+            self.text_size_label.hide()
+            self.text_size_slider.hide()
+        tool_panel.addStretch()
+
+        tool_widget = QWidget()
+        tool_widget.setLayout(tool_panel)
+
+        # Image display
+        self.image_label = ClickableLabel("Image will appear here")
+        self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.image_label.setAlignment(Qt.AlignCenter)
+        self.image_label.mouse_moved_callback = self.mouse_moved
+        self.image_label.wheel_callback = self.label_wheel
+        self.image_label.paint_callback = self.paint_label
+        self.compare_image_label = QLabel("Comparison image will appear here")
+        self.compare_image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.compare_image_label.setAlignment(Qt.AlignCenter)
+        self.scroll_area = QScrollArea()
+        self.scroll_area.setWidgetResizable(True)
+        self.scroll_area.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.scroll_area.setWidget(self.image_label)
+        self.compare_scroll_area = QScrollArea()
+        self.compare_scroll_area.setWidgetResizable(True)
+        self.compare_scroll_area.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.compare_scroll_area.setWidget(self.compare_image_label)
+
+        # Info display
+        info_layout = QVBoxLayout()
+        info_layout.setContentsMargins(0, 0, 0, 0)
+        self.info_label = QLabel()
+        info_layout.addWidget(self.info_label, alignment=Qt.AlignHCenter)
+
+        right_scroll_layout = QHBoxLayout()
+        right_scroll_layout.setContentsMargins(0, 0, 0, 0)
+        right_scroll_layout.addWidget(self.scroll_area, 1)
+        right_scroll_layout.addWidget(self.compare_scroll_area, 1)
+
+        right_body_layout = QVBoxLayout()
+        right_body_layout.setContentsMargins(0, 0, 0, 0)
+        right_body_layout.addLayout(right_scroll_layout)
+        right_body_layout.addLayout(info_layout)
+
+        body_layout.addWidget(tool_widget)
+        body_layout.addLayout(right_body_layout)
+        self.compare_scroll_area.hide()
+
+        # === Assemble Layouts ===
+        main_layout.addLayout(top_bar)
+        main_layout.addLayout(body_layout)
+
+        # Binds
+        self.load_button.clicked.connect(self.load_image)
+        self.open_project_button.clicked.connect(self.open_project)
+        self.save_project_button.clicked.connect(self.save_project)
+        self.export_button.clicked.connect(self.export_image)
+        self.import_button.clicked.connect(self.import_field)
+        self.toggle_checkbox.stateChanged.connect(self.toggle_highlight_layer)
+        self.sensitivity_slider.valueChanged.connect(self.update_sensitivity)
+        self.pick_color_button.toggled.connect(self.pick_color)
+        self.pick_transient_color_button.toggled.connect(self.pick_transient_color)
+        self.plot_line_button.toggled.connect(self.plot_line)
+        self.delete_line_button.clicked.connect(self.delete_line)
+        self.manual_mode_button.toggled.connect(self.manual_mode)
+        self.calculate_area_button.clicked.connect(self.analyze_field)
+        self.settings_button.clicked.connect(self.open_settings_dialog)
+        self.strict_checkbox.stateChanged.connect(self.strict_mode)
+        self.strict_slider.valueChanged.connect(self.update_strict)
+        self.line_checkbox.stateChanged.connect(self.toggle_line_layer)
+        self.manual_checkbox.stateChanged.connect(self.toggle_manual_layer)
+        self.transient_checkbox.stateChanged.connect(self.toggle_transient)
+        self.transient_slider.valueChanged.connect(self.update_transient_sensitivity)
+        self.transient_strict_slider.valueChanged.connect(self.update_transient_strict)
+        self.compare_checkbox.stateChanged.connect(self.compare_image)
+        self.line_width_slider.valueChanged.connect(self.update_line_width)
+        self.preview_line_width_slider.valueChanged.connect(self.update_preview_line_width)
+        self.anchor_radius_slider.valueChanged.connect(self.update_anchor_radius)
+        self.text_size_slider.sliderReleased.connect(self.update_global_font)
+        self.text_size_slider.valueChanged.connect(self.update_text_size_label)
+        self.timer.timeout.connect(self.remove_hint)
+
+        shortcut_open = QShortcut(QKeySequence("Ctrl+O"), self)
+        shortcut_open.activated.connect(self.load_image)
+        shortcut_open_project = QShortcut(QKeySequence("Ctrl+Shift+O"), self)
+        shortcut_open_project.activated.connect(self.open_project)
+        shortcut_save_project = QShortcut(QKeySequence("Ctrl+Shift+S"), self)
+        shortcut_save_project.activated.connect(self.save_project)
+        shortcut_export = QShortcut(QKeySequence("Ctrl+S"), self)
+        shortcut_export.activated.connect(self.export_image)
+        shortcut_import = QShortcut(QKeySequence("Ctrl+I"), self)
+        shortcut_import.activated.connect(self.import_field)
+        shortcut_fit = QShortcut(QKeySequence("Ctrl+0"), self)
+        shortcut_fit.activated.connect(self.reset_zoom)
+
+    # ---------- Logic ----------
+    def request_repaint(self):
+        if not self.repaint_timer.isActive():
+            self.repaint_timer.start(16)
+
+    def load_image(self):
+        if self.debug:
+            file_path = path.join(path.dirname(__file__), "debug_image.png")
+            if not path.exists(file_path):
+                self.path_label.setText("[DEBUG] debug_image.png not found")
+                return
+        else:
+            file_path, _ = QFileDialog.getOpenFileName(self, "Select Image", "", IMAGE_FILTER)
+        if file_path and self.open_image(file_path):
+            self.hint(f"Loaded: {file_path}", True)
+
+    def open_image(self, file_path):
+        """Make file_path the working image; False (with a hint) if it cannot be opened."""
+        try:
+            store = area_store.open_image_store(file_path)
+        except (ValueError, ImportError) as e:
+            self.hint(str(e), True)
+            return False
+        try:
+            # The store's array (memory-mapped for .npy/.raw) is the only full-size copy;
+            # a TIFF is decoded whole here, only area_tiles reads it region by region
+            base_rgba = store.full()
+        except (ValueError, OSError) as e:
+            store.close()
+            self.hint(f"Could not read {file_path}: {e}", True)
+            return False
+        if self.image_store is not None:
+            self.image_store.close()
+        self.image_store = store
+        self.image_path = file_path
+        self.image_digest = area_cache.FileDigest(file_path).start()  # hashed in the background, see peek()
+        self.layer_misses = set()
+        self.project_path = None
+        self.stored_layers = {}
+        self.stored_digest = None
+        self.classes = []
+        self.last_result = None
+        self.base_rgba = base_rgba
+        self.distances = engine.DistanceCache(self.base_rgba)
+        self.pyramid = engine.ImagePyramid(self.base_rgba)
+        self.manual_coverage = engine.PatchCoverage(self.base_rgba.shape[:2], self.manual_patches)
+        self.original_view = None
+        self.zoom, self.view_center = 1.0, None
+        self.invalidate_all()
+        self.frame_view = self.view_geometry()
+        self.image_label.setPixmap(self.scaled_original())
+        self.compare_image_label.setPixmap(self.scaled_original())
+        self.request_repaint()
+        return True
+
+    def save_project(self):
+        """Save the session with its computed class masks, so opening it rebuilds nothing."""
+        if self.base_rgba is None:
+            self.hint("Load an image first", True)
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Project", self.project_path or "", PROJECT_FILTER)
+        if not file_path:
+            return
+        if not path.splitext(file_path)[1]:
+            file_path += area_project.PROJECT_EXTENSION
+        digest = self.image_digest.peek()
+        if digest is None:
+            self.hint("The image is still being checksummed - save again in a moment", True)
+            return
+        params = self.analysis_params()
+        # Masks on screen match params; the others are carried over from the open project
+        masks = self.built_masks()
+        shown = self.last_result
+        result = shown[1] if shown is not None and shown[0] == area_cache.params_key(params) else None
+        project = area_project.Project(
+            self.image_path, digest, self.base_rgba.shape[:2], params, self.polygon_closed,
+            self.stored_layers, result, self.view_state(),
+        )
+        try:
+            self.stored_layers = area_project.save_project(file_path, project, masks)
+        except OSError as e:
+            self.hint(f"Could not write {file_path}: {e}", True)
+            return
+        self.stored_digest = digest
+        self.project_path = file_path
+        self.hint(f"Project saved: {file_path}", True)
+
+    def open_project(self):
+        """Restore a saved session; class masks are decompressed when their layer is shown."""
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Project", "", PROJECT_FILTER)
+        if not file_path:
+            return
+        try:
+            project = area_project.open_project(file_path)
+        except (OSError, ValueError) as e:
+            self.hint(f"Could not open {file_path}: {e}", True)
+            return
+        image_path = project.image_path
+        if not path.exists(image_path):
+            image_path, _ = QFileDialog.getOpenFileName(self, f"Locate {path.basename(image_path)}", "", IMAGE_FILTER)
+            if not image_path:
+                return
+        if not self.open_image(image_path):
+            return
+        note = ""
+        if tuple(self.base_rgba.shape[:2]) != project.shape:
+            # Another image: keep the settings, compute the layers anew
+            project.layers, project.result = {}, None
+            project.params.manual_patches = self.remade_patches(project.params.manual_patches)
+            note = IMAGE_CHANGED
+        self.apply_project(project)
+        self.project_path = file_path
+        self.hint(f"Opened project: {file_path}{note}", True)
+        if not note:
+            self.check_project_image(self.image_digest, project.digest)
+
+    def remade_patches(self, patches):
+        return [engine.make_patch(self.base_rgba, p.center, p.radius, p.sensitivity, p.strict) for p in patches]
+
+    def check_project_image(self, image_digest, saved):
+        """Once the image is hashed (polled, the GUI never waits for it), drop what the
+        project computed if the image was edited since it was saved."""
+        if self.image_digest is not image_digest:
+            return  # another image was opened meanwhile
+        digest = image_digest.peek()
+        if digest is None:
+            QTimer.singleShot(DIGEST_POLL_MS, lambda: self.check_project_image(image_digest, saved))
+            return
+        if digest == saved:
+            return
+        self.stored_layers, self.stored_digest = {}, None
+        self.manual_patches = self.remade_patches(self.manual_patches)
+        self.manual_coverage = engine.PatchCoverage(self.base_rgba.shape[:2], self.manual_patches)
+        self.manual_preview = None
+        self.last_result = None
+        for label in (self.highlight_perc, self.transcient_perc, self.manual_perc, self.combined_perc):
+            label.setText("None")
+        self.invalidate_all()
+        self.request_repaint()
+        self.hint(f"Opened project: {self.project_path}{IMAGE_CHANGED}", True)
+
+    def apply_project(self, project):
+        """Set the widgets and session state from a project of the current image."""
+        params = project.params
+        hl, tr = params.highlight, params.transient
+        self.picked_color = hl.color
+        if hl.color is not None:
+            self.show_picked_color(hl.color)
+        self.sensitivity_slider.setValue(hl.sensitivity)
+        if hl.strict is not None:
+            self.strict_slider.setValue(hl.strict)
+        self.strict_checkbox.setChecked(hl.strict is not None)
+        self.toggle_checkbox.setChecked(hl.enabled)
+        self.transient_color = tr.color
+        if tr.color is not None:
+            self.show_transient_color(tr.color)
+        self.transient_slider.setValue(tr.sensitivity)
+        self.transient_strict_slider.setValue(tr.strict or 0)
+        self.transient_checkbox.setChecked(tr.enabled)
+
+        self.anchors = engine.PointIndex(params.polygon, cell=self.point_distance)
+        self.field_rings = params.rings
+        self.polygon_closed = project.polygon_closed
+        self.first_plot_point = not self.anchors
+        self.temp_mouse_pos = self.hovered_anchor_index = None
+        self.delete_line_button.setVisible(bool(self.anchors))
+        self.line_checkbox.setVisible(bool(self.anchors))
+        self.line_checkbox.setChecked(project.view.get("line", True))
+
+        self.manual_patches = list(params.manual_patches)
+        self.manual_patch_index = engine.PointIndex(cell=64)
+        for p in self.manual_patches:
+            self.manual_patch_index.append(p.center, p.radius * 0.5)
+        self.manual_preview = None
+        self.manual_coverage = engine.PatchCoverage(self.base_rgba.shape[:2], self.manual_patches)
+        self.manual_checkbox.setChecked(params.manual_enabled)
+
+        self.stored_layers, self.stored_digest = project.layers, project.digest
+        self.classes = list(params.classes)
+        if project.result is not None:
+            self.show_result(project.result)
+            params, cache, result = self.analysis_params(), self.result_cache, project.result
+            self.last_result = (area_cache.params_key(params), result)
+            self.cache_pool.start(CacheJob(lambda: area_cache.store_result(cache, project.digest, params, result)))
+        self.zoom = min(max(float(project.view.get("zoom", 1.0)), 1.0), engine.MAX_ZOOM)
+        center = project.view.get("center")
+        self.view_center = tuple(center) if center else None
+        self.compare_checkbox.setChecked(project.view.get("compare", False))
+        self.invalidate_all()
+        self.update_lines()
+        self.request_repaint()
+
+    def view_state(self):
+        """What a project keeps of the view."""
+        return {
+            "zoom": self.zoom,
+            "center": list(self.view_center) if self.view_center else None,
+            "line": self.line_checkbox.isChecked(),
+            "compare": self.compare_checkbox.isChecked(),
+        }
+
+    def export_image(self):
+        """Save the composited view at full image resolution."""
+        if self.base_rgba is None:
+            self.hint("Load an image first", True)
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Image", "", "PNG Image (*.png);;TIFF Image (*.tif *.tiff)")
+        if not file_path:
+            return
+        # Work on copies so a running render job's cache bookkeeping is untouched
+        cache = dict(self.cache)
+        params = self.analysis_params()
+        build_layers(self.base_rgba, params, cache, dict(self.dirty), self.distances)
+        lines = draw_lines(self.base_rgba.shape[:2], self.line_params())
+        final = engine.compose_labels(self.base_rgba, cache["class_labels"], params.overlay_colors(), lines)
+        if cv2.imwrite(file_path, cv2.cvtColor(final, cv2.COLOR_RGBA2BGRA)):
+            self.hint(f"Exported: {file_path}", True)
+        else:
+            self.hint(f"Could not write {file_path}", True)
+
+    def import_field(self):
+        """Replace the polygon with a field from a GeoJSON/WKT file.
+
+        Coordinates are pixels, or map coordinates when the image has a world file.
+        """
+        if self.base_rgba is None:
+            self.hint("Load an image first", True)
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Import Field", "", "Field Files (*.geojson *.json *.wkt *.txt)"
+        )
+        if not file_path:
+            return
+        world_file = area_geo.world_file_for(self.image_path) if self.image_path else None
+        try:
+            fields = area_geo.FieldSet.load(file_path).fields(area_geo.read_world_file(world_file))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.hint(f"Could not read {file_path}: {e}", True)
+            return
+        fields = [f for f in fields if f.polygon]
+        if not fields:
+            self.hint("No polygons in the file", True)
+            return
+        field = fields[0]
+        if len(fields) > 1:
+            names = [f.name for f in fields]
+            name, ok = QInputDialog.getItem(self, "Import Field", "Field:", names, 0, False)
+            if not ok:
+                return
+            field = fields[names.index(name)]
+
+        self.anchors = engine.PointIndex(field.polygon, cell=self.point_distance)
+        if self.anchors[0] != self.anchors[-1]:
+            self.anchors.append(self.anchors[0])  # closed, like a drawn polygon
+        self.field_rings = field.rings
+        self.temp_mouse_pos = None
+        self.hovered_anchor_index = None
+        self.polygon_closed = True
+        self.first_plot_point = False
+        self.plot_line_button.setChecked(False)
+        self.delete_line_button.show()
+        self.line_checkbox.show()
+        self.line_checkbox.setChecked(True)
+        self.update_lines()
+        source = f" (mapped with {path.basename(world_file)})" if world_file else ""
+        self.hint(f"Imported field {field.name}: {len(field.polygon)} vertices, {len(field.rings)} more rings{source}", True)
+
+    def update_sensitivity(self, value):
+        self.sensitivity = value
+        self.sensitivity_label.setText(f"Sensitivity: {value}")
+        self.invalidate("highlight")
+        if self.toggle_checkbox.isChecked():
+            self.request_repaint()
+
+    def arr_to_qpixmap(self, arr):
+        h, w, _ = arr.shape
+        image = QImage(arr.data, w, h, QImage.Format_RGBA8888)
+        return QPixmap.fromImage(image.copy())
+
+    def scaled_original(self):
+        """Pixmap of the untouched image for the current view, cached per view."""
+        geometry = self.view_geometry()
+        if self.original_view is None or self.original_view[0] != geometry:
+            rect, (dw, dh) = geometry
+            self.original_view = (geometry, self.arr_to_qpixmap(self.pyramid.view(rect, dw, dh)))
+        return self.original_view[1]
+
+    def view_geometry(self):
+        """(visible image rect, display size) of the current zoom/pan."""
+        img_h, img_w = self.base_rgba.shape[:2]
+        return engine.view_geometry(img_w, img_h, *self.viewport_size(), self.zoom, self.view_center)
+
+    def map_to_image(self, pos):
+        """Label position -> (float) image coordinates plus the view geometry."""
+        (x0, y0, x1, y1), (dw, dh) = geometry = self.view_geometry()
+        offset_x = (self.image_label.width() - dw) / 2
+        offset_y = (self.image_label.height() - dh) / 2
+        x = x0 + (pos.x() - offset_x) * (x1 - x0) / dw
+        y = y0 + (pos.y() - offset_y) * (y1 - y0) / dh
+        return (x, y), geometry
+
+    def map_click_to_image_coords(self, pos):
+        if self.base_rgba is None:
+            return None
+        (x, y), _ = self.map_to_image(pos)
+        img_h, img_w = self.base_rgba.shape[:2]
+        x, y = int(np.floor(x)), int(np.floor(y))
+        if 0 <= x < img_w and 0 <= y < img_h:
+            return x, y
+        return None
+
+    # ---------- Zoom / pan ----------
+    def zoom_at(self, pos, factor):
+        """Zoom by factor keeping the image point under pos (label coordinates) in place."""
+        if self.base_rgba is None:
+            return
+        (px, py), ((x0, y0, x1, y1), (dw, dh)) = self.map_to_image(pos)
+        zoom = min(max(self.zoom * factor, 1.0), engine.MAX_ZOOM)
+        if zoom == self.zoom:
+            return
+        u, v = (px - x0) / (x1 - x0), (py - y0) / (y1 - y0)
+        self.zoom = zoom
+        (nx0, ny0, nx1, ny1), _ = self.view_geometry()
+        vis_w, vis_h = nx1 - nx0, ny1 - ny0
+        self.set_view_center(px - u * vis_w + vis_w / 2, py - v * vis_h + vis_h / 2)
+
+    def set_view_center(self, cx, cy):
+        self.view_center = (cx, cy)
+        (x0, y0, x1, y1), _ = self.view_geometry()
+        self.view_center = ((x0 + x1) / 2, (y0 + y1) / 2)  # clamped to the image
+        self.request_repaint()
+
+    def reset_zoom(self):
+        self.zoom, self.view_center = 1.0, None
+        self.request_repaint()
+
+    def label_wheel(self, event):
+        steps = event.angleDelta().y() / 120
+        if steps:
+            self.zoom_at(event.pos(), 1.25 ** steps)
+
+    def viewport_size(self):
+        return self.scroll_area.viewport().width(), self.scroll_area.viewport().height()
+
+    def update_final_image(self):
+        """Hand the current parameters to the render worker; stale jobs are cancelled."""
+        if self.base_rgba is None:
+            return
+
+        if self.render_cancel is not None:
+            self.render_cancel.set()
+        self.render_pool.clear()  # drop queued jobs that have not started yet
+        self.render_generation += 1
+        self.render_cancel = threading.Event()
+        self.render_view = self.view_geometry()
+        job = RenderJob(
+            self.render_generation, self.render_cancel, self.render_signals,
+            self.pyramid, self.distances, self.analysis_params(),
+            dict(self.dirty), dict(self.layer_versions), dict(self.cache), self.render_view,
+            self.manual_coverage, list(self.manual_regions),
+            engine.StageTimer() if self.profiling() else engine.NO_TIMER,
+            self.mask_loader(),
+        )
+        self.render_pool.start(job)
+
+    def show_frame(self, generation, final, cache, versions, timer):
+        """Finished render job (GUI thread). Frames of outdated jobs are dropped."""
+        if generation != self.render_generation:
+            return
+        timer.lap("deliver")
+        self.cache.update(cache)
+        for k, v in versions.items():
+            if self.layer_versions[k] == v:
+                self.dirty[k] = False
+        if not self.dirty["manual"]:
+            self.manual_regions.clear()
+
+        # The frame is already composited at viewport size; lines are painted over it
+        self.frame_view = self.render_view
+        pixmap = self.arr_to_qpixmap(final)
+        timer.lap("to_qpixmap")
+        self.image_label.setPixmap(pixmap)
+        if self.compare_checkbox.isChecked():
+            self.compare_image_label.setPixmap(self.scaled_original())
+        timer.lap("set_pixmap")
+        self.record_timings("render", timer, generation=generation, view=list(final.shape[1::-1]))
+
+    def pick_color(self, checked):
+        if checked:
+            self.tool_mode = "color"
+            self.plot_line_button.setChecked(False)
+            self.manual_mode_button.setChecked(False)
+            self.hint("Click on a color you want to highlight", True)
+        elif not checked and not self.plot_line_button.isChecked() and not self.manual_mode_button.isChecked():
+            self.tool_mode = None
+
+    def plot_line(self, checked):
+        if checked:
+            self.tool_mode = "plot"
+            self.pick_color_button.setChecked(False)
+            self.manual_mode_button.setChecked(False)
+            self.hint("Click anywhere to start plotting a line", True)
+        elif not checked and not self.pick_color_button.isChecked() and not self.manual_mode_button.isChecked():
+            self.tool_mode = None
+            if not self.polygon_closed:
+                self.delete_line()
+
+    def delete_line(self):
+        if self.anchors:
+            self.anchors.clear()
+            self.field_rings = []
+            self.temp_mouse_pos = None
+            self.hovered_anchor_index = None
+            self.polygon_closed = False
+            self.first_plot_point = True
+            self.line_checkbox.hide()
+            self.delete_line_button.hide()
+            self.plot_line_button.setChecked(False)
+            self.update_lines()
+            if self.polygon_closed:
+                self.hint("Line deleted", True)
+            else:
+                self.hint("Line deleted - polygon not closed", True)
+        else:
+            self.hint("No line drawn", True)
+
+    def analyze_field(self):
+        # must have an image and a closed polygon
+        if self.base_rgba is None or len(self.anchors) < 3 or not self.polygon_closed:
+            self.hint("Image not loaded or polygon not defined/closed", True)
+            return
+
+        timer = engine.StageTimer() if self.profiling() else engine.NO_TIMER
+        params = self.analysis_params()
+        digest = self.image_digest.peek()  # the cache is skipped until the image is hashed
+        result = area_cache.load_result(self.result_cache, digest, params) if digest is not None else None
+        timer.lap("cache_lookup")
+        cached = result is not None
+        try:
+            if not cached:
+                result = engine.analyze_field(self.base_rgba, params, self.distances, timer)
+        except ValueError as e:
+            self.hint(str(e), True)
+            return
+        self.store_analysis(params, None if cached else result)
+        self.record_timings("analysis", timer, field_pixels=result.field_pixels)
+        self.last_result = (area_cache.params_key(params), result)
+        self.show_result(result)
+
+    def show_result(self, result):
+        for label, value in (
+            (self.highlight_perc, result.highlight),
+            (self.transcient_perc, result.transient),
+            (self.manual_perc, result.manual),
+            (self.combined_perc, result.combined),
+        ):
+            label.setText("None" if value is None else f"{value:.2f}%")
+
+    def mask_loader(self):
+        """load_mask for build_layers: class masks of the open project, then of the result cache.
+
+        The result cache is only asked once the image is hashed, and once per
+        layer settings that it does not have, so dragging a slider costs at
+        most one read per new value.
+        """
+        stored, cache, misses = dict(self.stored_layers), self.result_cache, self.layer_misses
+        image_digest, stored_digest = self.image_digest, self.stored_digest
+        digest = image_digest.peek()
+
+        def load_mask(name, layer):
+            entry = stored.get(name)
+            # A stored mask saves a build, so the (render) worker waits for the hash to check it
+            if entry is not None and entry.key == area_cache.layer_key(layer) and same_image():
+                mask = entry.load()
+                if mask is not None:
+                    return mask
+            if digest is None:
+                return None
+            key = area_cache.layer_entry_key(digest, layer)
+            if key in misses:
+                return None
+            mask = area_cache.load_layer(cache, digest, layer)
+            if mask is None:
+                misses.add(key)
+            return mask
+
+        def same_image():
+            try:
+                return image_digest.value == stored_digest
+            except OSError:
+                return False
+        return load_mask
+
+    def store_analysis(self, params, result=None):
+        """Keep result (unless None) and the current auto layer masks in the result cache.
+
+        Compression and writes run on the cache worker, which also waits there
+        for the image hash, so the next session does not rebuild the layers.
+        """
+        masks = self.built_masks()
+        layers = [(c.layer, masks[c.name]) for c in params.color_classes() if c.layer.active and c.name in masks]
+        cache, image_digest, misses = self.result_cache, self.image_digest, self.layer_misses
+
+        def store():
+            try:
+                digest = image_digest.value
+            except OSError:
+                return
+            if result is not None:
+                area_cache.store_result(cache, digest, params, result)
+            for layer, mask in layers:
+                area_cache.store_layer(cache, digest, layer, mask)
+                misses.discard(area_cache.layer_entry_key(digest, layer))
+        self.cache_pool.start(CacheJob(store))
+
+    def built_masks(self):
+        """Auto class masks (before priority) that are up to date with the current settings, by class name."""
+        masks = {name: self.cache[f"{name}_mask"] for name in ("highlight", "transient")
+                 if not self.dirty[name] and self.cache[f"{name}_mask"] is not None}
+        if not self.dirty["classes"]:
+            masks.update(self.cache["class_masks"])
+        return masks
+
+    def strict_mode(self, checked):
+        if checked:
+            self.strict_slider.show()
+            self.strict_label.show()
+        else:
+            self.strict_slider.hide()
+            self.strict_label.hide()
+        self.invalidate("highlight")
+        self.request_repaint()
+
+    def update_strict(self, value):
+        self.strict_sensitivity = value
+        if value == 0:
+            self.strict_label.setText("Sensitivity: Off")
+        else:
+            self.strict_label.setText(f"Sensitivity: {value}")
+        self.invalidate("highlight")
+        if self.strict_checkbox.isChecked():
+            self.request_repaint()
+
+    def manual_mode(self, checked):
+        if checked:
+            self.tool_mode = "manual"
+            self.pick_color_button.setChecked(False)
+            self.plot_line_button.setChecked(False)
+            self.manual_checkbox.setChecked(True)
+            self.hint("Click on specific patches to add them manually", False)
+        elif not checked and not self.pick_color_button.isChecked() and not self.plot_line_button.isChecked():
+            self.tool_mode = None
+            self.remove_hint()
+            if not self.manual_patches:
+                self.manual_checkbox.setChecked(False)
+
+    def update_line_width(self, value):
+        self.line_width = value
+        self.line_width_label.setText(f"Line width: {value}")
+        self.settings.setValue("var/line_width", value)
+        if (self.plot_line_button.isChecked() or self.anchors):
+            self.update_lines()
+
+    def update_preview_line_width(self, value):
+        self.preview_line_width = value
+        self.preview_line_width_label.setText(f"Preview line width: {value}")
+        self.settings.setValue("var/preview_line_width", value)
+        if (self.plot_line_button.isChecked() or self.anchors):
+            self.update_lines()
+
+    def update_anchor_radius(self, value):
+        self.anchor_radius = value
+        self.anchor_radius_label.setText(f"Anchor radius: {value}")
+        self.settings.setValue("var/anchor_radius", value)
+        if (self.plot_line_button.isChecked() or self.anchors):
+            self.update_lines()
+
+    def update_global_font(self):
+        app = QApplication.instance()
+        f = app.font()
+        f.setPointSize(self.text_size_slider.value())
+        app.setFont(f)
+
+        for i in self.non_resizable_labels:
+            i.setFont(f)
+
+        self.settings.setValue("ui/text_size", self.text_size_slider.value())
+        self.color_container.setFixedSize(int(self.text_size * 2), int(self.text_size * 2))
+        self.request_repaint()
+
+    def update_text_size_label(self, value):
+        self.text_size = value
+        self.text_size_label.setText(f"Text size: {value}")
+
+    def current_manual_patches(self):
+        """Applied patches plus the live preview (if the patch dialog is open)."""
+        if self.manual_preview is not None:
+            return self.manual_patches + [self.manual_preview]
+        return self.manual_patches
+
+    def add_manual_patch(self, center):
+        dlg = QDialog(self)
+        dlg.setWindowTitle("Manual patch")
+        lay = QVBoxLayout(dlg)
+
+        def mk(label_text, mn, mx, val):
+            lab = QLabel(f"{label_text}: {val}")
+            s = QSlider(Qt.Horizontal)
+            s.setMinimum(mn); s.setMaximum(mx); s.setValue(val)
+            s.valueChanged.connect(lambda v, L=lab, T=label_text: L.setText(f"{T}: {v}"))
+            lay.addWidget(lab); lay.addWidget(s)
+            return s, lab
+
+        # defaults
+        s_radius, _ = mk("Radius", 5, 200, 30)
+        s_sens,   _ = mk("Sensitivity", 0, 255, self.sensitivity)
+        s_strict, _ = mk("Strict sensitivity", 0, 10, 0)
+
+        # initialize preview
+        self.update_manual_preview(center, s_radius.value(), s_sens.value(), s_strict.value())
+
+        # live update preview on slider changes
+        s_radius.valueChanged.connect(lambda v: self.update_manual_preview(center, v, s_sens.value(), s_strict.value()))
+        s_sens.valueChanged.connect(  lambda v: self.update_manual_preview(center, s_radius.value(), v, s_strict.value()))
+        s_strict.valueChanged.connect(lambda v: self.update_manual_preview(center, s_radius.value(), s_sens.value(), v))
+
+        btns = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=dlg)
+        lay.addWidget(btns)
+        btns.accepted.connect(dlg.accept)
+        btns.rejected.connect(dlg.reject)
+
+        if dlg.exec_() == QDialog.Accepted:
+            p = self.manual_preview
+            if p is not None:
+                # the preview is already counted in manual_coverage
+                self.manual_patches.append(p)
+                self.manual_patch_index.append(p.center, p.radius * 0.5)
+                added = int(np.count_nonzero(p.mask))
+                self.hint(f"[Manual] Patch added at {p.center} | Radius: {p.radius}, Sensitivity: {p.sensitivity}, Strict sensitivity: {p.strict} | Pixels: {added}", True)
+            self.manual_preview = None
+        else:
+            self.set_manual_preview(None)
+        self.request_repaint()
+
+    def remove_manual_patch_near(self, pos):
+        if not self.manual_patches:
+            return False
+        # latest patch first
+        i = self.manual_patch_index.last_within(pos, self.manual_pick_radius)
+        if i is None:
+            return False
+        p = self.manual_patches.pop(i)
+        self.manual_patch_index.pop(i)
+        self.manual_coverage.remove(p)
+        self.invalidate("manual", region=p.bounds)
+        self.request_repaint()
+        return True
+
+    def set_manual_preview(self, patch):
+        """Swap the live preview patch in the coverage counts (cost: the two patch boxes)."""
+        old, self.manual_preview = self.manual_preview, patch
+        if old is not None:
+            self.manual_coverage.remove(old)
+            self.invalidate("manual", region=old.bounds)
+        if patch is not None:
+            self.manual_coverage.add(patch)
+            self.invalidate("manual", region=patch.bounds)
+
+    def update_manual_preview(self, center, radius, sensitivity, strict):
+        self.set_manual_preview(engine.make_patch(self.base_rgba, center, radius, sensitivity, strict))
+        if not self.manual_preview_timer.isActive():
+            self.manual_preview_timer.start(16)
+
+    def compare_image(self, checked):
+        if checked:
+            self.compare_scroll_area.show()
+            self.request_repaint()
+        else:
+            self.compare_scroll_area.hide()
+            self.request_repaint()
+
+    def hint(self, text, timed):
+        self.info_label.show()
+        self.info_label.setText(text)
+        if timed:
+            if self.timer.isActive():
+                self.timer.stop()
+            self.timer.start(self.delay)
+
+    def remove_hint(self):
+        self.info_label.setText("")
+
+    def update_transient_sensitivity(self, value):
+        self.transient_sensitivity = value
+        self.transient_label.setText(f"Sensitivity: {value}")
+        self.invalidate("transient", "manual")
+        self.request_repaint()
+
+    def update_transient_strict(self, value):
+        self.transient_strict = value
+        if value == 0:
+            self.transient_strict_label.setText("Strict sensitivity: Off")
+        else:
+            self.transient_strict_label.setText(f"Strict sensitivity: {value}")
+        self.invalidate("transient", "manual")
+        self.request_repaint()
+
+    def pick_transient_color(self, checked):
+        if checked:
+            self.tool_mode = "transient_color"
+            self.pick_color_button.setChecked(False)
+            self.plot_line_button.setChecked(False)
+            self.manual_mode_button.setChecked(False)
+            self.hint("Click on a color for the transient layer", False)
+        elif not checked and not self.plot_line_button.isChecked() and not self.manual_mode_button.isChecked():
+            self.tool_mode = None
+
+    def toggle_transient(self, checked):
+        if checked:
+            if self.transient_color:
+                self.transient_color_parent.show()
+                self.transient_color_label.show()
+            self.transient_label.show()
+            self.transient_slider.show()
+            self.transient_strict_label.show()
+            self.transient_strict_slider.show()
+        else:
+            self.transient_color_parent.hide()
+            self.transient_color_label.hide()
+            self.transient_label.hide()
+            self.transient_slider.hide()
+            self.transient_strict_label.hide()
+            self.transient_strict_slider.hide()
+        self.invalidate("transient", "manual")
+        self.request_repaint()
+
+    def invalidate(self, *layers, region=None):
+        """Mark layers for rebuilding; region (x0, y0, x1, y1) limits a manual-only change."""
+        for k in layers:
+            self.dirty[k] = True
+            self.layer_versions[k] += 1
+        if "manual" in layers:
+            self.manual_regions.append(region)
+    
+    def invalidate_all(self):
+        self.invalidate(*self.dirty)
+
+    def highlight_params(self):
+        return engine.LayerParams(
+            color=self.picked_color,
+            sensitivity=int(self.sensitivity),
+            strict=int(self.strict_sensitivity) if self.strict_checkbox.isChecked() else None,
+            enabled=self.toggle_checkbox.isChecked(),
+        )
+
+    def transient_params(self):
+        level = int(self.transient_strict)
+        return engine.LayerParams(
+            color=self.transient_color,
+            sensitivity=int(self.transient_sensitivity),
+            strict=level if level > 0 else None,
+            enabled=self.transient_checkbox.isChecked(),
+        )
+
+    def analysis_params(self):
+        """Snapshot of every widget setting the engine needs."""
+        return engine.AnalysisParams(
+            highlight=self.highlight_params(),
+            transient=self.transient_params(),
+            manual_enabled=self.manual_checkbox.isChecked(),
+            manual_patches=list(self.current_manual_patches()),
+            polygon=list(self.anchors),
+            rings=list(self.field_rings),
+            classes=list(self.classes),
+        )
+
+    def line_params(self):
+        """Snapshot of the polygon drawing state."""
+        return {
+            "enabled": self.line_checkbox.isChecked(),
+            "anchors": list(self.anchors),
+            "rings": list(self.field_rings),
+            "temp_mouse_pos": self.temp_mouse_pos,
+            "hovered_anchor_index": self.hovered_anchor_index,
+            "line_width": int(self.line_width),
+            "preview_line_width": int(self.preview_line_width),
+            "anchor_radius": int(self.anchor_radius),
+        }
+
+    def profiling(self):
+        return self.debug or bool(self.profile_log)
+
+    def record_timings(self, pipeline, timer, **info):
+        """Keep a profiled run's stage times for the debug overlay and append them to the profile log."""
+        if timer is engine.NO_TIMER:
+            return
+        self.stage_times[pipeline] = dict(timer.stages)
+        if self.profile_log:
+            record = {
+                "time": round(time.time(), 3),
+                "pipeline": pipeline,
+                "image": list(self.base_rgba.shape[:2]) if self.base_rgba is not None else None,
+                **info,
+                "stages_ms": {k: round(v * 1000, 3) for k, v in timer.stages.items()},
+                "total_ms": round(timer.total * 1000, 3),
+            }
+            try:
+                with open(self.profile_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                self.profile_log = None
+                self.hint(f"Profile log disabled: {e}", True)
+        if self.debug:
+            self.image_label.update()
+
+    def paint_label(self, painter):
+        """Everything painted over the cached frame: polygon, then the debug timings."""
+        if not self.debug:
+            self.paint_lines(painter)
+            return
+        start = time.perf_counter()
+        self.paint_lines(painter)
+        self.stage_times["paint"] = {"paint_lines": time.perf_counter() - start}
+        self.paint_stage_times(painter)
+
+    def paint_stage_times(self, painter):
+        """Debug overlay: the last profiled time of every stage, in ms."""
+        lines = []
+        for pipeline in ("render", "analysis", "paint"):
+            stages = self.stage_times.get(pipeline)
+            if stages:
+                lines.append(f"{pipeline}: {sum(stages.values()) * 1000:.1f} ms")
+                lines += [f"  {name:<16}{t * 1000:8.2f}" for name, t in stages.items()]
+        if not lines:
+            return
+        painter.setClipping(False)
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        font = QFont("Monospace")
+        font.setStyleHint(QFont.TypeWriter)
+        painter.setFont(font)
+        metrics = painter.fontMetrics()
+        width = max(metrics.horizontalAdvance(line) for line in lines) + 12
+        height = metrics.height() * len(lines) + 8
+        painter.fillRect(4, 4, width, height, QColor(0, 0, 0, 170))
+        painter.setPen(QColor(255, 255, 255))
+        for i, line in enumerate(lines):
+            painter.drawText(10, 8 + metrics.ascent() + i * metrics.height(), line)
+
+    def toggle_line_layer(self, _):
+        self.update_lines()
+
+    def update_lines(self):
+        """Polygon changed: repaint the label only, the composited frame stays cached."""
+        self.image_label.update()
+
+    def paint_lines(self, painter):
+        """Paint polygon lines and anchors as vectors over the frame on screen."""
+        if not (self.line_checkbox.isChecked() and self.anchors) or self.frame_view is None:
+            return
+        (x0, y0, x1, y1), (dw, dh) = self.frame_view
+        scale = dw / (x1 - x0)
+        left = (self.image_label.width() - dw) // 2
+        top = (self.image_label.height() - dh) // 2
+
+        def pt(p):  # pixel center in label coordinates
+            return QPointF(left + (p[0] + 0.5 - x0) * scale, top + (p[1] + 0.5 - y0) * scale)
+
+        green, yellow = QColor(0, 255, 0), QColor(255, 255, 0)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setClipRect(left, top, dw, dh)
+        painter.setPen(QPen(green, max(1.0, self.line_width * scale)))
+        painter.drawPolyline(*[pt(p) for p in self.anchors])
+        for ring in self.field_rings:
+            painter.drawPolyline(*[pt(p) for p in (*ring, ring[0])])
+        if self.temp_mouse_pos:
+            painter.setPen(QPen(yellow, max(1.0, self.preview_line_width * scale)))
+            painter.drawLine(pt(self.anchors[-1]), pt(self.temp_mouse_pos))
+        radius = max(1.0, self.anchor_radius * scale)
+        painter.setPen(Qt.NoPen)
+        for i, p in enumerate(self.anchors):
+            painter.setBrush(yellow if i == self.hovered_anchor_index else green)
+            painter.drawEllipse(pt(p), radius, radius)
+
+    def toggle_manual_layer(self, _):
+        self.invalidate("manual")
+        self.request_repaint()
+
+    def toggle_highlight_layer(self, _):
+        self.invalidate("highlight", "transient", "manual")
+        self.request_repaint()
+
+    def open_settings_dialog(self):
+        dlg = QDialog(self)
+        dlg.setWindowTitle("Settings")
+        layout = QVBoxLayout(dlg)
+
+        s_line_width_label = QLabel(f"Line width: {self.line_width}")
+        line_width_slider = QSlider(Qt.Horizontal)
+        line_width_slider.setMinimum(1)
+        line_width_slider.setMaximum(10)
+        line_width_slider.setValue(self.line_width)
+        line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        s_preview_line_width_label = QLabel(f"Preview line width: {self.preview_line_width}")
+        preview_line_width_slider = QSlider(Qt.Horizontal)
+        preview_line_width_slider.setMinimum(1)
+        preview_line_width_slider.setMaximum(10)
+        preview_line_width_slider.setValue(self.preview_line_width)
+        preview_line_width_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        s_anchor_radius_label = QLabel(f"Anchor radius: {self.anchor_radius}")
+        anchor_radius_slider = QSlider(Qt.Horizontal)
+        anchor_radius_slider.setMinimum(1)
+        anchor_radius_slider.setMaximum(20)
+        anchor_radius_slider.setValue(self.anchor_radius)
+        anchor_radius_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        s_text_size_label = QLabel(f"Text size: {self.text_size}")
+        text_size_slider = QSlider(Qt.Horizontal)
+        text_size_slider.setMinimum(6)
+        text_size_slider.setMaximum(24)
+        text_size_slider.setValue(self.text_size)
+        text_size_slider.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Fixed)
+
+        quick_settings_checkbox = QCheckBox("Show settings in tool panel")
+        quick_settings_checkbox.setChecked(self.quick_settings)
+
+        layout.addWidget(s_line_width_label)
+        layout.addWidget(line_width_slider)
+        layout.addWidget(s_preview_line_width_label)
+        layout.addWidget(preview_line_width_slider)
+        layout.addWidget(s_anchor_radius_label)
+        layout.addWidget(anchor_radius_slider)
+        layout.addWidget(s_text_size_label)
+        layout.addWidget(text_size_slider)
+        layout.addWidget(quick_settings_checkbox)
+
+        line_width_slider.valueChanged.connect(
+            lambda v: s_line_width_label.setText(f"Line width: {v}")
+        )
+        preview_line_width_slider.valueChanged.connect(
+            lambda v: s_preview_line_width_label.setText(f"Preview line width: {v}")
+        )
+        anchor_radius_slider.valueChanged.connect(
+            lambda v: s_anchor_radius_label.setText(f"Anchor radius: {v}")
+        )
+        text_size_slider.valueChanged.connect(
+            lambda v: s_text_size_label.setText(f"Text size: {v}")
+        )
+
+        # Button box
+        btns = QDialogButtonBox(
+            QDialogButtonBox.Ok | QDialogButtonBox.Apply | QDialogButtonBox.Cancel, parent=dlg
+        )
+        layout.addWidget(btns)
+
+        apply_button = btns.button(QDialogButtonBox.Apply)
+        if apply_button:
+            def _on_apply():
+                self.line_width_slider.setValue(line_width_slider.value())
+                self.preview_line_width_slider.setValue(preview_line_width_slider.value())
+                self.anchor_radius_slider.setValue(anchor_radius_slider.value())
+                self.text_size_slider.setValue(text_size_slider.value())
+                self.update_global_font()
+                if quick_settings_checkbox.isChecked():
+                    self.quick_settings = True
+                    self.settings.setValue("ui/quick_settings", True)
+                    self.line_width_label.show()
+                    self.line_width_slider.show()
+                    self.preview_line_width_label.show()
+                    self.preview_line_width_slider.show()
+                    self.anchor_radius_label.show()
+                    self.anchor_radius_slider.show()
+                    self.text_size_label.show()
+                    self.text_size_slider.show()
+                else:
+                    self.quick_settings = False
+                    self.settings.setValue("ui/quick_settings", False)
+                    self.line_width_label.hide()
+                    self.line_width_slider.hide()
+                    self.preview_line_width_label.hide()
+                    self.preview_line_width_slider.hide()
+                    self.anchor_radius_label.hide()
+                    self.anchor_radius_slider.hide()
+                    self.text_size_label.hide()
+                    self.text_size_slider.hide()
+
+            apply_button.clicked.connect(_on_apply)
+
+        # OK (call hook, then close)
+        def _on_ok():
+            self.line_width_slider.setValue(line_width_slider.value())
+            self.preview_line_width_slider.setValue(preview_line_width_slider.value())
+            self.anchor_radius_slider.setValue(anchor_radius_slider.value())
+            self.text_size_slider.setValue(text_size_slider.value())
+            self.update_global_font()
+            if quick_settings_checkbox.isChecked():
+                self.quick_settings = True
+                self.settings.setValue("ui/quick_settings", True)
+                self.line_width_label.show()
+                self.line_width_slider.show()
+                self.preview_line_width_label.show()
+                self.preview_line_width_slider.show()
+                self.anchor_radius_label.show()
+                self.anchor_radius_slider.show()
+                self.text_size_label.show()
+                self.text_size_slider.show()
+            else:
+                self.quick_settings = False
+                self.settings.setValue("ui/quick_settings", False)
+                self.line_width_label.hide()
+                self.line_width_slider.hide()
+                self.preview_line_width_label.hide()
+                self.preview_line_width_slider.hide()
+                self.anchor_radius_label.hide()
+                self.anchor_radius_slider.hide()
+                self.text_size_label.hide()
+                self.text_size_slider.hide()
+            dlg.accept()
+
+        btns.accepted.connect(_on_ok)
+
+        # Cancel (call hook, then close)
+        def _on_cancel():
+            dlg.reject()
+
+        btns.rejected.connect(_on_cancel)
+
+        dlg.exec_()
+        return None
+
+    # ---------- UX ----------
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_L:
+            self.toggle_checkbox.toggle()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MiddleButton and self.base_rgba is not None:
+            pos = self.image_label.mapFromGlobal(event.globalPos())
+            _, ((x0, y0, x1, y1), _) = self.map_to_image(pos)
+            self.pan_origin = (pos, ((x0 + x1) / 2, (y0 + y1) / 2))
+            return
+        if self.tool_mode == "color":
+            if event.button() == Qt.LeftButton and self.base_rgba is not None:
+                pos = self.image_label.mapFromGlobal(event.globalPos())
+                mapped = self.map_click_to_image_coords(pos)
+                if mapped:
+                    x, y = mapped
+                    self.picked_color = tuple(int(v) for v in self.base_rgba[y, x, :3])
+                    self.show_picked_color(self.picked_color)
+                    self.invalidate("highlight", "transient")
+                    self.request_repaint()
+                    self.toggle_checkbox.setChecked(True)
+                    self.pick_color_button.setChecked(False)
+                    self.remove_hint()
+                else:
+                    self.hint("Click was outside the image", True)
+        elif self.tool_mode == "plot":
+            if self.first_plot_point:
+                self.delete_line_button.show()
+                self.line_checkbox.show()
+                self.line_checkbox.setChecked(True)
+            if event.button() == Qt.LeftButton:
+                pos = self.image_label.mapFromGlobal(event.globalPos())
+                mapped = self.map_click_to_image_coords(pos)
+                if mapped:
+                    x, y = mapped
+                    if self.anchors:
+                        first_x, first_y = self.anchors[0]
+                        dist = np.hypot(x - first_x, y - first_y)
+                        if dist < self.point_distance:
+                            self.anchors.append((first_x, first_y))
+                            self.temp_mouse_pos = None
+                            self.update_lines()
+                            self.polygon_closed = True
+                            self.plot_line_button.setChecked(False)
+                            self.hint("Polygon closed", True)
+                    was_empty = not self.anchors
+                    self.anchors.append((x, y))
+                    if was_empty:
+                        self.first_plot_point = False
+                    if not self.polygon_closed:
+                        self.hint(f"Added anchor at: ({x}, {y})", True)
+                    self.update_lines()
+            elif event.button() == Qt.RightButton:
+                pos = self.image_label.mapFromGlobal(event.globalPos())
+                mapped = self.map_click_to_image_coords(pos)
+                if mapped:
+                    i = self.anchors.first_within(mapped, self.point_distance)
+                    if i is not None:
+                        removed = self.anchors.pop(i)
+                        self.update_lines()
+                        self.hint(f"Removed anchor at: {removed}", True)
+                        return
+        elif self.tool_mode == "manual":
+            pos = self.image_label.mapFromGlobal(event.globalPos())
+            mapped = self.map_click_to_image_coords(pos)
+            if not mapped:
+                return
+            x, y = mapped
+            if event.button() == Qt.LeftButton:
+                self.add_manual_patch((x, y))
+            elif event.button() == Qt.RightButton:
+                removed = self.remove_manual_patch_near((x, y))
+                if removed:
+                    self.hint(f"Removed manual patch near: {(x, y)}", True)
+        elif self.tool_mode == "transient_color":
+            if event.button() == Qt.LeftButton and self.base_rgba is not None:
+                pos = self.image_label.mapFromGlobal(event.globalPos())
+                mapped = self.map_click_to_image_coords(pos)
+                if mapped:
+                    x, y = mapped
+                    self.transient_color = tuple(int(v) for v in self.base_rgba[y, x, :3])
+                    self.show_transient_color(self.transient_color)
+                    self.invalidate("transient", "manual")
+                    self.request_repaint()
+                    self.transient_checkbox.setChecked(True)
+                    self.pick_transient_color_button.setChecked(False)
+                    self.remove_hint()
+
+    def show_picked_color(self, color):
+        r, g, b = color
+        hexv = f"#{r:02x}{g:02x}{b:02x}"
+        self.color_container.setStyleSheet(f"background-color: {hexv};")
+        self.color_label.setText(f"RGB: ({r}, {g}, {b})\nHEX: {hexv}")
+        self.color_parent.show()
+        self.color_label.show()
+
+    def show_transient_color(self, color):
+        r, g, b = color
+        hexv = f"#{r:02x}{g:02x}{b:02x}"
+        self.transient_color_container.setStyleSheet(f"background-color: {hexv};")
+        self.transient_color_label.setText(f"Transient color:\nRGB: {(r, g, b)}\nHEX: {hexv}")
+        self.transient_color_parent.show()
+        self.transient_color_label.show()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MiddleButton:
+            self.pan_origin = None
+        super().mouseReleaseEvent(event)
+
+    def pan_to(self, pos):
+        start, (cx, cy) = self.pan_origin
+        (x0, y0, x1, y1), (dw, dh) = self.view_geometry()
+        self.set_view_center(cx - (pos.x() - start.x()) * (x1 - x0) / dw,
+                             cy - (pos.y() - start.y()) * (y1 - y0) / dh)
+
+    def mouseMoveEvent(self, event):
+        if self.pan_origin is not None:
+            self.pan_to(self.image_label.mapFromGlobal(event.globalPos()))
+            return
+        if self.tool_mode == "plot" and self.anchors:
+            pos = self.image_label.mapFromGlobal(event.globalPos())
+            mapped = self.map_click_to_image_coords(pos)
+            if mapped:
+                self.temp_mouse_pos = mapped
+                self.hovered_anchor_index = self.anchors.first_within(mapped, self.point_distance)
+                self.update_lines()
+
+    def mouse_moved(self, event):
+        if self.pan_origin is not None:
+            self.pan_to(self.image_label.mapFromGlobal(event.globalPos()))
+            return
+        if self.tool_mode == "plot" and self.anchors:
+            pos = self.image_label.mapFromGlobal(event.globalPos())
+            mapped = self.map_click_to_image_coords(pos)
+            if mapped:
+                self.temp_mouse_pos = mapped
+                self.hovered_anchor_index = self.anchors.first_within(mapped, self.point_distance)
+                self.update_lines()
+
+    def resizeEvent(self, event):
+        self.request_repaint()
+        super().resizeEvent(event)
+
+    def closeEvent(self, event):
+        # Let a running render job stop before its signal object goes away
+        if self.render_cancel is not None:
+            self.render_cancel.set()
+        self.render_pool.clear()
+        self.render_pool.waitForDone()
+        self.cache_pool.waitForDone()  # finish pending result cache writes
+        super().closeEvent(event)
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.WindowStateChange:
+            self.request_repaint()
+        super().changeEvent(event)
+
+class ClickableLabel(QLabel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMouseTracking(True)
+        self.mouse_moved_callback = None
+        self.wheel_callback = None
+        self.paint_callback = None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.paint_callback and self.pixmap() is not None:
+            painter = QPainter(self)
+            self.paint_callback(painter)
+            painter.end()
+
+    def mouseMoveEvent(self, event):
+        if self.mouse_moved_callback:
+            self.mouse_moved_callback(event)
+
+    def wheelEvent(self, event):
+        if self.wheel_callback:
+            self.wheel_callback(event)
+        else:
+            super().wheelEvent(event)
+
+class RenderCancelled(Exception):
+    pass
+
+class CacheJob(QRunnable):
+    """Runs fn() on the cache worker."""
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+
+    def run(self):
+        self.fn()
+
+class RenderSignals(QObject):
+    # generation, final RGBA frame, cache entries, layer versions the frame was built from, StageTimer
+    finished = pyqtSignal(int, object, object, object, object)
+
+class RenderJob(QRunnable):
+    """Builds dirty layers and composites one frame on a worker thread.
+
+    Works only on the parameter snapshot it was created with (never on widgets)
+    and stops at the next stage boundary once its cancel event is set. Masks
+    are built at full resolution; the frame is composited at display size from
+    the pyramid levels matching the view.
+    """
+    def __init__(self, generation, cancel, signals, pyramid, distances, params, dirty, versions, cache, view,
+                 coverage=None, regions=None, timer=engine.NO_TIMER, load_mask=None):
+        super().__init__()
+        self.generation = generation
+        self.cancel = cancel
+        self.signals = signals
+        self.pyramid = pyramid
+        self.distances = distances
+        self.params = params
+        self.dirty = dirty
+        self.versions = versions
+        self.cache = cache
+        self.view = view
+        self.coverage = coverage
+        self.regions = regions
+        self.timer = timer
+        self.load_mask = load_mask
+
+    def check(self):
+        if self.cancel.is_set():
+            raise RenderCancelled()
+
+    def run(self):
+        try:
+            final, cache = self.render()
+        except RenderCancelled:
+            return
+        self.signals.finished.emit(self.generation, final, cache, self.versions, self.timer)
+
+    def render(self):
+        cache, dirty, timer = self.cache, self.dirty, self.timer
+        timer.lap("queued")
+        updated = build_layers(self.pyramid.base, self.params, cache, dirty, self.distances, self.check,
+                               self.coverage, self.regions, timer, self.load_mask)
+
+        # --- PYRAMID of the class labels (levels are built on demand) ---
+        pyramid = cache["labels_pyramid"]
+        if pyramid is None or pyramid.base is not cache["class_labels"]:
+            cache["labels_pyramid"] = engine.ImagePyramid(cache["class_labels"], engine.downsample_labels)
+        else:
+            for bounds in updated:
+                pyramid.refresh(bounds)
+        timer.lap("pyramids")
+
+        # --- VIEW: sample base and masks at display size, composite there ---
+        rect, (dw, dh) = self.view
+        if cache["view_base"] is None or cache["view_base"][0] != self.view:
+            cache["view_base"] = (self.view, self.pyramid.view(rect, dw, dh))
+        self.check()
+        labels = cache["labels_pyramid"].view(rect, dw, dh)
+        timer.lap("sample_view")
+        self.check()
+        final = engine.compose_labels(cache["view_base"][1], labels, self.params.overlay_colors())
+        timer.lap("blend")
+        return final, cache
+
+
+def build_layers(base_arr, params, cache, dirty, distances=None, check=None, coverage=None, regions=None,
+                 timer=engine.NO_TIMER, load_mask=None):
+    """Rebuild the dirty class masks in cache and restack the class-label image.
+
+    Auto class masks are cached before priority is resolved, so a slider only
+    rebuilds its own class; engine.stack_class_labels then resolves priority
+    (highlight > transient > further classes > manual) while painting the
+    labels. The further classes have no widgets and are rebuilt together. With a
+    PatchCoverage the manual layer comes from its counts instead of the patch
+    list; when only patches changed, just their `regions` (bounds, None =
+    everything) are restacked in place. load_mask(name, layer) may return a
+    stored mask of an active auto class (or None), which is then not built.
+    Returns the regions updated in place.
+    """
+    check = check or (lambda: None)
+    h, w = base_arr.shape[:2]
+    rebuilt = False
+
+    def build(name, layer):
+        mask = None
+        if load_mask is not None and layer.active:
+            mask = load_mask(name, layer)
+        if mask is None:
+            mask = engine.build_color_layer(base_arr, layer, distances)
+        timer.lap(f"build_{name}")
+        return mask
+
+    # --- AUTO CLASSES ---
+    for name in ("highlight", "transient"):
+        if dirty[name]:
+            cache[f"{name}_mask"] = build(name, getattr(params, name))
+            rebuilt = True
+        check()
+    if dirty["classes"]:
+        class_masks = {}
+        for c in params.classes:
+            class_masks[c.name] = build(c.name, c.layer)
+            check()
+        cache["class_masks"] = class_masks
+        rebuilt = True
+
+    # --- CLASS LABELS (manual below the auto classes) ---
+    updated = []
+    if rebuilt or dirty["manual"] or cache["class_labels"] is None:
+        masks = [cache["highlight_mask"], cache["transient_mask"]]
+        masks += [cache["class_masks"][c.name] for c in params.classes]
+        if not params.manual_enabled:
+            cache["class_labels"] = engine.stack_class_labels(masks)
+        elif coverage is None:
+            cache["class_labels"] = engine.stack_class_labels(
+                masks, engine.combine_patch_masks((h, w), params.manual_patches))
+        elif regions and None not in regions and not rebuilt and cache["class_labels"] is not None:
+            # only patches changed: restack their boxes in place
+            for x0, y0, x1, y1 in regions:
+                cache["class_labels"][y0:y1, x0:x1] = engine.stack_class_labels(
+                    [m[y0:y1, x0:x1] for m in masks], coverage.mask((x0, y0, x1, y1)))
+            updated = list(regions)
+        else:
+            cache["class_labels"] = engine.stack_class_labels(masks, coverage.mask())
+        timer.lap("build_labels")
+    check()
+    return updated
+
+
+def draw_lines(shape_hw, lines):
+    """Full-resolution RGBA overlay with the polygon lines/anchors (for exports)."""
+    h, w = shape_hw
+    overlay = np.zeros((h, w, 4), dtype=np.uint8)
+    anchors = lines["anchors"]
+    if not (lines["enabled"] and anchors):
+        return overlay
+
+    lw = lines["line_width"]
+    for i in range(1, len(anchors)):
+        cv2.line(overlay, anchors[i - 1], anchors[i], (0, 255, 0, 255), lw)
+    for ring in lines.get("rings", ()):
+        cv2.polylines(overlay, [np.array(ring, dtype=np.int32)], True, (0, 255, 0, 255), lw)
+    if lines["temp_mouse_pos"]:
+        plw = lines["preview_line_width"]
+        cv2.line(overlay, anchors[-1], lines["temp_mouse_pos"], (255, 255, 0, 255), plw)
+    ar = lines["anchor_radius"]
+    for i, anchor in enumerate(anchors):
+        color = (255, 255, 0, 255) if i == lines["hovered_anchor_index"] else (0, 255, 0, 255)
+        cv2.circle(overlay, anchor, ar, color, -1)
+    return overlay
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    window = SoilErosionUI()
+    window.show()
+    sys.exit(app.exec_())
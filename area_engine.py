@@ -0,0 +1,1119 @@
+"""Qt-free analysis engine.
+
+Everything the GUI computes (color masks, strict filtering, manual patches and
+the field analysis) lives here so batch and server jobs can import it without
+PyQt5 or a running QApplication and get exactly the same numbers.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import bisect, threading, time
+import numpy as np, cv2
+
+HIGHLIGHT_COLOR = (204, 199, 34)  # gold
+TRANSIENT_COLOR = (186, 113, 0)   # #ba7100
+MANUAL_COLOR = (0, 0, 255)
+# overlay colors of further classes without their own, in list order
+CLASS_COLORS = ((220, 20, 60), (255, 140, 0), (46, 139, 87), (138, 43, 226), (0, 191, 255), (255, 105, 180))
+OVERLAY_ALPHA = 150
+# names a further class cannot take (result / row keys)
+RESERVED_NAMES = ("field_pixels", "highlight", "transient", "manual", "combined", "image", "field", "error")
+METRICS = ("l1", "chebyshev", "euclidean")
+MAX_CLASSES = 255  # class labels of a uint8 image: auto classes and manual
+
+
+# ---------- Parameters / results ----------
+@dataclass
+class LayerParams:
+    """Settings of one auto layer. `strict` is the strict level, None = off."""
+    color: Optional[Tuple[int, int, int]] = None
+    sensitivity: int = 100
+    strict: Optional[int] = None
+    enabled: bool = True
+    metric: str = "l1"
+
+    @property
+    def active(self):
+        return self.enabled and self.color is not None
+
+    @classmethod
+    def from_dict(cls, d):
+        color = d.get("color")
+        strict = d.get("strict")
+        return cls(
+            color=tuple(int(v) for v in color) if color is not None else None,
+            sensitivity=int(d.get("sensitivity", 100)),
+            strict=int(strict) if strict is not None else None,
+            enabled=bool(d.get("enabled", True)),
+            metric=str(d.get("metric", "l1")),
+        )
+
+    def to_dict(self):
+        return {
+            "color": list(self.color) if self.color is not None else None,
+            "sensitivity": self.sensitivity,
+            "strict": self.strict,
+            "enabled": self.enabled,
+            "metric": self.metric,
+        }
+
+
+@dataclass
+class ColorClass:
+    """A named auto layer of the class stack and the color it is drawn in (None = from CLASS_COLORS)."""
+    name: str
+    layer: LayerParams = field(default_factory=LayerParams)
+    overlay: Optional[Tuple[int, int, int]] = None
+
+    @classmethod
+    def from_dict(cls, d):
+        overlay = d.get("overlay")
+        return cls(
+            name=str(d["name"]),
+            layer=LayerParams.from_dict(d),
+            overlay=tuple(int(v) for v in overlay) if overlay is not None else None,
+        )
+
+    def to_dict(self):
+        return {"name": self.name, **self.layer.to_dict(),
+                "overlay": list(self.overlay) if self.overlay is not None else None}
+
+
+@dataclass
+class ManualPatch:
+    """A manual patch; mask covers only bounds (x0, y0, x1, y1) of the image."""
+    center: Tuple[int, int]
+    radius: int
+    sensitivity: int
+    strict: int
+    mask: np.ndarray
+    bounds: Tuple[int, int, int, int]
+
+    def overlap(self, acc, x0=0, y0=0):
+        """(acc view, patch mask view) where the patch meets acc, an array covering
+        the image window starting at (x0, y0); None if they do not meet."""
+        px0, py0, px1, py1 = self.bounds
+        cx0, cy0 = max(px0, x0), max(py0, y0)
+        cx1, cy1 = min(px1, x0 + acc.shape[1]), min(py1, y0 + acc.shape[0])
+        if cx0 >= cx1 or cy0 >= cy1:
+            return None
+        return (acc[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0],
+                self.mask[cy0 - py0:cy1 - py0, cx0 - px0:cx1 - px0])
+
+    def paint(self, acc, x0=0, y0=0):
+        """OR the patch into acc, a bool mask of the image window starting at (x0, y0)."""
+        views = self.overlap(acc, x0, y0)
+        if views is not None:
+            dst, src = views
+            dst |= src
+        return acc
+
+
+@dataclass
+class AnalysisParams:
+    highlight: LayerParams = field(default_factory=LayerParams)
+    transient: LayerParams = field(default_factory=LayerParams)
+    manual_enabled: bool = False
+    manual_patches: List[ManualPatch] = field(default_factory=list)
+    polygon: List[Tuple[int, int]] = field(default_factory=list)
+    # Further rings of the field (holes, other parts of a multipolygon),
+    # filled together with polygon by the even-odd rule
+    rings: List[List[Tuple[int, int]]] = field(default_factory=list)
+    # Further color classes, below transient and above manual in priority
+    classes: List[ColorClass] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, d):
+        """Build params from a profile dict (manual patches are GUI-only)."""
+        return cls(
+            highlight=LayerParams.from_dict(d.get("highlight") or {"enabled": False}),
+            transient=LayerParams.from_dict(d.get("transient") or {"enabled": False}),
+            polygon=[(int(x), int(y)) for x, y in d.get("polygon") or []],
+            rings=[[(int(x), int(y)) for x, y in ring] for ring in d.get("rings") or []],
+            classes=[ColorClass.from_dict(c) for c in d.get("classes") or []],
+        )
+
+    def to_dict(self):
+        """Profile dict of the params (without manual patches), the inverse of from_dict."""
+        return {
+            "highlight": self.highlight.to_dict(),
+            "transient": self.transient.to_dict(),
+            "polygon": [list(v) for v in self.polygon],
+            "rings": [[list(v) for v in ring] for ring in self.rings],
+            "classes": [c.to_dict() for c in self.classes],
+        }
+
+    def color_classes(self):
+        """Every auto class in priority order: highlight, transient, then `classes`.
+
+        Class i gets label i + 1 in a class-label image, manual patches the
+        label after the last class (see manual_label).
+        """
+        names = [c.name for c in self.classes]
+        clash = [n for n in names if n in RESERVED_NAMES or names.count(n) > 1]
+        if clash:
+            raise ValueError(f"Class names must be unique and not one of {', '.join(RESERVED_NAMES)}: {clash[0]}")
+        if len(self.classes) > MAX_CLASSES - 3:
+            raise ValueError(f"At most {MAX_CLASSES - 3} further classes")
+        return [ColorClass("highlight", self.highlight, HIGHLIGHT_COLOR),
+                ColorClass("transient", self.transient, TRANSIENT_COLOR), *self.classes]
+
+    @property
+    def manual_label(self):
+        return len(self.classes) + 3
+
+    def overlay_colors(self):
+        """Overlay color of every class label (1 .. manual_label), in label order."""
+        extra = [c.overlay or CLASS_COLORS[i % len(CLASS_COLORS)] for i, c in enumerate(self.classes)]
+        return [HIGHLIGHT_COLOR, TRANSIENT_COLOR, *extra, MANUAL_COLOR]
+
+
+@dataclass
+class Field:
+    """A named field boundary in pixel coordinates: outer ring plus further rings."""
+    name: str
+    polygon: List[Tuple[int, int]]
+    rings: List[List[Tuple[int, int]]] = field(default_factory=list)
+
+
+@dataclass
+class AnalysisResult:
+    """Pixel counts inside the field. A layer count is None when the layer is off.
+
+    class_pixels holds the counts of the further classes by name.
+    """
+    field_pixels: int
+    highlight_pixels: Optional[int]
+    transient_pixels: Optional[int]
+    manual_pixels: Optional[int]
+    combined_pixels: int
+    class_pixels: Dict[str, Optional[int]] = field(default_factory=dict)
+
+    def _percent(self, count):
+        if count is None:
+            return None
+        return (count / self.field_pixels) * 100 if self.field_pixels else 0
+
+    @property
+    def highlight(self):
+        return self._percent(self.highlight_pixels)
+
+    @property
+    def transient(self):
+        return self._percent(self.transient_pixels)
+
+    @property
+    def manual(self):
+        return self._percent(self.manual_pixels)
+
+    @property
+    def combined(self):
+        return self._percent(self.combined_pixels)
+
+    def as_dict(self):
+        return {
+            "field_pixels": self.field_pixels,
+            "highlight": self.highlight,
+            "transient": self.transient,
+            **{name: self._percent(count) for name, count in self.class_pixels.items()},
+            "manual": self.manual,
+            "combined": self.combined,
+        }
+
+
+# ---------- Images ----------
+def load_rgba(file_path):
+    """Decode an image file into an RGBA uint8 array (same layout as the GUI uses)."""
+    img = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError(f"Cannot read image: {file_path}")
+    if img.dtype != np.uint8:
+        img = (img >> 8).astype(np.uint8) if img.dtype == np.uint16 else img.astype(np.uint8)
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2RGBA)
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
+
+
+# ---------- Profiling ----------
+class StageTimer:
+    """Wall time of consecutive pipeline stages.
+
+    `lap(name)` ends the stage that began at the previous lap (or when the
+    timer was made) and adds its duration to `stages[name]`.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.last = self.start = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + (now - self.last)
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.start
+
+
+class _NoTimer:
+    """Stand-in for StageTimer when profiling is off."""
+    stages = {}
+    total = 0.0
+
+    def lap(self, name):
+        pass
+
+
+NO_TIMER = _NoTimer()
+
+
+# ---------- Kernels ----------
+_LEVELS = np.arange(256, dtype=np.int32)
+# ceil(sqrt(n)) for every possible sum of squared channel differences
+_CEIL_SQRT = np.ceil(np.sqrt(np.arange(3 * 255 * 255 + 1, dtype=np.float64))).astype(np.uint16)
+
+
+def _channel_planes(image_arr, target_color):
+    """(uint8 plane, target value) per RGB channel; alpha is never read."""
+    for c, t in enumerate(target_color):
+        yield cv2.extractChannel(image_arr, c), int(t)
+
+
+def color_distance(image_arr, target_color, metric="l1"):
+    """uint16 distance of every pixel to target_color.
+
+    Works on uint8 planes through 256-entry lookup tables, so no wide
+    h x w x 3 temporaries are created. Euclidean distances are rounded up,
+    which keeps `distance <= tolerance` exact for integer tolerances.
+    """
+    if metric == "l1":
+        dist = None
+        for plane, t in _channel_planes(image_arr, target_color):
+            d = cv2.LUT(plane, np.abs(_LEVELS - t).astype(np.uint8))
+            dist = d.astype(np.uint16) if dist is None else cv2.add(dist, d, dtype=cv2.CV_16U)
+        return dist
+    if metric == "chebyshev":
+        dist = None
+        for plane, t in _channel_planes(image_arr, target_color):
+            d = cv2.LUT(plane, np.abs(_LEVELS - t).astype(np.uint8))
+            dist = d if dist is None else cv2.max(dist, d)
+        return dist.astype(np.uint16)
+    if metric == "euclidean":
+        sq = None
+        for plane, t in _channel_planes(image_arr, target_color):
+            d = cv2.LUT(plane, ((_LEVELS - t) ** 2).astype(np.uint16)).astype(np.uint32)
+            sq = d if sq is None else np.add(sq, d, out=sq)
+        return _CEIL_SQRT[sq]
+    raise ValueError(f"Unknown color metric: {metric}")
+
+
+def get_color_mask(image_arr, target_color, tolerance, metric="l1"):
+    return color_distance(image_arr, target_color, metric) <= tolerance
+
+
+class DistanceCache:
+    """Distance maps of one image, keyed by (color, metric).
+
+    The distance map is the expensive part of a color mask and does not depend
+    on the tolerance, so once a color is picked every sensitivity change is a
+    single comparison against the cached uint16 map. Least recently used maps
+    are dropped beyond max_entries (2 bytes per pixel each). Safe to share
+    between the GUI thread and render workers: maps are computed outside the
+    lock, so a lookup never waits for another color's map (two threads asking
+    for the same new color may both compute it).
+    """
+
+    def __init__(self, image_arr, max_entries=2):
+        self.image_arr = image_arr
+        self.max_entries = max_entries
+        self.maps = OrderedDict()
+        self.lock = threading.Lock()
+
+    def distance(self, color, metric="l1"):
+        key = (tuple(int(v) for v in color), metric)
+        with self.lock:
+            dist = self.maps.get(key)
+            if dist is not None:
+                self.maps.move_to_end(key)
+                return dist
+        dist = color_distance(self.image_arr, key[0], metric)
+        with self.lock:
+            self.maps[key] = dist
+            self.maps.move_to_end(key)
+            while len(self.maps) > self.max_entries:
+                self.maps.popitem(last=False)
+        return dist
+
+    def peek(self, color, metric="l1"):
+        """The cached map of color, or None (never computes one)."""
+        key = (tuple(int(v) for v in color), metric)
+        with self.lock:
+            return self.maps.get(key)
+
+    def mask(self, color, tolerance, metric="l1"):
+        return self.distance(color, metric) <= tolerance
+
+
+def strict_kernel(level):
+    k = max(1, int(2 * level + 1))
+    return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+
+
+def strict_halo(level):
+    """Border width after which MORPH_OPEN with the strict kernel is exact in a crop."""
+    k = max(1, int(2 * level + 1))
+    return 2 * (k // 2)
+
+
+def strict_min_size(level, total_pixels):
+    """Smallest component area kept by the strict filter on an image of total_pixels."""
+    min_frac = 0.001 + 0.004 * ((level - 1) / 9.0)
+    return int(total_pixels * min_frac)
+
+
+def apply_strict_filter(mask: np.ndarray, level: int) -> np.ndarray:
+    m = (mask.astype(np.uint8) > 0).astype(np.uint8)
+    opened = cv2.morphologyEx(m, cv2.MORPH_OPEN, strict_kernel(level))
+    min_size = strict_min_size(level, opened.size)
+    num, labels, stats, _ = cv2.connectedComponentsWithStats(opened, connectivity=8)
+    # keep/drop decision per label, applied to the label image in one gather
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_size
+    keep[0] = False  # background
+    return keep[labels]
+
+
+def _grow(bounds, margin, shape):
+    x0, y0, x1, y1 = bounds
+    return max(0, x0 - margin), max(0, y0 - margin), min(shape[1], x1 + margin), min(shape[0], y1 + margin)
+
+
+def apply_strict_filter_window(mask_fn, shape, level, bounds):
+    """apply_strict_filter restricted to bounds (x0, y0, x1, y1) of an image of `shape`.
+
+    mask_fn(x0, y0, x1, y1) returns the unfiltered mask of a window. The
+    window starts at bounds plus the opening halo. Only the core of the window,
+    where the opening is exact, is labelled. A core component that is large
+    enough, or that does not touch the core's inner edges, gets the same
+    decision as on the whole image. When a small component touching an edge
+    reaches into bounds, the window is doubled and the pass retried. The
+    result equals the matching crop of the whole-image filter.
+    """
+    halo = strict_halo(level)
+    min_size = strict_min_size(level, shape[0] * shape[1])
+    bx0, by0, bx1, by1 = bounds
+    margin = max(2 * halo, 32)
+    while True:
+        wx0, wy0, wx1, wy1 = _grow(bounds, margin + halo, shape)
+        if (wx0, wy0, wx1, wy1) == (0, 0, shape[1], shape[0]):
+            full = apply_strict_filter(mask_fn(0, 0, shape[1], shape[0]), level)
+            return full[by0:by1, bx0:bx1]
+        m = mask_fn(wx0, wy0, wx1, wy1).astype(np.uint8)
+        opened = cv2.morphologyEx(m, cv2.MORPH_OPEN, strict_kernel(level))
+        # core: drop the inexact halo except where the window meets the image border
+        cx0, cy0, cx1, cy1 = _grow((wx0, wy0, wx1, wy1), -halo, shape)
+        cx0, cy0 = (0 if wx0 == 0 else cx0), (0 if wy0 == 0 else cy0)
+        cx1, cy1 = (shape[1] if wx1 == shape[1] else cx1), (shape[0] if wy1 == shape[0] else cy1)
+        core = np.ascontiguousarray(opened[cy0 - wy0:cy1 - wy0, cx0 - wx0:cx1 - wx0])
+        num, labels, stats, _ = cv2.connectedComponentsWithStats(core, connectivity=8)
+
+        left, top = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+        right, bottom = left + stats[:, cv2.CC_STAT_WIDTH], top + stats[:, cv2.CC_STAT_HEIGHT]
+        keep = stats[:, cv2.CC_STAT_AREA] >= min_size
+        at_edge = (((left == 0) & (cx0 > 0)) | ((top == 0) & (cy0 > 0)) |
+                   ((right == core.shape[1]) & (cx1 < shape[1])) |
+                   ((bottom == core.shape[0]) & (cy1 < shape[0])))
+        in_bounds = ((left < bx1 - cx0) & (right > bx0 - cx0) &
+                     (top < by1 - cy0) & (bottom > by0 - cy0))
+        uncertain = ~keep & at_edge & in_bounds
+        uncertain[0] = False
+        if not uncertain.any():
+            keep[0] = False
+            return keep[labels[by0 - cy0:by1 - cy0, bx0 - cx0:bx1 - cx0]]
+        margin *= 2
+
+
+def create_highlight_overlay(mask, highlight_color=HIGHLIGHT_COLOR):
+    h, w = mask.shape
+    pixel = np.array([*highlight_color, OVERLAY_ALPHA], dtype=np.uint8).view("<u4")[0]
+    return (mask * pixel).astype("<u4", copy=False).view(np.uint8).reshape(h, w, 4)
+
+
+# ---------- Compositing ----------
+# Fixed-point "over" blending, (dst * (255 - a) + src * a) // 255 per channel.
+# A pixel is one little-endian uint32 word split into two 16-bit lanes (R|B and
+# G|A); 255 * 255 fits a lane, so four channels take two integer multiplies and
+# no float buffers. Rows are processed in cache-sized chunks.
+_LANES = np.uint32(0x00FF00FF)
+_HIGH_LANES = np.uint32(0xFF00FF00)
+_ROUND = np.uint32(0x00010001)
+_RGB = np.uint32(0x00FFFFFF)
+_CHUNK_PIXELS = 1 << 18
+
+
+def _over_rows(dst, src, out, max_alpha):
+    d = dst.view("<u4")[..., 0]
+    s = src.view("<u4")[..., 0]
+    a = s >> 24
+    ia = 255 - a
+    lo = (d & _LANES) * ia
+    lo += (s & _LANES) * a
+    hi = ((d >> 8) & _LANES) * ia
+    hi += ((s >> 8) & _LANES) * a
+    # floor(x / 255) per lane: (x + (x >> 8) + 1) >> 8
+    lo += ((lo >> 8) & _LANES) + _ROUND
+    lo >>= 8
+    lo &= _LANES
+    hi += ((hi >> 8) & _LANES) + _ROUND
+    hi &= _HIGH_LANES
+    lo |= hi
+    if max_alpha:
+        lo &= _RGB
+        lo |= np.maximum(d >> 24, a) << 24
+    out.view("<u4")[..., 0] = lo
+
+
+def _over(dst, src, out, max_alpha=False):
+    """src over dst (both h x w x 4 uint8) into out, which may be dst itself."""
+    h, w = dst.shape[:2]
+    rows = max(1, _CHUNK_PIXELS // max(1, w))
+    for y in range(0, h, rows):
+        _over_rows(np.ascontiguousarray(dst[y:y+rows]), np.ascontiguousarray(src[y:y+rows]),
+                   out[y:y+rows], max_alpha)
+    return out
+
+
+def merge_overlay_with_image(base_rgba, overlay_rgba):
+    """Overlay composited over the base image. Neither input is modified."""
+    if base_rgba.shape[2] == 3:  # just in case
+        base_rgba = np.dstack((base_rgba, np.full(base_rgba.shape[:2], 255, dtype=np.uint8)))
+    # Zero-alpha overlay pixels contribute nothing, whatever their color
+    return _over(base_rgba, overlay_rgba, np.empty(base_rgba.shape[:2] + (4,), dtype=np.uint8))
+
+
+def label_palette(colors, alpha=OVERLAY_ALPHA):
+    """256-entry RGBA palette (one uint32 word each) of a class-label image:
+    colors[i] for label i + 1, transparent for 0 and unused labels.
+
+    The entries are the colors blended onto an empty overlay, as the
+    per-class RGBA overlays used to be, so frames look the same.
+    """
+    src = np.zeros((1, 256, 4), dtype=np.uint8)
+    for value, color in enumerate(colors, 1):
+        src[0, value] = (*color, alpha)
+    palette = np.zeros((1, 256, 4), dtype=np.uint8)
+    return _over(palette, src, palette, max_alpha=True).view("<u4").reshape(256)
+
+
+def compose_labels(base_rgba, labels, colors, extra_overlay=None):
+    """Class labels (colors[i] for label i + 1) and an optional extra RGBA overlay
+    blended over base_rgba.
+
+    No RGBA overlay is allocated: each chunk of rows gathers its colors from
+    label_palette and is blended straight away.
+    """
+    if base_rgba.shape[2] == 3:  # just in case
+        base_rgba = np.dstack((base_rgba, np.full(base_rgba.shape[:2], 255, dtype=np.uint8)))
+    palette = label_palette(colors)
+    h, w = labels.shape
+    out = np.empty((h, w, 4), dtype=np.uint8)
+    rows = max(1, _CHUNK_PIXELS // max(1, w))
+    for y in range(0, h, rows):
+        src = np.take(palette, labels[y:y+rows]).view(np.uint8).reshape(-1, w, 4)
+        if extra_overlay is not None:
+            _over_rows(src, np.ascontiguousarray(extra_overlay[y:y+rows]), src, True)
+        _over_rows(np.ascontiguousarray(base_rgba[y:y+rows]), src, out[y:y+rows], False)
+    return out
+
+
+# ---------- Display sampling ----------
+def fit_size(w, h, vw, vh):
+    """(width, height) of a w x h image fitted into vw x vh, keeping the aspect ratio.
+
+    Same rounding as QSize.scaled(..., Qt.KeepAspectRatio).
+    """
+    rw = vh * w // h
+    if rw <= vw:
+        return max(1, rw), max(1, vh)
+    return max(1, vw), max(1, vw * h // w)
+
+
+MAX_ZOOM = 64.0  # relative to fitting the whole image
+
+
+def view_geometry(w, h, vw, vh, zoom=1.0, center=None):
+    """Visible image rect (x0, y0, x1, y1) and display size (dw, dh) of a view.
+
+    zoom is relative to fitting the whole w x h image into vw x vh; center
+    (image coordinates, default the image center) is clamped so the view
+    stays on the image.
+    """
+    if zoom <= 1.0:
+        return (0.0, 0.0, float(w), float(h)), fit_size(w, h, vw, vh)
+    scale = min(vw / w, vh / h) * zoom
+    vis_w, vis_h = min(float(w), vw / scale), min(float(h), vh / scale)
+    cx, cy = center if center is not None else (w / 2, h / 2)
+    x0 = min(max(cx - vis_w / 2, 0.0), w - vis_w)
+    y0 = min(max(cy - vis_h / 2, 0.0), h - vis_h)
+    size = (max(1, int(round(vis_w * scale))), max(1, int(round(vis_h * scale))))
+    return (x0, y0, x0 + vis_w, y0 + vis_h), size
+
+
+def view_indices(shape, rect, dw, dh, factor=1):
+    """Nearest-neighbour rows/cols (pixel centers) of a dw x dh view of rect.
+
+    rect is in full-resolution coordinates; shape/factor describe the level
+    being sampled (factor full-resolution pixels per level pixel).
+    """
+    x0, y0, x1, y1 = rect
+    rows = np.floor((y0 + (np.arange(dh) + 0.5) * ((y1 - y0) / dh)) / factor).astype(np.intp)
+    cols = np.floor((x0 + (np.arange(dw) + 0.5) * ((x1 - x0) / dw)) / factor).astype(np.intp)
+    return np.clip(rows, 0, shape[0] - 1), np.clip(cols, 0, shape[1] - 1)
+
+
+def sample_view(arr, rows, cols):
+    """arr at the given rows/cols; on a memory map only the sampled rows are read."""
+    return np.ascontiguousarray(arr[rows][:, cols])
+
+
+# ---------- Pyramids ----------
+PYRAMID_STRIP_PIXELS = 1 << 22
+
+
+def _strips(arr, factor):
+    """Row strips of arr (heights a multiple of factor), padded at the right/bottom
+    edge to a multiple of factor, with the output row they start at."""
+    h, w = arr.shape[:2]
+    rows = max(factor, PYRAMID_STRIP_PIXELS // max(1, w) // factor * factor)
+    pad_w = -w % factor
+    for y in range(0, h, rows):
+        strip = np.asarray(arr[y:y+rows])
+        pad_h = -strip.shape[0] % factor
+        yield y // factor, strip, pad_h, pad_w
+
+
+def downsample_mean(arr, factor):
+    """factor x factor box average of an image (edges replicated), a strip at a time."""
+    h, w = arr.shape[:2]
+    out = np.empty((-(-h // factor), -(-w // factor)) + arr.shape[2:], dtype=arr.dtype)
+    for oy, strip, pad_h, pad_w in _strips(arr, factor):
+        if pad_h or pad_w:
+            strip = cv2.copyMakeBorder(strip, 0, pad_h, 0, pad_w, cv2.BORDER_REPLICATE)
+        sh, sw = strip.shape[:2]
+        small = cv2.resize(strip, (sw // factor, sh // factor), interpolation=cv2.INTER_AREA)
+        out[oy:oy + small.shape[0]] = small
+    return out
+
+
+def downsample_max(mask, factor):
+    """factor x factor max pooling of a mask, so thin features survive zooming out."""
+    h, w = mask.shape
+    out = np.empty((-(-h // factor), -(-w // factor)), dtype=mask.dtype)
+    for oy, strip, pad_h, pad_w in _strips(mask, factor):
+        if pad_h or pad_w:
+            strip = np.pad(strip, ((0, pad_h), (0, pad_w)))
+        sh, sw = strip.shape
+        pooled = strip.reshape(sh // factor, factor, sw // factor, factor).max(axis=(1, 3))
+        out[oy:oy + pooled.shape[0]] = pooled
+    return out
+
+
+# 0 stays 0 and label l <-> 256 - l, so the highest-priority class has the largest value
+_LABEL_RANK = np.array([0] + [256 - l for l in range(1, 256)], dtype=np.uint8)
+
+
+def downsample_labels(labels, factor):
+    """factor x factor pooling of a class-label image that keeps each block's highest-priority class."""
+    return cv2.LUT(downsample_max(cv2.LUT(labels, _LABEL_RANK), factor), _LABEL_RANK)
+
+
+class ImagePyramid:
+    """Power-of-two resolution levels of an image or mask; level 0 is the array itself.
+
+    Levels are built on first use from the nearest finer level that exists,
+    so a fitted view of a huge image only ever builds the level it shows.
+    Views sample the coarsest level that still has at least one pixel per
+    display pixel, which keeps display cost independent of the source size.
+    Safe to share between the GUI thread and render workers: levels are built
+    outside the lock and published under it, so reading a built level never
+    waits for another being built.
+    """
+
+    def __init__(self, arr, downsample=downsample_mean):
+        self.downsample = downsample
+        self.levels = {0: arr}
+        self.depth = max(1, int(min(arr.shape[:2])).bit_length())
+        self.lock = threading.Lock()
+        self.version = 0  # bumped by refresh; a level built across one is built again
+
+    @property
+    def base(self):
+        return self.levels[0]
+
+    def level(self, k):
+        k = min(max(0, k), self.depth - 1)
+        while True:
+            with self.lock:
+                arr = self.levels.get(k)
+                if arr is not None:
+                    return arr
+                finer = max(j for j in self.levels if j < k)
+                src, version = self.levels[finer], self.version
+            arr = self.downsample(src, 1 << (k - finer))
+            with self.lock:
+                if self.version == version:
+                    return self.levels.setdefault(k, arr)
+
+    def refresh(self, bounds):
+        """Rebuild every built level over bounds (x0, y0, x1, y1) after level 0 changed there."""
+        x0, y0, x1, y1 = bounds
+        base = self.levels[0]
+        h, w = base.shape[:2]
+        with self.lock:
+            self.version += 1
+            for k, arr in self.levels.items():
+                if k == 0:
+                    continue
+                f = 1 << k
+                lx0, ly0, lx1, ly1 = x0 // f, y0 // f, -(-x1 // f), -(-y1 // f)
+                arr[ly0:ly1, lx0:lx1] = self.downsample(base[ly0 * f:min(h, ly1 * f), lx0 * f:min(w, lx1 * f)], f)
+
+    def level_for(self, rect, dw, dh):
+        """Level to sample for a dw x dh view of rect."""
+        step = min((rect[2] - rect[0]) / dw, (rect[3] - rect[1]) / dh)
+        return min(max(0, int(np.floor(np.log2(step)))) if step >= 2 else 0, self.depth - 1)
+
+    def view(self, rect, dw, dh):
+        """dw x dh nearest-neighbour sample of rect (full-resolution coordinates)."""
+        k = self.level_for(rect, dw, dh)
+        arr = self.level(k)
+        rows, cols = view_indices(arr.shape, rect, dw, dh, 1 << k)
+        return sample_view(arr, rows, cols)
+
+
+def _field_contours(anchors, rings=()):
+    """int32 contours of the polygon and its extra rings (rings under 3 points dropped)."""
+    if len(anchors) < 3:
+        return []
+    return [np.asarray(r, dtype=np.int32).reshape(-1, 2) for r in (anchors, *rings) if len(r) >= 3]
+
+
+def create_field_mask(shape, anchors, rings=()):
+    mask = np.zeros((shape[0], shape[1]), dtype=np.uint8)
+    contours = _field_contours(anchors, rings)
+    if contours:
+        cv2.fillPoly(mask, contours, 255)
+    return mask
+
+
+def field_bounds(shape, anchors, rings=()):
+    """(x0, y0, x1, y1) of the field's bounding box clipped to the image, or None."""
+    contours = _field_contours(anchors, rings)
+    if not contours:
+        return None
+    bx, by, bw, bh = cv2.boundingRect(np.concatenate(contours))
+    x0, y0 = max(0, bx), max(0, by)
+    x1, y1 = min(shape[1], bx + bw), min(shape[0], by + bh)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+
+def create_field_mask_local(shape, anchors, rings=()):
+    """Field mask rasterized only over field_bounds: (mask 0/255, (x0, y0, x1, y1)).
+
+    fillPoly clips polygon edges at the buffer border, so the buffer covers the
+    whole (image-clipped) bounding box; that makes the result identical to the
+    matching crop of create_field_mask.
+    """
+    bounds = field_bounds(shape, anchors, rings)
+    if bounds is None:
+        return None, None
+    x0, y0, x1, y1 = bounds
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    cv2.fillPoly(mask, _field_contours(anchors, rings), 255, offset=(-x0, -y0))
+    return mask, bounds
+
+
+# ---------- Layers ----------
+def build_color_layer(base_arr, layer, distances=None, bounds=None):
+    """Mask of one auto layer (before priority is resolved against other classes).
+
+    `distances` is an optional DistanceCache of base_arr. With bounds
+    (x0, y0, x1, y1) only that window is computed (plus what the strict filter
+    needs around it) and the mask covers the window; a distance map is then
+    only used if it is cached already, never computed for the whole image.
+    """
+    h, w = base_arr.shape[:2]
+    x0, y0, x1, y1 = bounds if bounds is not None else (0, 0, w, h)
+    if not layer.active:
+        return np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    dist = None
+    if distances is not None:
+        lookup = distances.distance if bounds is None else distances.peek
+        dist = lookup(layer.color, layer.metric)
+
+    def _mask(wx0, wy0, wx1, wy1):
+        if dist is not None:
+            return dist[wy0:wy1, wx0:wx1] <= int(layer.sensitivity)
+        return get_color_mask(base_arr[wy0:wy1, wx0:wx1], layer.color, int(layer.sensitivity), layer.metric)
+
+    if layer.strict is None:
+        mask = _mask(x0, y0, x1, y1)
+    elif bounds is None:
+        mask = apply_strict_filter(_mask(0, 0, w, h), int(layer.strict))
+    else:
+        mask = apply_strict_filter_window(_mask, (h, w), int(layer.strict), bounds)
+    return mask
+
+
+def patch_circle(center, radius):
+    """Filled circle as a bool mask of its own bounding box, and the box origin (x0, y0)."""
+    r = int(radius)
+    x0, y0 = center[0] - r - 1, center[1] - r - 1
+    circle = np.zeros((2 * r + 3, 2 * r + 3), dtype=np.uint8)
+    cv2.circle(circle, (r + 1, r + 1), r, 1, -1)
+    return circle.astype(bool), (x0, y0)
+
+
+def make_patch_mask(base_rgba, center, radius, sensitivity, strict_sensitivity):
+    """Patch mask over the circle's bounding box (clipped to the image) and that box.
+
+    Only the box (plus the strict filter's halo) is read, so a patch costs its
+    own area, not the image's. Same pixels as masking the whole image.
+    """
+    h, w = base_rgba.shape[:2]
+    circle, (ox, oy) = patch_circle(center, radius)
+    bounds = (max(0, ox), max(0, oy), min(w, ox + circle.shape[1]), min(h, oy + circle.shape[0]))
+    if bounds[0] >= bounds[2] or bounds[1] >= bounds[3]:
+        return np.zeros((0, 0), dtype=bool), (0, 0, 0, 0)
+
+    y = np.clip(center[1], 0, h-1)
+    x = np.clip(center[0], 0, w-1)
+    target_rgb = tuple(int(v) for v in base_rgba[y, x, :3])
+
+    def _mask(wx0, wy0, wx1, wy1):
+        mask = get_color_mask(base_rgba[wy0:wy1, wx0:wx1], target_rgb, int(sensitivity))
+        roi = np.zeros(mask.shape, dtype=bool)
+        cx0, cy0 = max(ox, wx0), max(oy, wy0)
+        cx1, cy1 = min(ox + circle.shape[1], wx1), min(oy + circle.shape[0], wy1)
+        if cx0 < cx1 and cy0 < cy1:
+            roi[cy0 - wy0:cy1 - wy0, cx0 - wx0:cx1 - wx0] = circle[cy0 - oy:cy1 - oy, cx0 - ox:cx1 - ox]
+        return mask & roi
+
+    if strict_sensitivity and strict_sensitivity > 0:
+        mask = apply_strict_filter_window(_mask, (h, w), int(strict_sensitivity), bounds)
+    else:
+        mask = _mask(*bounds)
+    return mask, bounds
+
+
+def make_patch(base_rgba, center, radius, sensitivity, strict):
+    mask, bounds = make_patch_mask(base_rgba, center, radius, sensitivity, strict)
+    return ManualPatch(center, radius, sensitivity, strict, mask, bounds)
+
+
+def combine_patch_masks(shape, patches, bounds=None):
+    x0, y0, x1, y1 = bounds if bounds is not None else (0, 0, shape[1], shape[0])
+    acc = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    for p in patches:
+        p.paint(acc, x0, y0)
+    return acc
+
+
+class PatchCoverage:
+    """Number of manual patches covering each pixel (uint16).
+
+    Adding or removing a patch only touches the patch's bounding box, so the
+    union of hundreds of patches is never re-ORed from scratch. Safe to share
+    between the GUI thread and render workers.
+    """
+
+    def __init__(self, shape, patches=()):
+        self.count = np.zeros(shape, dtype=np.uint16)
+        self.lock = threading.Lock()
+        for p in patches:
+            self.add(p)
+
+    def add(self, patch):
+        with self.lock:
+            views = patch.overlap(self.count)
+            if views is not None:
+                dst, src = views
+                dst += src
+
+    def remove(self, patch):
+        with self.lock:
+            views = patch.overlap(self.count)
+            if views is not None:
+                dst, src = views
+                dst -= src
+
+    def mask(self, bounds=None):
+        """Pixels covered by at least one patch (over bounds (x0, y0, x1, y1) if given)."""
+        h, w = self.count.shape
+        x0, y0, x1, y1 = bounds if bounds is not None else (0, 0, w, h)
+        with self.lock:
+            return self.count[y0:y1, x0:x1] > 0
+
+
+# ---------- Class stack ----------
+# All classes share one uint8 class-label image: 0 = no class, i + 1 = the
+# i-th auto class of AnalysisParams.color_classes(), manual_label = manual
+# patches. Classes are painted lowest priority first, each over the ones
+# below it, so every pixel ends with its highest-priority class and no
+# "forbid" masks of the classes above are ever built.
+def _paint(labels, mask, value):
+    """labels[mask] = value in place (labels is contiguous); cv2.copyTo is a
+    masked store without NumPy's boolean indexing."""
+    cv2.copyTo(np.full(labels.shape, value, dtype=np.uint8), mask.view(np.uint8), labels)
+
+
+def stack_class_labels(masks, manual=None):
+    """Class-label image of auto class masks in priority order (label i + 1) and a
+    manual mask (label len(masks) + 1, below every auto class)."""
+    labels = np.zeros(masks[0].shape if masks else manual.shape, dtype=np.uint8)
+    if manual is not None:
+        _paint(labels, manual, len(masks) + 1)
+    for i in range(len(masks) - 1, -1, -1):
+        _paint(labels, masks[i], i + 1)
+    return labels
+
+
+def build_class_labels(base_arr, params, distances=None, bounds=None, timer=NO_TIMER):
+    """Class-label image of every class (full resolution or over bounds).
+
+    A class costs one distance evaluation (a lookup in `distances` if given),
+    its strict filter and one masked store; only one class mask is alive at a
+    time.
+    """
+    h, w = base_arr.shape[:2]
+    x0, y0, x1, y1 = bounds if bounds is not None else (0, 0, w, h)
+    classes = params.color_classes()
+    labels = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    if params.manual_enabled:
+        _paint(labels, combine_patch_masks((h, w), params.manual_patches, bounds), params.manual_label)
+    timer.lap("build_manual")
+    for i in range(len(classes) - 1, -1, -1):
+        if classes[i].layer.active:
+            _paint(labels, build_color_layer(base_arr, classes[i].layer, distances, bounds), i + 1)
+            timer.lap(f"build_{classes[i].name}")
+    return labels
+
+
+# ---------- Hit testing ----------
+class PointIndex:
+    """List of (x, y) points with a uniform grid over them for radius hit-tests.
+
+    Behaves like a list of points that only grows at the end (append / pop(i) /
+    clear). Each point may carry a `reach`, its own hit radius. A query only
+    scans the grid cells around the cursor, so hit-testing does not depend on
+    the number of points.
+    """
+
+    def __init__(self, points=(), cell=16):
+        self.cell = max(1, int(cell))
+        self.points = []
+        self.reach = []
+        self.ids = []        # ascending, so a point's list position is bisect(ids, id)
+        self.cells = {}      # (cx, cy) -> ids
+        self.next_id = 0
+        self.max_reach = 0.0
+        for p in points:
+            self.append(p)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def __getitem__(self, i):
+        return self.points[i]
+
+    def __repr__(self):
+        return f"PointIndex({self.points!r})"
+
+    def _key(self, x, y):
+        return int(x // self.cell), int(y // self.cell)
+
+    def append(self, point, reach=0.0):
+        x, y = point
+        self.points.append((x, y))
+        self.reach.append(float(reach))
+        self.ids.append(self.next_id)
+        self.cells.setdefault(self._key(x, y), []).append(self.next_id)
+        self.next_id += 1
+        self.max_reach = max(self.max_reach, float(reach))
+
+    def pop(self, i=-1):
+        point = self.points.pop(i)
+        pid = self.ids.pop(i)
+        key = self._key(*point)
+        bucket = self.cells[key]
+        bucket.remove(pid)
+        if not bucket:
+            del self.cells[key]
+        reach = self.reach.pop(i)
+        if reach >= self.max_reach:
+            self.max_reach = max(self.reach, default=0.0)  # the widest point left sets the scan radius
+        return point
+
+    def clear(self):
+        self.points.clear(); self.reach.clear(); self.ids.clear(); self.cells.clear()
+        self.max_reach = 0.0
+
+    def within(self, point, radius):
+        """Ascending positions of the points closer than max(radius, reach) to point."""
+        x, y = point
+        r = max(radius, self.max_reach)
+        kx0, ky0 = self._key(x - r, y - r)
+        kx1, ky1 = self._key(x + r, y + r)
+        hits = []
+        for ky in range(ky0, ky1 + 1):
+            for kx in range(kx0, kx1 + 1):
+                for pid in self.cells.get((kx, ky), ()):
+                    i = bisect.bisect_left(self.ids, pid)
+                    px, py = self.points[i]
+                    if np.hypot(x - px, y - py) < max(radius, self.reach[i]):
+                        hits.append(i)
+        hits.sort()
+        return hits
+
+    def first_within(self, point, radius):
+        hits = self.within(point, radius)
+        return hits[0] if hits else None
+
+    def last_within(self, point, radius):
+        hits = self.within(point, radius)
+        return hits[-1] if hits else None
+
+
+# ---------- Analysis ----------
+def analyze_field(base_arr, params, distances=None, timer=NO_TIMER):
+    """Pixel counts of every class inside params.polygon (and params.rings).
+
+    Only the polygon's bounding box (plus the strict filter's halo) is
+    computed, and the field is rasterized in bbox-local coordinates.
+    The field denominator only counts pixels with a non-zero alpha channel.
+    Raises ValueError when the polygon is undefined or empty.
+    """
+    if len(params.polygon) < 3:
+        raise ValueError("Polygon not defined")
+
+    field_mask_u8, bounds = create_field_mask_local(base_arr.shape[:2], params.polygon, params.rings)  # 0/255
+    if field_mask_u8 is None:
+        raise ValueError("Polygon mask is empty")
+
+    x0, y0, x1, y1 = bounds
+    field_roi = field_mask_u8 > 0
+    if base_arr.shape[2] == 4:
+        field_pixels = int(np.count_nonzero(field_roi & (base_arr[y0:y1, x0:x1, 3] > 0)))
+    else:
+        field_pixels = int(np.count_nonzero(field_roi))
+    timer.lap("field_mask")
+
+    labels = build_class_labels(base_arr, params, distances, bounds, timer)
+    # one count per class label in a single pass; label 0 is no class
+    per_label = np.bincount(labels[field_roi], minlength=params.manual_label + 1)
+    result = result_from_counts(params, [field_pixels, *per_label[1:], per_label[1:].sum()])
+    timer.lap("count")
+    return result
+
+
+# ---------- Zonal statistics ----------
+def paint_labels(masks, window):
+    """Field label images over window (x0, y0, x1, y1) from bbox-local field masks.
+
+    masks[i] is (bool mask, (x0, y0, x1, y1)) inside window, or None; field i
+    gets label i + 1. Fields normally do not overlap and fit in one image; a
+    field overlapping an earlier one moves to the next image, so every field
+    keeps all of its pixels.
+    """
+    wx0, wy0, wx1, wy1 = window
+    images = []
+    pending = [i for i, m in enumerate(masks) if m is not None]
+    while pending:
+        labels = np.zeros((wy1 - wy0, wx1 - wx0), dtype=np.int32)
+        deferred = []
+        for i in pending:
+            mask, (x0, y0, x1, y1) = masks[i]
+            sub = labels[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+            if sub[mask].any():
+                deferred.append(i)
+            else:
+                sub[mask] = i + 1
+        images.append(labels)
+        pending = deferred
+    return images
+
+
+def zonal_counts(zones, labels, levels, count, alpha=None):
+    """Pixel counts per zone in one np.bincount pass: (count + 1) x (levels + 1) array.
+
+    zones is a field label image (paint_labels), labels the class-label image
+    over the same window with values below `levels`, and alpha (bool, only
+    those pixels count towards the field; None = all) too. Columns: field,
+    class labels 1 .. levels - 1, combined; row 0 is outside every field.
+    Each pixel's key is (zone * levels + label) * 2 + alpha.
+    """
+    bins = np.zeros((count + 1) * levels * 2, dtype=np.int64)
+    dtype = np.int64 if len(bins) > np.iinfo(np.int32).max else np.int32
+    h, w = zones.shape
+    rows = max(1, _CHUNK_PIXELS // max(1, w))
+    for r0 in range(0, h, rows):
+        r1 = min(r0 + rows, h)
+        key = np.multiply(zones[r0:r1], levels, dtype=dtype)
+        key += labels[r0:r1]
+        key <<= 1
+        key += alpha[r0:r1] if alpha is not None else 1
+        bins += np.bincount(key.ravel(), minlength=len(bins))
+    bins = bins.reshape(count + 1, levels, 2)
+    classes = bins.sum(axis=2)[:, 1:]
+    return np.column_stack((bins[:, :, 1].sum(axis=1), classes, classes.sum(axis=1)))
+
+
+def result_from_counts(params, counts):
+    """AnalysisResult from field pixels, one count per class label (1 .. manual_label) and the combined count."""
+    classes = params.color_classes()
+    counts = [int(v) for v in counts]
+    per_label = counts[1:-1]
+    return AnalysisResult(
+        field_pixels=counts[0],
+        highlight_pixels=per_label[0] if params.highlight.active else None,
+        transient_pixels=per_label[1] if params.transient.active else None,
+        manual_pixels=per_label[-1] if params.manual_enabled else None,
+        combined_pixels=counts[-1],
+        class_pixels={c.name: n if c.layer.active else None for c, n in zip(classes[2:], per_label[2:])},
+    )
+
+
+def analyze_fields(base_arr, params, fields, distances=None, timer=NO_TIMER):
+    """analyze_field for many Fields at once (params.polygon is ignored).
+
+    The class-label image is built once over the union of the fields'
+    bounding boxes, every field is rasterized over its own box into a shared
+    field label image and all counts come from one zonal_counts pass. The result for a field that is
+    undefined or outside the image is None.
+    """
+    shape = base_arr.shape[:2]
+    masks = []
+    for f in fields:
+        mask, bounds = create_field_mask_local(shape, f.polygon, f.rings)
+        masks.append(None if mask is None else (mask > 0, bounds))
+    boxes = np.array([b for _, b in filter(None, masks)]).reshape(-1, 4)
+    if not len(boxes):
+        return [None] * len(fields)
+    union = (*boxes[:, :2].min(axis=0).tolist(), *boxes[:, 2:].max(axis=0).tolist())
+    x0, y0, x1, y1 = union
+    timer.lap("field_masks")
+    labels = build_class_labels(base_arr, params, distances, union, timer)
+    alpha = base_arr[y0:y1, x0:x1, 3] > 0 if base_arr.shape[2] == 4 else None
+    images = paint_labels(masks, union)
+    timer.lap("labels")
+    levels = params.manual_label + 1
+    counts = sum(zonal_counts(zones, labels, levels, len(fields), alpha) for zones in images)
+    timer.lap("count")
+    return [None if m is None else result_from_counts(params, counts[i + 1]) for i, m in enumerate(masks)]
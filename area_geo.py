@@ -0,0 +1,189 @@
+"""Field boundaries from GIS files.
+
+Reads Polygon / MultiPolygon geometries from GeoJSON (.geojson/.json) or WKT
+(.wkt/.txt, one geometry per line, optionally `name<TAB>WKT`) into
+engine.Field objects. Coordinates are pixel coordinates (x = column,
+y = row), or map coordinates converted through the image's world file
+(.pgw/.tfw/.jgw/.wld):
+
+    fields = area_geo.FieldSet.load("parcels.geojson")
+    world = area_geo.read_world_file(area_geo.world_file_for("ortho.tif"))
+    for f in fields.fields(world):
+        ...
+
+All vertices of a file are kept in one array, so the transform to pixels and
+the rounding run once for the whole file; engine.analyze_fields then
+rasterizes each field over its own bounding box only.
+"""
+from os import path
+import json, re
+import numpy as np
+import area_engine as engine
+
+GEOJSON_EXTENSIONS = (".geojson", ".json")
+WKT_EXTENSIONS = (".wkt", ".txt")
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_COORD = re.compile(rf"{_NUMBER}(?:\s+{_NUMBER})+")
+_WKT = re.compile(r"^\s*(?:SRID=\d+\s*;)?\s*(MULTIPOLYGON|POLYGON)\s*(?:ZM|Z|M)?\s*(EMPTY|\(.*\))\s*$",
+                  re.IGNORECASE | re.DOTALL)
+
+
+# ---------- World files ----------
+def world_file_for(image_path):
+    """Sidecar world file of an image (ortho.tif -> ortho.tfw / ortho.tifw / ortho.wld), or None."""
+    base, ext = path.splitext(image_path)
+    ext = ext.lstrip(".")
+    candidates = [f"{base}.{ext[0]}{ext[-1]}w", f"{base}.{ext}w", f"{base}.wld"] if ext else [f"{base}.wld"]
+    for candidate in candidates:
+        for name in (candidate, candidate.upper()):
+            if path.exists(name):
+                return name
+    return None
+
+
+def read_world_file(file_path):
+    """The six affine parameters (A, D, B, E, C, F) of a world file, or None for None."""
+    if file_path is None:
+        return None
+    with open(file_path, "r", encoding="utf-8") as f:
+        values = [float(v) for v in f.read().split()]
+    if len(values) != 6:
+        raise ValueError(f"{file_path}: a world file has 6 values, got {len(values)}")
+    return tuple(values)
+
+
+def world_to_pixel(xy, world):
+    """Map coordinates (N x 2) to pixel coordinates through a world file.
+
+    The world file maps the center of pixel (col, row) to
+    x = A*col + B*row + C, y = D*col + E*row + F.
+    """
+    a, d, b, e, c, f = world
+    inverse = np.linalg.inv(np.array([[a, b], [d, e]], dtype=np.float64))
+    return (np.asarray(xy, dtype=np.float64) - (c, f)) @ inverse.T
+
+
+# ---------- Parsing ----------
+def _polygons(geometry):
+    """Polygons (lists of rings of [x, y, ...]) of a GeoJSON geometry; other types give none."""
+    kind = (geometry or {}).get("type")
+    if kind == "Polygon":
+        return [geometry["coordinates"]]
+    if kind == "MultiPolygon":
+        return list(geometry["coordinates"])
+    if kind == "GeometryCollection":
+        return [p for g in geometry.get("geometries", ()) for p in _polygons(g)]
+    return []
+
+
+def parse_geojson(data):
+    """(name, polygons) per feature of a GeoJSON object (FeatureCollection, Feature or geometry)."""
+    if data.get("type") == "FeatureCollection":
+        features = data.get("features", [])
+    elif data.get("type") == "Feature":
+        features = [data]
+    else:
+        features = [{"geometry": data}]
+    out = []
+    for i, feature in enumerate(features):
+        props = feature.get("properties") or {}
+        name = props.get("name", feature.get("id", props.get("id", f"field_{i + 1}")))
+        out.append((str(name), _polygons(feature.get("geometry"))))
+    return out
+
+
+def parse_wkt(text):
+    """Polygons (lists of rings of (x, y)) of one POLYGON / MULTIPOLYGON WKT string."""
+    match = _WKT.match(text)
+    if match is None:
+        raise ValueError(f"Unsupported WKT: {text[:40]!r}")
+    kind, body = match.group(1).upper(), match.group(2)
+    if body.upper() == "EMPTY":
+        return []
+    # "(x y, x y)" -> "[[x, y], [x, y]]"
+    body = _COORD.sub(lambda m: "[%r, %r]" % tuple(float(v) for v in m.group(0).split()[:2]), body)
+    nested = json.loads(body.replace("(", "[").replace(")", "]"))
+    return nested if kind == "MULTIPOLYGON" else [nested]
+
+
+def parse_wkt_lines(text):
+    """(name, polygons) per non-empty line of `name<TAB>WKT` or bare WKT."""
+    out = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        name, _, wkt = line.rpartition("\t")
+        out.append((name.strip() or f"field_{len(out) + 1}", parse_wkt(wkt)))
+    return out
+
+
+# ---------- Field sets ----------
+class FieldSet:
+    """Field boundaries of one file in source coordinates, stored as one vertex array.
+
+    `parts[i]` lists the polygons of field i, each a list of ring lengths; the
+    rings' vertices follow each other in `xy` in that order.
+    """
+
+    def __init__(self, features):
+        self.names = []
+        self.parts = []
+        chunks = []
+        for name, polygons in features:
+            rings_of = []
+            for polygon in polygons:
+                lengths = []
+                for ring in polygon:
+                    ring = np.asarray(ring, dtype=np.float64).reshape(len(ring), -1) if len(ring) else np.zeros((0, 2))
+                    chunks.append(ring[:, :2])
+                    lengths.append(len(ring))
+                rings_of.append(lengths)
+            self.names.append(name)
+            self.parts.append(rings_of)
+        self.xy = np.concatenate(chunks) if chunks else np.zeros((0, 2))
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if file_path.lower().endswith(WKT_EXTENSIONS):
+            return cls(parse_wkt_lines(text))
+        return cls(parse_geojson(json.loads(text)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def fields(self, world=None):
+        """engine.Field per feature in pixel coordinates (through `world` if given).
+
+        A field's polygon is the outer ring of its first part, its rings are the
+        holes and the other parts (filled by the even-odd rule). Consecutive
+        vertices that round to the same pixel are merged; rings left with fewer
+        than 3 vertices (not counting the closing one) are dropped, a polygon
+        with its outer ring.
+        """
+        xy = world_to_pixel(self.xy, world) if world is not None else self.xy
+        px = np.rint(xy).astype(np.int64)
+        # merge runs of vertices on the same pixel (ring starts are always kept)
+        keep = np.ones(len(px), dtype=bool)
+        keep[1:] = np.any(px[1:] != px[:-1], axis=1)
+        start = 0
+        out = []
+        for name, polygons in zip(self.names, self.parts):
+            rings = []
+            for lengths in polygons:
+                kept = []
+                for i, n in enumerate(lengths):
+                    ring = px[start:start + n][keep[start:start + n] | (np.arange(n) == 0)]
+                    start += n
+                    if len(ring) - (len(ring) > 1 and (ring[-1] == ring[0]).all()) >= 3:
+                        kept.append(list(map(tuple, ring.tolist())))
+                    elif i == 0:
+                        kept = None
+                    if kept is None:
+                        start += sum(lengths[i + 1:])
+                        break
+                rings.extend(kept or [])
+            out.append(engine.Field(name, rings[0] if rings else [], rings[1:]))
+        return out
@@ -0,0 +1,216 @@
+"""Project files: a whole annotation session in one file.
+
+A project (.acproj) is a zip archive of project.json (the image path and its
+checksum, every layer setting, the polygon, the manual patches, the view and
+the last result) and the computed masks, each a zlib-compressed, bit-packed
+member of its own:
+
+    layers/highlight-<key>.bin    auto class masks before priority, named
+    layers/transient-<key>.bin    after the settings they were built with
+    patches/0.bin ...             manual patch masks over their bounds
+
+The zip stores the members as they are, so each can be read without touching
+the others. open_project decodes only the (small) patch masks and hands out
+the class masks as StoredMask objects that decompress on load(), i.e. when a
+layer is first shown:
+
+    project = area_project.open_project("survey.acproj")
+    mask = project.layers["highlight"].load()
+    area_project.save_project("survey.acproj", project, {"highlight": mask})
+"""
+from dataclasses import asdict, dataclass, field
+from os import path
+from typing import Dict, Optional, Tuple
+import hashlib, json, os, tempfile, zipfile, zlib
+import numpy as np
+import area_cache, area_engine as engine
+
+PROJECT_VERSION = 1
+PROJECT_EXTENSION = ".acproj"
+PROJECT_MEMBER = "project.json"
+ZLIB_LEVEL = 6
+
+
+# ---------- Masks ----------
+def encode_mask(mask):
+    """zlib-compressed bit-packed bool mask."""
+    return zlib.compress(np.packbits(mask, axis=None).tobytes(), ZLIB_LEVEL)
+
+
+def decode_mask(data, shape):
+    h, w = shape
+    bits = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    return np.unpackbits(bits, count=h * w).reshape(h, w).view(bool)
+
+
+def _layer_member(name, key):
+    digest = hashlib.blake2b(json.dumps(key).encode("utf-8"), digest_size=8).hexdigest()
+    return f"layers/{name}-{digest}.bin"
+
+
+class StoredMask:
+    """A full-resolution class mask in a project file, read and decompressed only by load().
+
+    key is area_cache.layer_key of the settings the mask was built with.
+    """
+
+    def __init__(self, file_path, member, shape, key):
+        self.file_path = file_path
+        self.member = member
+        self.shape = tuple(shape)
+        self.key = key
+
+    def raw(self):
+        """The compressed member."""
+        with zipfile.ZipFile(self.file_path) as z:
+            return z.read(self.member)
+
+    def load(self):
+        """The mask, or None when the project file has changed or is gone."""
+        try:
+            return decode_mask(self.raw(), self.shape)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile, zlib.error):
+            return None
+
+
+# ---------- Projects ----------
+@dataclass
+class Project:
+    """A saved session. params includes the manual patches (with their masks).
+
+    layers maps class names to their StoredMask, result is the last analysis
+    of exactly these params (None if there is none) and view is free-form GUI
+    state (zoom, center, display toggles).
+    """
+    image_path: str
+    digest: str
+    shape: Tuple[int, int]
+    params: engine.AnalysisParams = field(default_factory=engine.AnalysisParams)
+    polygon_closed: bool = False
+    layers: Dict[str, StoredMask] = field(default_factory=dict)
+    result: Optional[engine.AnalysisResult] = None
+    view: dict = field(default_factory=dict)
+
+
+def _relative(file_path, directory):
+    try:
+        return path.relpath(file_path, directory)
+    except ValueError:  # another drive
+        return None
+
+
+def _image_path(image, directory):
+    """The saved image next to the project (moved together), else at its absolute path."""
+    if image.get("relative"):
+        candidate = path.normpath(path.join(directory, image["relative"]))
+        if path.exists(candidate):
+            return candidate
+    return image["path"]
+
+
+def save_project(file_path, project, masks=None):
+    """Write project to file_path, replacing it atomically.
+
+    masks maps class names to full masks built with the current params; the
+    other active classes keep their mask from project.layers (copied without
+    decompressing) while it still matches their settings. Returns the
+    StoredMask of every class in the written file.
+    """
+    masks = masks or {}
+    file_path = path.abspath(file_path)
+    directory = path.dirname(file_path)
+    image_path = path.abspath(project.image_path)
+    doc = {
+        "version": PROJECT_VERSION,
+        "image": {"path": image_path, "relative": _relative(image_path, directory),
+                  "digest": project.digest, "shape": list(project.shape)},
+        "params": project.params.to_dict(),
+        "manual_enabled": project.params.manual_enabled,
+        "polygon_closed": project.polygon_closed,
+        "patches": [],
+        "layers": {},
+        "result": asdict(project.result) if project.result is not None else None,
+        "view": project.view,
+    }
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as z:
+            for i, p in enumerate(project.params.manual_patches):
+                member = f"patches/{i}.bin"
+                z.writestr(member, encode_mask(p.mask))
+                doc["patches"].append({"center": list(p.center), "radius": p.radius, "sensitivity": p.sensitivity,
+                                       "strict": p.strict, "bounds": list(p.bounds), "member": member})
+            for c in project.params.color_classes():
+                key = area_cache.layer_key(c.layer)
+                if key is None:
+                    continue
+                if c.name in masks:
+                    data = encode_mask(masks[c.name])
+                else:
+                    stored = project.layers.get(c.name)
+                    if stored is None or stored.key != key:
+                        continue
+                    try:
+                        data = stored.raw()
+                    except (OSError, KeyError, zipfile.BadZipFile):
+                        continue
+                member = _layer_member(c.name, key)
+                z.writestr(member, data)
+                doc["layers"][c.name] = {"member": member, "key": key}
+            z.writestr(PROJECT_MEMBER, json.dumps(doc, indent=2))
+        os.replace(tmp, file_path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return {name: StoredMask(file_path, e["member"], project.shape, e["key"]) for name, e in doc["layers"].items()}
+
+
+def open_project(file_path):
+    """Read a project file; its class masks stay compressed (see StoredMask).
+
+    Raises ValueError for files that are not (readable) projects, naming what
+    is missing or malformed.
+    """
+    file_path = path.abspath(file_path)
+    try:
+        with zipfile.ZipFile(file_path) as z:
+            doc = json.loads(z.read(PROJECT_MEMBER))
+            if not isinstance(doc, dict):
+                raise ValueError(f"{PROJECT_MEMBER} is not an object")
+            version = doc.get("version")
+            if not isinstance(version, int) or version < 1:
+                raise ValueError(f"unknown project version {version!r}")
+            if version > PROJECT_VERSION:
+                raise ValueError(f"saved by a newer version (project version {version})")
+            image = doc["image"]
+            if not isinstance(image.get("path"), str) or not isinstance(image.get("digest"), str):
+                raise ValueError("the image path or checksum is missing")
+            shape = tuple(int(v) for v in image["shape"])
+            if len(shape) != 2 or min(shape) < 1:
+                raise ValueError(f"invalid image shape {list(shape)}")
+            params = engine.AnalysisParams.from_dict(doc["params"])
+            params.manual_enabled = bool(doc.get("manual_enabled"))
+            for p in doc.get("patches") or []:
+                x0, y0, x1, y1 = bounds = tuple(int(v) for v in p["bounds"])
+                mask = decode_mask(z.read(p["member"]), (y1 - y0, x1 - x0))
+                params.manual_patches.append(engine.ManualPatch(
+                    tuple(int(v) for v in p["center"]), int(p["radius"]), int(p["sensitivity"]), int(p["strict"]),
+                    mask, bounds))
+            layers = {}
+            for name, entry in (doc.get("layers") or {}).items():
+                if entry["member"] not in z.namelist():
+                    raise ValueError(f"the {name} layer is missing")
+                layers[name] = StoredMask(file_path, entry["member"], shape, entry["key"])
+            try:
+                result = engine.AnalysisResult(**doc["result"]) if doc.get("result") else None
+            except TypeError as e:
+                raise ValueError(f"invalid result: {e}") from e
+            view = doc.get("view") or {}
+            if not isinstance(view, dict):
+                raise ValueError("the view is not an object")
+    except (KeyError, TypeError, AttributeError, ValueError, zipfile.BadZipFile, zlib.error) as e:
+        detail = f"missing {e}" if isinstance(e, KeyError) else str(e)
+        raise ValueError(f"Not a valid project file: {file_path} ({detail})") from e
+    return Project(_image_path(image, path.dirname(file_path)), image["digest"], shape, params,
+                   bool(doc.get("polygon_closed")), layers, result, view)
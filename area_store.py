@@ -0,0 +1,198 @@
+"""Image stores: region reads without keeping decoded copies around.
+
+Every store exposes `shape` (h, w, 4) and `read_region(x, y, w, h)` returning
+an RGBA uint8 array, so the tiled engine (area_tiles) only pulls the pixels it
+needs. The GUI works on full(): a memory map for .npy/.raw, but a decoded
+copy of the whole image for TIFF.
+
+- NpyImageStore / RawImageStore memory-map uncompressed pixels; the OS pages
+  in only the touched rows.
+- TiffImageStore decodes just the TIFF tiles/strips intersecting a region
+  (needs the optional `tifffile` package). TIFFs it cannot decode, such as
+  LZW without `imagecodecs`, are read whole through OpenCV instead.
+- ArrayImageStore wraps an already decoded array (PNG/JPEG/BMP have no
+  random access, they are decoded once with OpenCV).
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from os import path
+import json
+import numpy as np, cv2
+import area_engine as engine
+
+try:
+    import tifffile
+except ImportError:  # optional dependency
+    tifffile = None
+
+NPY_EXTENSIONS = (".npy",)
+RAW_EXTENSIONS = (".raw", ".rgba")
+TIFF_EXTENSIONS = (".tif", ".tiff")
+TIFF_PHOTOMETRICS = (1, 2)  # MINISBLACK, RGB
+# Decoded TIFF segments kept per store: halo windows and alpha reads of
+# neighbouring tiles hit the same segments again
+SEGMENT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def to_rgba(arr):
+    """uint8 h x w x 3/4 (or h x w) region to RGBA."""
+    if arr.ndim == 2:
+        arr = arr[:, :, None].repeat(3, axis=2)
+    if arr.shape[2] == 4:
+        return np.ascontiguousarray(arr)
+    out = np.empty(arr.shape[:2] + (4,), dtype=np.uint8)
+    out[:, :, :3] = arr[:, :, :3]
+    out[:, :, 3] = 255
+    return out
+
+
+class ImageStore(ABC):
+    """Read-only RGBA image with windowed access; subclasses set shape and implement read_region."""
+    shape = (0, 0, 4)
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    @abstractmethod
+    def read_region(self, x, y, w, h):
+        """RGBA uint8 array of the w x h window at (x, y), clipped to the image."""
+
+    def full(self):
+        """The whole image as an RGBA array (a memory map when the store allows it)."""
+        return self.read_region(0, 0, self.width, self.height)
+
+    def close(self):
+        pass
+
+
+class ArrayImageStore(ImageStore):
+    def __init__(self, arr):
+        self.arr = arr
+        self.shape = arr.shape[:2] + (4,)
+
+    def read_region(self, x, y, w, h):
+        region = self.arr[y:y+h, x:x+w]
+        return region if region.shape[2] == 4 else to_rgba(region)
+
+    def full(self):
+        return self.arr if self.arr.shape[2] == 4 else to_rgba(self.arr)
+
+
+class NpyImageStore(ArrayImageStore):
+    """Memory-mapped .npy holding an h x w x 3/4 uint8 array."""
+
+    def __init__(self, file_path):
+        arr = np.load(file_path, mmap_mode="r")
+        if arr.dtype != np.uint8 or arr.ndim != 3 or arr.shape[2] not in (3, 4):
+            raise ValueError(f"Expected an h x w x 3/4 uint8 array in {file_path}")
+        super().__init__(arr)
+
+
+class RawImageStore(ArrayImageStore):
+    """Memory-mapped headerless RGB/RGBA bytes.
+
+    The size comes from the arguments or from a `<file>.json` sidecar with
+    "width", "height" and "channels".
+    """
+
+    def __init__(self, file_path, width=None, height=None, channels=None):
+        if width is None or height is None:
+            with open(file_path + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            width, height = meta["width"], meta["height"]
+            channels = channels or meta.get("channels", 4)
+        arr = np.memmap(file_path, dtype=np.uint8, mode="r", shape=(int(height), int(width), int(channels or 4)))
+        super().__init__(arr)
+
+
+class TiffImageStore(ImageStore):
+    """Windowed reads from (tiled or stripped) TIFF, decoding only the needed segments.
+
+    The most recently used decoded segments (up to cache_bytes) are kept, so
+    overlapping reads do not decompress a segment again.
+    """
+
+    def __init__(self, file_path, cache_bytes=SEGMENT_CACHE_BYTES):
+        self.cache_bytes = cache_bytes
+        self.segments = OrderedDict()
+        self.cached_bytes = 0
+        if tifffile is None:
+            raise ImportError("Reading TIFF images requires the 'tifffile' package")
+        self.tif = tifffile.TiffFile(file_path)
+        self.page = self.tif.pages[0]
+        if self.page.dtype != np.uint8 or self.page.planarconfig != 1:
+            self.close()
+            raise ValueError(f"Only 8-bit, contiguous-sample TIFF images are supported: {file_path}")
+        # to_rgba takes gray, RGB and RGBA samples; palette indices would read as gray
+        if self.page.photometric not in TIFF_PHOTOMETRICS or self.page.samplesperpixel not in (1, 3, 4):
+            self.close()
+            raise ValueError(f"Only gray, RGB and RGBA TIFF images are supported: {file_path}")
+        h, w = self.page.imagelength, self.page.imagewidth
+        self.shape = (h, w, 4)
+        if self.page.is_tiled:
+            self.seg_h, self.seg_w = self.page.tilelength, self.page.tilewidth
+        else:
+            self.seg_h, self.seg_w = self.page.rowsperstrip or h, w
+        self.segs_across = -(-w // self.seg_w)
+        try:
+            self._segment(0)  # fails now, not mid-read, for a compression tifffile cannot decode
+        except (ValueError, NotImplementedError, KeyError) as e:
+            self.close()
+            raise ValueError(f"tifffile cannot decode {file_path}: {e}") from e
+
+    def _decode(self, index):
+        fh = self.tif.filehandle
+        fh.seek(self.page.dataoffsets[index])
+        data = fh.read(self.page.databytecounts[index])
+        seg, _, _ = self.page.decode(data, index)
+        seg = seg[0]
+        return seg if seg.ndim == 3 else seg[:, :, None]
+
+    def _segment(self, index):
+        """RGBA segment, from the cache when it was decoded recently."""
+        seg = self.segments.get(index)
+        if seg is not None:
+            self.segments.move_to_end(index)
+            return seg
+        seg = to_rgba(self._decode(index))
+        self.segments[index] = seg
+        self.cached_bytes += seg.nbytes
+        while self.cached_bytes > self.cache_bytes and len(self.segments) > 1:
+            self.cached_bytes -= self.segments.popitem(last=False)[1].nbytes
+        return seg
+
+    def read_region(self, x, y, w, h):
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        out = np.zeros((y1 - y, x1 - x, 4), dtype=np.uint8)
+        for sy in range(y // self.seg_h, -(-y1 // self.seg_h)):
+            for sx in range(x // self.seg_w, -(-x1 // self.seg_w)):
+                seg = self._segment(sy * self.segs_across + sx)
+                oy, ox = sy * self.seg_h, sx * self.seg_w
+                cy0, cy1 = max(y, oy), min(y1, oy + seg.shape[0])
+                cx0, cx1 = max(x, ox), min(x1, ox + seg.shape[1])
+                out[cy0 - y:cy1 - y, cx0 - x:cx1 - x] = seg[cy0 - oy:cy1 - oy, cx0 - ox:cx1 - ox]
+        return out
+
+    def close(self):
+        self.segments.clear()
+        self.tif.close()
+
+
+def open_image_store(file_path):
+    ext = path.splitext(file_path)[1].lower()
+    if ext in NPY_EXTENSIONS:
+        return NpyImageStore(file_path)
+    if ext in RAW_EXTENSIONS:
+        return RawImageStore(file_path)
+    if ext in TIFF_EXTENSIONS and tifffile is not None:
+        try:
+            return TiffImageStore(file_path)
+        except ValueError:
+            pass  # not windowable by tifffile: OpenCV decodes it whole
+    return ArrayImageStore(engine.load_rgba(file_path))
+
@@ -0,0 +1,320 @@
+"""Tiled, out-of-core execution of the analysis pipeline.
+
+Images are streamed through the color mask, strict filter and counting stages
+in fixed-size tiles, so peak memory follows the tile size (derived from a
+memory budget) instead of the image size. Results are identical to the
+whole-image functions in area_engine:
+
+- the strict filter's morphological opening reads each tile with a halo of
+  twice the kernel radius, which makes the tile core exact;
+- connected components are labelled per tile and merged across tile seams
+  with a union-find, so component areas (and the keep/drop decision) are
+  global. The strict filter therefore makes two passes over the image.
+
+The one allocation outside the budget is each analyzed field: it is
+rasterized once at one byte per pixel of its bounding box and then kept at
+one bit per pixel (see FieldBits).
+
+`source` is anything that can be sliced as source[y0:y1, x0:x1] and has a
+`shape` (a NumPy array or np.memmap), or an object with
+`read_region(x, y, w, h)`.
+"""
+import numpy as np, cv2
+import area_engine as engine
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+# Rough per-pixel working set of one tile: RGBA input, uint16 distance,
+# uint8 masks for each layer and int32 component labels
+BYTES_PER_PIXEL = 48
+MIN_TILE = 256
+
+
+def tile_size_for_budget(memory_budget=DEFAULT_MEMORY_BUDGET, halo=0):
+    """Largest square tile core whose halo-padded window fits in the budget."""
+    side = int((memory_budget / BYTES_PER_PIXEL) ** 0.5) - 2 * halo
+    return max(MIN_TILE, side)
+
+
+strict_halo = engine.strict_halo
+
+
+def iter_windows(h, w, tile, region=None):
+    """(y0, y1, x0, x1) tile cores in row-major order, optionally only inside region."""
+    ry0, ry1, rx0, rx1 = region if region is not None else (0, h, 0, w)
+    for y0 in range(0, h, tile):
+        y1 = min(y0 + tile, h)
+        if y1 <= ry0 or y0 >= ry1:
+            continue
+        for x0 in range(0, w, tile):
+            x1 = min(x0 + tile, w)
+            if x1 <= rx0 or x0 >= rx1:
+                continue
+            yield y0, y1, x0, x1
+
+
+def read_window(source, y0, y1, x0, x1):
+    if hasattr(source, "read_region"):
+        return source.read_region(x0, y0, x1 - x0, y1 - y0)
+    return np.asarray(source[y0:y1, x0:x1])
+
+
+def _padded(source, y0, y1, x0, x1, halo):
+    """Window grown by halo (clipped to the image) and the core's slice inside it."""
+    h, w = source.shape[:2]
+    py0, py1 = max(0, y0 - halo), min(h, y1 + halo)
+    px0, px1 = max(0, x0 - halo), min(w, x1 + halo)
+    window = read_window(source, py0, py1, px0, px1)
+    return window, (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+
+
+# ---------- Strict filter ----------
+def _opened_core(source, layer, y0, y1, x0, x1):
+    """Exact MORPH_OPEN result of the layer's color mask on one tile core."""
+    level = int(layer.strict)
+    window, core = _padded(source, y0, y1, x0, x1, strict_halo(level))
+    m = engine.get_color_mask(window, layer.color, int(layer.sensitivity), layer.metric).astype(np.uint8)
+    return np.ascontiguousarray(cv2.morphologyEx(m, cv2.MORPH_OPEN, engine.strict_kernel(level))[core])
+
+
+def _find_roots(parent):
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return parent
+        parent = grand
+
+
+def _union_pairs(parent, a, b):
+    """Union component ids a[i] ~ b[i] (ids > 0) in the parent array."""
+    keep = (a > 0) & (b > 0)
+    if not keep.any():
+        return
+    pairs = np.unique(np.stack((a[keep], b[keep]), axis=1), axis=0)
+    for u, v in pairs:
+        while parent[u] != u:
+            u = parent[u]
+        while parent[v] != v:
+            v = parent[v]
+        if u != v:
+            parent[max(u, v)] = min(u, v)
+
+
+def _seam_pairs(first, second):
+    """8-connected id pairs across a seam between two parallel pixel lines."""
+    a, b = [first], [second]
+    a.append(first[1:]); b.append(second[:-1])
+    a.append(first[:-1]); b.append(second[1:])
+    return np.concatenate(a), np.concatenate(b)
+
+
+class StrictComponents:
+    """Global keep/drop decision of every strict-filter component of one layer.
+
+    Pass 1 labels every tile core, records component areas and merges labels
+    across seams. `keep_tile` (pass 2) relabels a core and maps it through the
+    global decision table.
+    """
+
+    def __init__(self, source, layer, tile):
+        self.source = source
+        self.layer = layer
+        self.tile = tile
+        h, w = source.shape[:2]
+        min_size = engine.strict_min_size(int(layer.strict), h * w)
+
+        self.offsets = {}
+        areas = [0]  # global id 0 = background
+        bottom_prev = None  # full-width bottom line of the previous tile row
+        pairs_a, pairs_b = [], []
+        for ty0 in range(0, h, tile):
+            ty1 = min(ty0 + tile, h)
+            top_line = np.zeros(w, dtype=np.int64)
+            bottom_line = np.zeros(w, dtype=np.int64)
+            right_prev = None
+            for tx0 in range(0, w, tile):
+                tx1 = min(tx0 + tile, w)
+                ids = self._label(ty0, ty1, tx0, tx1, areas)
+                top_line[tx0:tx1] = ids[0]
+                bottom_line[tx0:tx1] = ids[-1]
+                if right_prev is not None:
+                    a, b = _seam_pairs(right_prev, ids[:, 0])
+                    pairs_a.append(a); pairs_b.append(b)
+                right_prev = ids[:, -1]
+            if bottom_prev is not None:
+                a, b = _seam_pairs(bottom_prev, top_line)
+                pairs_a.append(a); pairs_b.append(b)
+            bottom_prev = bottom_line
+
+        parent = np.arange(len(areas), dtype=np.int64)
+        if pairs_a:
+            _union_pairs(parent, np.concatenate(pairs_a), np.concatenate(pairs_b))
+        roots = _find_roots(parent)
+        root_area = np.bincount(roots, weights=np.asarray(areas, dtype=np.float64), minlength=len(areas))
+        self.keep = root_area[roots] >= min_size
+        self.keep[0] = False
+
+    def _label(self, y0, y1, x0, x1, areas):
+        opened = _opened_core(self.source, self.layer, y0, y1, x0, x1)
+        num, labels, stats, _ = cv2.connectedComponentsWithStats(opened, connectivity=8)
+        offset = len(areas) - 1
+        self.offsets[(y0, x0)] = offset
+        areas.extend(stats[1:num, cv2.CC_STAT_AREA].tolist())
+        return np.where(labels > 0, labels.astype(np.int64) + offset, 0)
+
+    def keep_tile(self, y0, y1, x0, x1):
+        opened = _opened_core(self.source, self.layer, y0, y1, x0, x1)
+        num, labels = cv2.connectedComponents(opened, connectivity=8)
+        offset = self.offsets[(y0, x0)]
+        lut = np.zeros(num, dtype=bool)
+        lut[1:] = self.keep[offset + 1:offset + num]
+        return lut[labels]
+
+
+# ---------- Layers ----------
+def iter_color_layer_tiles(source, layer, tile, region=None):
+    """Yield (y0, y1, x0, x1, mask) for one auto layer, row-major over the tiling."""
+    h, w = source.shape[:2]
+    components = None
+    if layer.active and layer.strict is not None:
+        components = StrictComponents(source, layer, tile)
+    for y0, y1, x0, x1 in iter_windows(h, w, tile, region):
+        if not layer.active:
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        elif components is not None:
+            mask = components.keep_tile(y0, y1, x0, x1)
+        else:
+            window = read_window(source, y0, y1, x0, x1)
+            mask = engine.get_color_mask(window, layer.color, int(layer.sensitivity), layer.metric)
+        yield y0, y1, x0, x1, mask
+
+
+def iter_label_tiles(source, params, tile, region=None):
+    """Yield (y0, y1, x0, x1, class-label image) per tile, priority resolved as in
+    engine.build_class_labels."""
+    classes = [iter_color_layer_tiles(source, c.layer, tile, region) for c in params.color_classes()]
+    for windows in zip(*classes):
+        y0, y1, x0, x1, _ = windows[0]
+        manual = None
+        if params.manual_enabled:
+            manual = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+            for p in params.manual_patches:
+                p.paint(manual, x0, y0)
+        yield y0, y1, x0, x1, engine.stack_class_labels([mask for *_, mask in windows], manual)
+
+
+def tile_size_for_params(params, memory_budget):
+    """Tile side for params' widest strict halo within memory_budget."""
+    levels = [c.layer.strict for c in params.color_classes() if c.layer.active and c.layer.strict is not None]
+    return tile_size_for_budget(memory_budget, strict_halo(max(levels, default=0)))
+
+
+def apply_strict_filter_tiled(source, layer, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Whole-image strict-filtered mask assembled from tiles (mainly for checking)."""
+    h, w = source.shape[:2]
+    tile = tile_size_for_budget(memory_budget, strict_halo(layer.strict or 0))
+    out = np.zeros((h, w), dtype=bool)
+    for y0, y1, x0, x1, mask in iter_color_layer_tiles(source, layer, tile):
+        out[y0:y1, x0:x1] = mask
+    return out
+
+
+# ---------- Analysis ----------
+class FieldBits:
+    """Bbox-local field mask packed to one bit per pixel.
+
+    fillPoly is only exact on a buffer spanning the whole bounding box (it
+    draws the outline with lines clipped to the buffer, so strips differ along
+    the edges), so the 0/255 mask is built at one byte per bbox pixel,
+    regardless of the memory budget, and packed without a bool copy.
+    """
+
+    def __init__(self, shape, polygon, rings=()):
+        mask, bounds = engine.create_field_mask_local(shape, polygon, rings)
+        if mask is None:
+            raise ValueError("Polygon mask is empty")
+        self.bounds = bounds
+        self.bits = np.packbits(mask, axis=1)  # non-zero bytes pack to 1
+        del mask
+
+    def crop(self, y0, y1, x0, x1):
+        """(bool mask, (x0, y0, x1, y1)) of the field where it meets an image window, or None."""
+        fx0, fy0, fx1, fy1 = self.bounds
+        cy0, cy1 = max(y0, fy0), min(y1, fy1)
+        cx0, cx1 = max(x0, fx0), min(x1, fx1)
+        if cy0 >= cy1 or cx0 >= cx1:
+            return None
+        b0, b1 = (cx0 - fx0) // 8, (cx1 - fx0 + 7) // 8
+        rows = np.unpackbits(self.bits[cy0 - fy0:cy1 - fy0, b0:b1], axis=1)
+        skip = cx0 - fx0 - 8 * b0
+        return rows[:, skip:skip + cx1 - cx0].astype(bool), (cx0, cy0, cx1, cy1)
+
+    def window(self, y0, y1, x0, x1):
+        """Field mask (bool) of an image window."""
+        out = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        cropped = self.crop(y0, y1, x0, x1)
+        if cropped is not None:
+            mask, (cx0, cy0, cx1, cy1) = cropped
+            out[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = mask
+        return out
+
+
+def analyze_field_tiled(source, params, memory_budget=DEFAULT_MEMORY_BUDGET, tile=None):
+    """Tiled equivalent of area_engine.analyze_field."""
+    if len(params.polygon) < 3:
+        raise ValueError("Polygon not defined")
+    h, w = source.shape[:2]
+    field_bits = FieldBits((h, w), params.polygon, params.rings)
+    fx0, fy0, fx1, fy1 = field_bits.bounds
+    tile = tile or tile_size_for_params(params, memory_budget)
+
+    field_pixels = 0
+    per_label = np.zeros(params.manual_label + 1, dtype=np.int64)
+    for y0, y1, x0, x1, labels in iter_label_tiles(source, params, tile, (fy0, fy1, fx0, fx1)):
+        field = field_bits.window(y0, y1, x0, x1)
+        if not field.any():
+            continue
+        window = read_window(source, y0, y1, x0, x1)
+        if window.shape[2] == 4:
+            field_pixels += int(np.count_nonzero(field & (window[:, :, 3] > 0)))
+        else:
+            field_pixels += int(np.count_nonzero(field))
+        per_label += np.bincount(labels[field], minlength=len(per_label))
+
+    return engine.result_from_counts(params, [field_pixels, *per_label[1:], per_label[1:].sum()])
+
+
+def analyze_fields_tiled(source, params, fields, memory_budget=DEFAULT_MEMORY_BUDGET, tile=None):
+    """Tiled equivalent of area_engine.analyze_fields.
+
+    Every field is kept as FieldBits; each tile gets a field label image of
+    the fields meeting it and one engine.zonal_counts pass.
+    """
+    h, w = source.shape[:2]
+    bits = []
+    for f in fields:
+        try:
+            bits.append(FieldBits((h, w), f.polygon, f.rings))
+        except ValueError:
+            bits.append(None)
+    boxes = np.array([b.bounds if b is not None else (0, 0, 0, 0) for b in bits]).reshape(-1, 4)
+    live = [b is not None for b in bits]
+    if not any(live):
+        return [None] * len(fields)
+    x0, y0 = boxes[live, :2].min(axis=0).tolist()
+    x1, y1 = boxes[live, 2:].max(axis=0).tolist()
+    tile = tile or tile_size_for_params(params, memory_budget)
+
+    levels = params.manual_label + 1
+    counts = np.zeros((len(fields) + 1, levels + 1), dtype=np.int64)
+    for ty0, ty1, tx0, tx1, labels in iter_label_tiles(source, params, tile, (y0, y1, x0, x1)):
+        meets = np.flatnonzero((boxes[:, 0] < tx1) & (boxes[:, 2] > tx0) & (boxes[:, 1] < ty1) & (boxes[:, 3] > ty0))
+        if not len(meets):
+            continue
+        masks = [None] * len(fields)
+        for i in meets:
+            masks[i] = bits[i].crop(ty0, ty1, tx0, tx1)
+        window = read_window(source, ty0, ty1, tx0, tx1)
+        alpha = window[:, :, 3] > 0 if window.shape[2] == 4 else None
+        for zones in engine.paint_labels(masks, (tx0, ty0, tx1, ty1)):
+            counts += engine.zonal_counts(zones, labels, levels, len(fields), alpha)
+    return [engine.result_from_counts(params, counts[i + 1]) if b is not None else None for i, b in enumerate(bits)]
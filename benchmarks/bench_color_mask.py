@@ -0,0 +1,114 @@
+"""Checks get_color_mask against the int64 reference formulas and times both.
+
+Usage:
+    python benchmarks/bench_color_mask.py [--size 4] [--repeat 3]
+
+The lookup-table kernel (engine.color_distance) must equal the original
+int64 formulas bit for bit:
+
+    l1          sum(|pixel - color|) over R, G, B (the formula of v0.1-v0.3)
+    chebyshev   max(|pixel - color|)
+    euclidean   ceil(sqrt(sum((pixel - color)^2))), so distance <= tolerance
+                is exactly sum of squares <= tolerance^2
+
+The distance maps are compared for several colors on debug_image.png, on an
+image of every channel value and on random noise, masks at every tolerance
+0..765 on debug_image.png, and the whole ceil-sqrt table against integer
+square roots. Any mismatch exits with an error. The timing compares the
+kernel with the reference on a synthetic --size MP image.
+"""
+from os import path
+import argparse, math, statistics, sys, time
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+import bench_suite
+from bench_suite import engine
+
+MAX_L1 = 3 * 255
+
+
+def reference_distance(rgba, color, metric):
+    """The distances of the original formulas, in int64."""
+    diff = np.abs(rgba[:, :, :3] - np.array(color))
+    if metric == "l1":
+        return np.sum(diff, axis=2)
+    if metric == "chebyshev":
+        return np.max(diff, axis=2)
+    sq = np.sum(diff * diff, axis=2)
+    root = np.sqrt(sq).astype(np.int64)
+    return root + (root * root < sq)  # ceil, corrected where the float root is one low
+
+
+def reference_mask(rgba, color, tolerance, metric):
+    if metric == "euclidean":
+        diff = rgba[:, :, :3] - np.array(color)
+        return np.sum(diff * diff, axis=2) <= tolerance * tolerance
+    return reference_distance(rgba, color, metric) <= tolerance
+
+
+def check_ceil_sqrt():
+    n = np.arange(len(engine._CEIL_SQRT))
+    expected = np.array([0] + [math.isqrt(int(v) - 1) + 1 for v in n[1:]])
+    if not np.array_equal(engine._CEIL_SQRT, expected):
+        raise SystemExit(f"ceil-sqrt table wrong at {np.flatnonzero(engine._CEIL_SQRT != expected)[:5].tolist()}")
+
+
+def corpus():
+    levels = np.arange(256, dtype=np.uint8)
+    ramp = np.empty((256, 256, 4), dtype=np.uint8)  # every (R, G) pair, B = R ^ G
+    ramp[:, :, 0], ramp[:, :, 1] = levels[:, None], levels[None, :]
+    ramp[:, :, 2], ramp[:, :, 3] = ramp[:, :, 0] ^ ramp[:, :, 1], 255
+    noise = np.random.default_rng(0).integers(0, 256, (512, 512, 4), dtype=np.uint8)
+    return {"debug": engine.load_rgba(bench_suite.DEBUG_IMAGE), "ramp": ramp, "noise": noise}
+
+
+def check(images):
+    debug = images["debug"]
+    h, w = debug.shape[:2]
+    colors = [(0, 0, 0), (255, 255, 255), (128, 0, 255), tuple(int(v) for v in debug[h // 2, w // 2, :3])]
+    for name, rgba in images.items():
+        for color in colors:
+            for metric in engine.METRICS:
+                got = engine.color_distance(rgba, color, metric)
+                if not np.array_equal(got, reference_distance(rgba, color, metric)):
+                    raise SystemExit(f"{metric} distance differs on {name} for {color}")
+    color = colors[-1]
+    for metric in engine.METRICS:
+        for tolerance in range(MAX_L1 + 1):
+            if not np.array_equal(engine.get_color_mask(debug, color, tolerance, metric),
+                                  reference_mask(debug, color, tolerance, metric)):
+                raise SystemExit(f"{metric} mask differs at tolerance {tolerance}")
+    print(f"color_distance / get_color_mask equal the reference for {', '.join(engine.METRICS)}")
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=float, default=4, help="megapixels of the timed image")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    check_ceil_sqrt()
+    images = corpus()
+    check(images)
+    rgba = bench_suite.synthetic_image(images["debug"], args.size)
+    h, w = rgba.shape[:2]
+    color = tuple(int(v) for v in rgba[h // 2, w // 2, :3])
+    print(f"{'metric':<10} {'kernel s':>9} {'reference s':>12}")
+    for metric in engine.METRICS:
+        fast = timed(lambda: engine.get_color_mask(rgba, color, bench_suite.SENSITIVITY, metric), args.repeat)
+        slow = timed(lambda: reference_mask(rgba, color, bench_suite.SENSITIVITY, metric), args.repeat)
+        print(f"{metric:<10} {fast:>9.4f} {slow:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Checks polygon-bounded analysis against full-frame analysis and times both.
+
+Usage:
+    python benchmarks/bench_field_bounds.py [--size 4] [--fields 40] [--repeat 3]
+
+analyze_field only computes the polygon's bounding box (plus the strict
+halo). For random polygons (small ones, ones crossing the image border, ones
+with holes) on debug_image.png and a synthetic --size MP image with a
+transparent corner, at strict off and levels 1..10, with and without a
+DistanceCache, it must equal the full-frame reference: create_field_mask
+over the whole image, unbounded build_class_labels and one np.bincount. apply_strict_filter_window must equal
+the crop of apply_strict_filter for random bounds; the number of windows that
+had to be grown is printed so the retry path is known to be covered. Any
+mismatch exits with an error. The timing compares analyze_field with the
+full-frame reference.
+"""
+from dataclasses import replace
+from os import path
+import argparse, statistics, sys, time
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+import bench_suite
+from bench_suite import engine
+
+STRICT_LEVELS = (None, *range(1, 11))
+
+
+def reference_field(rgba, params):
+    """analyze_field over the whole frame, as before bounding."""
+    field = engine.create_field_mask(rgba.shape[:2], params.polygon, params.rings) > 0
+    if not field.any():
+        raise ValueError("Polygon mask is empty")
+    if rgba.shape[2] == 4:
+        field_pixels = int(np.count_nonzero(field & (rgba[:, :, 3] > 0)))
+    else:
+        field_pixels = int(np.count_nonzero(field))
+    labels = engine.build_class_labels(rgba, params)
+    per_label = np.bincount(labels[field], minlength=params.manual_label + 1)
+    return engine.result_from_counts(params, [field_pixels, *per_label[1:], per_label[1:].sum()])
+
+
+def random_polygon(rng, w, h):
+    """Outer ring and holes: small, crossing the border or large with a hole."""
+    kind = rng.integers(3)
+    if kind == 0:
+        size = rng.integers(3, 40)
+        cx, cy = rng.integers(0, w), rng.integers(0, h)
+    elif kind == 1:
+        size = rng.integers(w // 8, w // 2)
+        cx, cy = rng.choice([0, w]), rng.integers(-size // 2, h + size // 2)
+    else:
+        size = rng.integers(w // 6, w // 2)
+        cx, cy = rng.integers(size // 2, w - size // 2), rng.integers(0, h)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, rng.integers(3, 9)))
+    radii = rng.uniform(0.5, 1.0, len(angles)) * size
+    polygon = [(int(cx + r * np.cos(a)), int(cy + r * np.sin(a))) for a, r in zip(angles, radii)]
+    rings = []
+    if kind == 2:
+        s = size // 4
+        rings.append([(int(cx - s), int(cy - s)), (int(cx + s), int(cy - s)), (int(cx), int(cy + s))])
+    return polygon, rings
+
+
+def base_params(rgba, level):
+    params = bench_suite.analysis_params(rgba)
+    params.highlight = replace(params.highlight, strict=level)
+    params.transient = replace(params.transient, strict=level and max(1, level - 2), metric="euclidean")
+    return params
+
+
+def check_fields(name, rgba, count, rng):
+    h, w = rgba.shape[:2]
+    checked = 0
+    for level in STRICT_LEVELS:
+        params = base_params(rgba, level)
+        distances = engine.DistanceCache(rgba)  # highlight map cached, transient computed over the window
+        distances.distance(params.highlight.color, params.highlight.metric)
+        for _ in range(count):
+            params.polygon, params.rings = random_polygon(rng, w, h)
+            try:
+                expected = reference_field(rgba, params)
+            except ValueError:
+                continue
+            got = engine.analyze_field(rgba, params), engine.analyze_field(rgba, params, distances)
+            if got != (expected, expected):
+                raise SystemExit(f"Mismatch: analyze_field on {name}, level {level}, polygon {params.polygon}")
+            checked += 1
+    print(f"{name}: analyze_field equals the full-frame reference for {checked} fields")
+
+
+def check_windows(name, rgba, count, rng):
+    h, w = rgba.shape[:2]
+    layer = base_params(rgba, None).highlight
+    mask = engine.get_color_mask(rgba, layer.color, layer.sensitivity)
+    grown = 0
+    for level in range(1, 11):
+        full = engine.apply_strict_filter(mask, level)
+        for _ in range(count):
+            x0, x1 = sorted(rng.integers(0, w + 1, 2))
+            y0, y1 = sorted(rng.integers(0, h + 1, 2))
+            if x0 == x1 or y0 == y1:
+                continue
+            calls = []
+
+            def mask_fn(wx0, wy0, wx1, wy1):
+                calls.append(1)
+                return mask[wy0:wy1, wx0:wx1]
+
+            got = engine.apply_strict_filter_window(mask_fn, (h, w), level, (x0, y0, x1, y1))
+            if not np.array_equal(got, full[y0:y1, x0:x1]):
+                raise SystemExit(f"Mismatch: strict filter window on {name}, level {level}, bounds {(x0, y0, x1, y1)}")
+            grown += len(calls) > 1
+    print(f"{name}: apply_strict_filter_window equals the full-frame crop ({grown} windows grown)")
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=float, default=4, help="megapixels of the synthetic image")
+    parser.add_argument("--fields", type=int, default=40, help="random polygons/bounds per strict level")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    base = engine.load_rgba(bench_suite.DEBUG_IMAGE)
+    synthetic = bench_suite.synthetic_image(base, args.size)
+    h, w = synthetic.shape[:2]
+    synthetic[: h // 5, : w // 5, 3] = 0
+    images = {"debug": base, f"{args.size:g} MP": synthetic}
+    rng = np.random.default_rng(0)
+    for name, rgba in images.items():
+        check_fields(name, rgba, args.fields, rng)
+        check_windows(name, rgba, args.fields, rng)
+
+    print(f"{'image':<8} {'field':<6} {'bounded s':>9} {'full s':>8}")
+    for name, rgba in images.items():
+        h, w = rgba.shape[:2]
+        params = base_params(rgba, bench_suite.STRICT)
+        for label, scale in (("small", 10), ("half", 2)):
+            params.polygon = [(w // 4, h // 4), (w // 4 + w // scale, h // 4),
+                              (w // 4 + w // scale, h // 4 + h // scale), (w // 4, h // 4 + h // scale)]
+            params.rings = []
+            bounded = timed(lambda: engine.analyze_field(rgba, params), args.repeat)
+            full = timed(lambda: reference_field(rgba, params), args.repeat)
+            print(f"{name:<8} {label:<6} {bounded:>9.4f} {full:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
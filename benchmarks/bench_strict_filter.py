@@ -0,0 +1,80 @@
+"""Scaling of apply_strict_filter with the number of connected components.
+
+Usage:
+    python benchmarks/bench_strict_filter.py [--max-components 100000] [--loop-max 2000]
+
+Builds a synthetic mask of N components: 4x4 speckle squares (dropped by the
+min-size check) with every other grid row joined into a full-width bar (kept).
+The vectorized filter is timed against the previous per-component loop, which
+scans the whole label image once per kept component and is therefore only run
+up to --loop-max components.
+"""
+from os import path
+import argparse, sys, time
+import numpy as np, cv2
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import area_engine as engine
+
+LEVEL = 1
+
+
+def speckle_mask(components, spacing=8, size=4):
+    side = int(np.ceil(np.sqrt(components)))
+    mask = np.zeros((side * spacing, side * spacing), dtype=bool)
+    ys, xs = np.divmod(np.arange(side * side), side)
+    for dy in range(size):
+        for dx in range(size):
+            mask[ys * spacing + dy, xs * spacing + dx] = True
+    for row in range(0, side, 2):
+        mask[row * spacing:row * spacing + size, :] = True
+    return mask
+
+
+def strict_filter_loop(mask, level):
+    """The previous implementation: one full-image scan per component."""
+    m = (mask.astype(np.uint8) > 0).astype(np.uint8)
+    k = max(1, int(2 * level + 1))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+    opened = cv2.morphologyEx(m, cv2.MORPH_OPEN, kernel)
+    min_frac = 0.001 + 0.004 * ((level - 1) / 9.0)
+    min_size = int(opened.size * min_frac)
+    num, labels, stats, _ = cv2.connectedComponentsWithStats(opened, connectivity=8)
+    keep = np.zeros_like(opened, dtype=np.uint8)
+    for i in range(1, num):
+        if stats[i, cv2.CC_STAT_AREA] >= min_size:
+            keep[labels == i] = 1
+    return keep.astype(bool)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-components", type=int, default=100000)
+    parser.add_argument("--loop-max", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    # grid sizes giving roughly 100 .. 100k components (half squares, half bars)
+    counts = [c for c in (200, 2000, 20000, 200000, 2000000) if c // 2 <= args.max_components]
+    print(f"{'components':>10} {'kept':>6} {'pixels':>11} {'vectorized s':>13} {'loop s':>10}")
+    for n in counts:
+        mask = speckle_mask(n)
+        found = cv2.connectedComponents(mask.astype(np.uint8), connectivity=8)[0] - 1
+        fast, t_fast = timed(engine.apply_strict_filter, mask, LEVEL)
+        kept = cv2.connectedComponents(fast.astype(np.uint8), connectivity=8)[0] - 1
+        loop = "-"
+        if found <= args.loop_max:
+            slow, t_slow = timed(strict_filter_loop, mask, LEVEL)
+            if not np.array_equal(fast, slow):
+                raise SystemExit(f"Mismatch at {n} components")
+            loop = f"{t_slow:.4f}"
+        print(f"{found:>10} {kept:>6} {mask.size:>11} {t_fast:>13.4f} {loop:>10}")
+
+
+if __name__ == "__main__":
+    main()
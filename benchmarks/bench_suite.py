@@ -0,0 +1,259 @@
+"""Wall time, throughput and peak memory of the processing kernels.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes debug,1,4,16] [--cases ...] [--repeat 3] [--out report.json]
+    python benchmarks/bench_suite.py --compare old.json new.json
+
+Every case runs headlessly on the bundled debug_image.png ("debug") and on
+synthetic images of the given sizes in megapixels (1 to 200), made by
+mirror-tiling debug_image.png. A case reports the median and best wall time
+of --repeat runs, the throughput in megapixels per second and the peak
+memory allocated during one extra run (tracemalloc, which sees the NumPy and
+OpenCV result buffers). The JSON report also records the commit and library
+versions; --compare prints the time and memory ratios of two reports.
+
+Cases:
+    color_mask      engine.get_color_mask
+    strict_filter   engine.apply_strict_filter of the color mask
+    merge_overlay   engine.merge_overlay_with_image of the highlight overlay
+    render          RenderJob.render, the work behind update_final_image, for a
+                    1280x720 viewport with every layer dirty (needs PyQt5)
+    render_slider   the same after a highlight sensitivity change (warm caches)
+    analyze_field   engine.analyze_field over the central 80 % of the image
+"""
+from dataclasses import replace
+from datetime import datetime, timezone
+from os import path
+import argparse, json, os, platform, statistics, subprocess, sys, time, tracemalloc
+import numpy as np, cv2
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import area_engine as engine
+
+try:
+    import area_calculator
+except ImportError:  # PyQt5 missing: the render cases are skipped
+    area_calculator = None
+
+DEBUG_IMAGE = path.join(ROOT, "debug_image.png")
+VIEWPORT = (1280, 720)
+SENSITIVITY = 60
+STRICT = 3
+
+
+# ---------- Inputs ----------
+def synthetic_image(base, megapixels):
+    """4:3 RGBA image of about `megapixels` MP, mirror-tiled from base."""
+    w = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    h = int(round(megapixels * 1e6 / w))
+    bh, bw = base.shape[:2]
+    tiled = np.pad(base, ((0, max(0, h - bh)), (0, max(0, w - bw)), (0, 0)), mode="symmetric")
+    return np.ascontiguousarray(tiled[:h, :w])
+
+
+def image_for(size, base):
+    if size == "debug":
+        return base
+    return synthetic_image(base, float(size))
+
+
+def analysis_params(rgba):
+    h, w = rgba.shape[:2]
+    return engine.AnalysisParams(
+        highlight=engine.LayerParams(color=tuple(int(v) for v in rgba[h // 2, w // 2, :3]),
+                                     sensitivity=SENSITIVITY, strict=STRICT),
+        transient=engine.LayerParams(color=tuple(int(v) for v in rgba[h // 3, w // 4, :3]),
+                                     sensitivity=SENSITIVITY // 2, strict=STRICT - 1),
+        polygon=[(w // 10, h // 10), (w * 9 // 10, h // 10), (w * 9 // 10, h * 9 // 10), (w // 10, h * 9 // 10)],
+    )
+
+
+# ---------- Cases ----------
+# Each case prepares (untimed) and returns the callable that is timed
+def case_color_mask(rgba, params):
+    color = params.highlight.color
+    return lambda: engine.get_color_mask(rgba, color, SENSITIVITY)
+
+
+def case_strict_filter(rgba, params):
+    mask = engine.get_color_mask(rgba, params.highlight.color, SENSITIVITY)
+    return lambda: engine.apply_strict_filter(mask, STRICT)
+
+
+def case_merge_overlay(rgba, params):
+    overlay = engine.create_highlight_overlay(engine.get_color_mask(rgba, params.highlight.color, SENSITIVITY))
+    return lambda: engine.merge_overlay_with_image(rgba, overlay)
+
+
+def _render_job(pyramid, distances, params, dirty, cache):
+    view = engine.view_geometry(pyramid.base.shape[1], pyramid.base.shape[0], *VIEWPORT)
+    return area_calculator.RenderJob(0, _NeverCancelled(), None, pyramid, distances, params, dirty,
+                                     {}, cache, view)
+
+
+class _NeverCancelled:
+    def is_set(self):
+        return False
+
+
+def _empty_cache():
+    return {"highlight_mask": None, "transient_mask": None, "class_labels": None, "labels_pyramid": None,
+            "view_base": None}
+
+
+def case_render(rgba, params):
+    dirty = {"highlight": True, "transient": True, "manual": True}
+    job = _render_job(engine.ImagePyramid(rgba), engine.DistanceCache(rgba), params, dirty, _empty_cache())
+    return job.render
+
+
+def case_render_slider(rgba, params):
+    pyramid, distances = engine.ImagePyramid(rgba), engine.DistanceCache(rgba)
+    dirty = {"highlight": True, "transient": True, "manual": True}
+    _, cache = _render_job(pyramid, distances, params, dirty, _empty_cache()).render()
+    moved = replace(params, highlight=replace(params.highlight, sensitivity=SENSITIVITY + 10))
+    dirty = {"highlight": True, "transient": False, "manual": False}
+    return _render_job(pyramid, distances, moved, dirty, dict(cache)).render
+
+
+def case_analyze_field(rgba, params):
+    return lambda: engine.analyze_field(rgba, params)
+
+
+CASES = {
+    "color_mask": case_color_mask,
+    "strict_filter": case_strict_filter,
+    "merge_overlay": case_merge_overlay,
+    "render": case_render,
+    "render_slider": case_render_slider,
+    "analyze_field": case_analyze_field,
+}
+RENDER_CASES = ("render", "render_slider")
+
+
+# ---------- Measuring ----------
+def measure(prepare, rgba, params, repeat):
+    """Times of `repeat` runs (each freshly prepared) and the peak traced MB of one more."""
+    times = []
+    for _ in range(repeat):
+        fn = prepare(rgba, params)
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    fn = prepare(rgba, params)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak / 2 ** 20
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "") if out.returncode == 0 else None
+    except OSError:
+        return None
+
+
+def environment():
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_suite(sizes, cases, repeat):
+    base = engine.load_rgba(DEBUG_IMAGE)
+    results = []
+    print(f"{'case':<14} {'size':>6} {'pixels':>11} {'median s':>9} {'best s':>9} {'MP/s':>9} {'peak MB':>8}")
+    for size in sizes:
+        rgba = image_for(size, base)
+        params = analysis_params(rgba)
+        megapixels = rgba.shape[0] * rgba.shape[1] / 1e6
+        for name in cases:
+            if name in RENDER_CASES and area_calculator is None:
+                print(f"{name:<14} {size:>6}  skipped (PyQt5 not installed)")
+                continue
+            times, peak = measure(CASES[name], rgba, params, repeat)
+            median = statistics.median(times)
+            row = {
+                "case": name, "size": size, "shape": list(rgba.shape[:2]), "megapixels": megapixels,
+                "times_s": times, "median_s": median, "best_s": min(times),
+                "mpix_per_s": megapixels / median if median > 0 else None, "peak_mb": peak,
+            }
+            results.append(row)
+            print(f"{name:<14} {size:>6} {rgba.shape[0] * rgba.shape[1]:>11} {median:>9.4f} {min(times):>9.4f} "
+                  f"{row['mpix_per_s']:>9.1f} {peak:>8.1f}")
+        del rgba
+    return results
+
+
+def compare(old_path, new_path):
+    """Print new/old ratios of the median time and peak memory of matching cases."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    before = {(r["case"], r["size"]): r for r in old["results"]}
+    print(f"{old['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    print(f"{'case':<14} {'size':>6} {'old s':>9} {'new s':>9} {'time x':>7} {'old MB':>8} {'new MB':>8} {'mem x':>6}")
+    for r in new["results"]:
+        o = before.get((r["case"], r["size"]))
+        if o is None:
+            continue
+        time_ratio = r["median_s"] / o["median_s"] if o["median_s"] else float("nan")
+        mem_ratio = r["peak_mb"] / o["peak_mb"] if o["peak_mb"] else float("nan")
+        print(f"{r['case']:<14} {r['size']:>6} {o['median_s']:>9.4f} {r['median_s']:>9.4f} {time_ratio:>7.2f} "
+              f"{o['peak_mb']:>8.1f} {r['peak_mb']:>8.1f} {mem_ratio:>6.2f}")
+
+
+def parse_sizes(text):
+    sizes = []
+    for s in text.split(","):
+        s = s.strip()
+        if s != "debug" and not 0 < float(s) <= 200:
+            raise argparse.ArgumentTypeError(f"size {s} is not 'debug' or 1..200 MP")
+        sizes.append(s)
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("debug,1,4,16"),
+                        help="comma-separated 'debug' and megapixel sizes (up to 200)")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated subset of " + ", ".join(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two JSON reports and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    env = environment()
+    results = run_suite(args.sizes, cases, max(1, args.repeat))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"environment": env, "repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"Report written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Checks the tiled engine (area_tiles) against whole-image analysis and times both.
+
+Usage:
+    python benchmarks/bench_tiles.py [--size 4] [--repeat 3]
+
+On debug_image.png and a synthetic --size MP image, for strict off and levels
+1..10, with an extra chebyshev class and manual patches, every result must
+equal the whole-image one exactly:
+
+    apply_strict_filter_tiled   apply_strict_filter of the color mask
+    analyze_field_tiled         analyze_field
+    analyze_fields_tiled        analyze_fields (overlapping fields, a hole,
+                                a field outside the image)
+
+at the smallest tile, an odd tile size, 1000 px and the tile derived from the
+memory budget, reading from the array and from an ArrayImageStore. Any
+mismatch exits with an error. The timing compares analyze_field_tiled at the
+default budget with analyze_field.
+"""
+from dataclasses import replace
+from os import path
+import argparse, statistics, sys, time
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+import bench_suite
+from bench_suite import engine
+import area_store, area_tiles
+
+STRICT_LEVELS = (None, *range(1, 11))
+
+
+def tile_budget(tile, level):
+    """Memory budget for which tile_size_for_budget gives `tile` at a strict level."""
+    return area_tiles.BYTES_PER_PIXEL * (tile + 2 * area_tiles.strict_halo(level or 0)) ** 2
+
+
+def strict_params(rgba, level):
+    h, w = rgba.shape[:2]
+    params = bench_suite.analysis_params(rgba)
+    params.highlight = replace(params.highlight, strict=level)
+    params.classes = [engine.ColorClass("crop", engine.LayerParams(
+        color=tuple(int(v) for v in rgba[h * 2 // 3, w * 2 // 3, :3]),
+        sensitivity=bench_suite.SENSITIVITY // 2, strict=level, metric="chebyshev"))]
+    params.manual_enabled = True
+    params.manual_patches = [engine.make_patch(rgba, (x, y), min(h, w) // 12, bench_suite.SENSITIVITY, 3)
+                             for x, y in ((w // 4, h // 4), (w // 2, h // 2), (w - 5, h - 5))]
+    return params
+
+
+def test_fields(rgba):
+    h, w = rgba.shape[:2]
+    return [
+        engine.Field("left", [(0, 0), (w // 2, 0), (w // 2, h), (0, h)]),
+        engine.Field("overlap", [(w // 3, h // 4), (w * 3 // 4, h // 5), (w * 2 // 3, h * 4 // 5)]),
+        engine.Field("holed", [(w // 10, h // 10), (w * 9 // 10, h // 10), (w * 9 // 10, h * 9 // 10), (w // 10, h * 9 // 10)],
+                     [[(w // 3, h // 3), (w * 2 // 3, h // 3), (w * 2 // 3, h * 2 // 3), (w // 3, h * 2 // 3)]]),
+        engine.Field("outside", [(w + 10, h + 10), (w + 50, h + 10), (w + 50, h + 50)]),
+    ]
+
+
+def check(name, rgba):
+    store = area_store.ArrayImageStore(rgba)
+    fields = test_fields(rgba)
+    tiles = (area_tiles.MIN_TILE, 301, 1000, None)
+    for level in STRICT_LEVELS:
+        params = strict_params(rgba, level)
+        layer = params.highlight
+        expected = engine.get_color_mask(rgba, layer.color, layer.sensitivity, layer.metric)
+        if level is not None:
+            expected = engine.apply_strict_filter(expected, level)
+        for tile in tiles[:-1]:
+            if not (area_tiles.apply_strict_filter_tiled(rgba, layer, tile_budget(tile, level)) == expected).all():
+                raise SystemExit(f"Mismatch: strict filter on {name}, level {level}, tile {tile}")
+
+        result = engine.analyze_field(rgba, params)
+        results = engine.analyze_fields(rgba, params, fields)
+        for source in (rgba, store):
+            for tile in tiles:
+                if area_tiles.analyze_field_tiled(source, params, tile=tile) != result:
+                    raise SystemExit(f"Mismatch: analyze_field on {name}, level {level}, tile {tile}")
+                if area_tiles.analyze_fields_tiled(source, params, fields, tile=tile) != results:
+                    raise SystemExit(f"Mismatch: analyze_fields on {name}, level {level}, tile {tile}")
+    print(f"{name}: tiled results equal whole-image results at strict off/1..10")
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=float, default=4, help="megapixels of the synthetic image")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    base = engine.load_rgba(bench_suite.DEBUG_IMAGE)
+    images = {"debug": base, f"{args.size:g} MP": bench_suite.synthetic_image(base, args.size)}
+    for name, rgba in images.items():
+        check(name, rgba)
+    print(f"{'image':<8} {'level':>5} {'tiled s':>8} {'whole s':>8}")
+    for name, rgba in images.items():
+        for level in (1, 5, 10):
+            params = strict_params(rgba, level)
+            tiled = timed(lambda: area_tiles.analyze_field_tiled(rgba, params), args.repeat)
+            whole = timed(lambda: engine.analyze_field(rgba, params), args.repeat)
+            print(f"{name:<8} {level:>5} {tiled:>8.3f} {whole:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
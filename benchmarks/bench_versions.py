@@ -0,0 +1,267 @@
+"""Speed, peak memory and results of the released versions side by side.
+
+Usage:
+    python benchmarks/bench_versions.py [--sizes debug,1,4] [--images DIR] [--paths ...]
+        [--strict 3] [--repeat 3] [--out report.json]
+
+Loads every versions/area_calculator_v*.py next to the current engine and runs
+their color-mask, strict-filter and analysis paths headlessly: the version's
+own methods are called on a stand-in for its window that holds the image, the
+picked colors and the slider values (no QApplication is created, but PyQt5
+must be importable). The corpus is the bundled debug_image.png, the --sizes
+synthetic images of bench_suite and every image of --images.
+
+Paths:
+    color_mask      get_color_mask on the whole image
+    strict_filter   apply_strict_filter of the current color mask (v0.2 on)
+    analyze         analyze_field over the central 80 % of the image
+
+Each row shows the median wall time, its ratio to the current engine and the
+peak traced memory. The mask paths report the share of pixels that differ from
+the current engine's mask, analyze the highlight / transient / manual /
+combined percentages the version displays (2 decimals) and how far its
+highlight and combined percentages are from the current ones. --strict 0 switches the strict
+filter off, so that v0.1 (which has none) analyzes the same layers.
+"""
+from contextlib import redirect_stdout
+from glob import glob
+from os import path
+import argparse, importlib.util, inspect, io, json, re, statistics, sys
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+import bench_suite
+from bench_suite import engine
+
+try:
+    from PyQt5.QtGui import QImage
+except ImportError:  # the released versions are Qt applications
+    QImage = None
+
+VERSIONS_DIR = path.join(bench_suite.ROOT, "versions")
+CURRENT = "current"
+PATHS = ("color_mask", "strict_filter", "analyze")
+_PRINTED = re.compile(r"Highlighted area: ([-\d.]+)%")
+
+
+# ---------- Loading versions ----------
+def load_versions():
+    """{"v0.1": window class, ...} of every released version, oldest first."""
+    versions = {}
+    for file_path in sorted(glob(path.join(VERSIONS_DIR, "area_calculator_v*.py"))):
+        tag = re.search(r"_(v[\d.]+)", path.basename(file_path)).group(1)
+        spec = importlib.util.spec_from_file_location("area_calculator_" + tag.replace(".", "_"), file_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        versions[tag] = next(c for _, c in inspect.getmembers(module, inspect.isclass)
+                             if c.__module__ == module.__name__ and hasattr(c, "analyze_field"))
+    return versions
+
+
+class _Widget:
+    """Stand-in for the checkboxes, sliders and labels an analysis path reads or writes."""
+
+    def __init__(self, checked=False, value=0):
+        self.checked, self.number, self.text = checked, value, None
+
+    def isChecked(self):
+        return self.checked
+
+    def value(self):
+        return self.number
+
+    def setText(self, text):
+        self.text = text
+
+
+def headless(window_class, rgba, params):
+    """A window of window_class without Qt: its methods on plain state set up from params."""
+    methods = {k: v for k, v in vars(window_class).items() if inspect.isfunction(v) and not k.startswith("__")}
+    methods["hint"] = lambda self, text, timed=False: print(text)
+    w = type("Headless" + window_class.__name__, (), methods)()
+    h, width = rgba.shape[:2]
+    w.base_rgba = rgba
+    # the QImage shares rgba's buffer, as the GUI's does
+    w.qimage = QImage(rgba.data, width, h, 4 * width, QImage.Format_RGBA8888)
+    w.anchors = list(params.polygon) + [params.polygon[0]]
+    w.polygon_closed = True
+    hl, tr = params.highlight, params.transient
+    w.picked_color, w.sensitivity = hl.color, hl.sensitivity
+    w.strict_sensitivity = hl.strict or 0
+    w.transient_color, w.transient_sensitivity = tr.color, tr.sensitivity
+    w.transient_strict = tr.strict or 0
+    w.manual_patches, w.manual_preview = [], None
+    w.toggle_checkbox = _Widget(hl.active)
+    w.strict_checkbox = _Widget(hl.strict is not None)
+    w.strict_slider = _Widget(value=hl.strict or 0)
+    w.transient_checkbox = _Widget(tr.active)
+    w.manual_checkbox = _Widget(False)
+    w.highlight_perc, w.transcient_perc = _Widget(), _Widget()
+    w.manual_perc, w.combined_perc = _Widget(), _Widget()
+    return w
+
+
+def _label_percent(widget):
+    if widget.text is None or widget.text == "None":
+        return None
+    return float(widget.text.rstrip("%"))
+
+
+def displayed_percentages(w, printed):
+    """The percentages a version showed: in its result labels (v0.3) or printed (v0.1, v0.2)."""
+    if w.combined_perc.text is not None:
+        return {"highlight": _label_percent(w.highlight_perc), "transient": _label_percent(w.transcient_perc),
+                "manual": _label_percent(w.manual_perc), "combined": _label_percent(w.combined_perc)}
+    match = _PRINTED.search(printed)
+    if match is None:
+        raise RuntimeError(printed.strip() or "no result")
+    # one number: the highlight, which is also everything these versions combine
+    percent = float(match.group(1))
+    return {"highlight": percent, "transient": None, "manual": None, "combined": percent}
+
+
+# ---------- Paths ----------
+# Like bench_suite's cases: prepare (untimed) and return the timed callable,
+# which returns the path's output
+def current_path(name, rgba, params):
+    hl = params.highlight
+    if name == "color_mask":
+        return lambda: engine.get_color_mask(rgba, hl.color, hl.sensitivity)
+    if name == "strict_filter":
+        mask = engine.get_color_mask(rgba, hl.color, hl.sensitivity)
+        return lambda: engine.apply_strict_filter(mask, hl.strict)
+    return lambda: {k: v for k, v in engine.analyze_field(rgba, params).as_dict().items() if k != "field_pixels"}
+
+
+def version_path(window_class, name, rgba, params):
+    """The timed callable of one version's path, or None if the version doesn't have it."""
+    w = headless(window_class, rgba, params)
+    hl = params.highlight
+    if name == "color_mask":
+        rgb = rgba[:, :, :3]
+        return lambda: w.get_color_mask(rgb, hl.color, hl.sensitivity)
+    if name == "strict_filter":
+        if not hasattr(w, "apply_strict_filter"):
+            return None
+        mask = engine.get_color_mask(rgba, hl.color, hl.sensitivity)
+        return lambda: w.apply_strict_filter(mask, hl.strict)
+
+    def analyze():
+        out = io.StringIO()
+        with redirect_stdout(out):
+            w.analyze_field()
+        return displayed_percentages(w, out.getvalue())
+    return analyze
+
+
+# ---------- Measuring ----------
+def measure(prepare, repeat):
+    """bench_suite.measure plus the output of the last run."""
+    last = [None]
+
+    def keep(rgba, params):
+        fn = prepare()
+
+        def run():
+            last[0] = fn()
+        return run
+    times, peak = bench_suite.measure(keep, None, None, repeat)
+    return times, peak, last[0]
+
+
+def difference(name, output, reference):
+    if name == "analyze":
+        delta = {k: None if v is None or reference[k] is None else v - reference[k] for k, v in output.items()}
+        return {"percent": output, "delta": delta}
+    return {"mask_diff_pct": 100.0 * np.count_nonzero(output != reference) / reference.size}
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def describe(name, result):
+    if name != "analyze":
+        return f"{result['mask_diff_pct']:.4f} % px differ"
+    p = result["percent"]
+    return (f"H {_fmt(p['highlight'], '.2f')}  T {_fmt(p['transient'], '.2f')}  M {_fmt(p['manual'], '.2f')}  "
+            f"C {_fmt(p['combined'], '.2f')}  dH {_fmt(result['delta']['highlight'], '+.2f')}  "
+            f"dC {_fmt(result['delta']['combined'], '+.2f')}")
+
+
+def corpus(sizes, image_dir):
+    """(name, rgba) of the debug/synthetic sizes and the images of image_dir."""
+    base = engine.load_rgba(bench_suite.DEBUG_IMAGE)
+    for size in sizes:
+        yield size, bench_suite.image_for(size, base)
+    if image_dir:
+        for file_path in sorted(glob(path.join(image_dir, "*"))):
+            if file_path.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")):
+                yield path.basename(file_path), engine.load_rgba(file_path)
+
+
+def run(versions, images, paths, strict, repeat):
+    results = []
+    print(f"{'image':<16} {'path':<14} {'version':<8} {'median s':>9} {'x cur':>6} {'peak MB':>8}  result")
+    for image, rgba in images:
+        params = bench_suite.analysis_params(rgba)
+        params.highlight.strict = strict or None
+        params.transient.strict = max(0, strict - 1) or None
+        for name in paths:
+            if name == "strict_filter" and not strict:
+                continue
+            times, peak, reference = measure(lambda: current_path(name, rgba, params), repeat)
+            current_s = statistics.median(times)
+            rows = [(CURRENT, times, peak, reference)]
+            for tag, window_class in versions.items():
+                if version_path(window_class, name, rgba, params) is None:
+                    rows.append((tag, None, None, None))
+                    continue
+                rows.append((tag, *measure(lambda: version_path(window_class, name, rgba, params), repeat)))
+            for tag, times, peak, output in rows:
+                if times is None:
+                    print(f"{image:<16} {name:<14} {tag:<8}  n/a")
+                    continue
+                median = statistics.median(times)
+                row = {"image": image, "shape": list(rgba.shape[:2]), "path": name, "version": tag,
+                       "times_s": times, "median_s": median, "vs_current": median / current_s if current_s else None,
+                       "peak_mb": peak, **difference(name, output, reference)}
+                results.append(row)
+                print(f"{image:<16} {name:<14} {tag:<8} {median:>9.4f} {_fmt(row['vs_current'], '>6.2f')} "
+                      f"{peak:>8.1f}  {describe(name, row)}")
+        del rgba
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=bench_suite.parse_sizes, default=bench_suite.parse_sizes("debug,1,4"),
+                        help="comma-separated 'debug' and megapixel sizes (up to 200)")
+    parser.add_argument("--images", help="also run every image of this directory")
+    parser.add_argument("--paths", default=",".join(PATHS), help="comma-separated subset of " + ", ".join(PATHS))
+    parser.add_argument("--strict", type=int, default=bench_suite.STRICT, help="strict level, 0 = off")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    unknown = [p for p in paths if p not in PATHS]
+    if unknown:
+        parser.error(f"unknown paths: {', '.join(unknown)}")
+    if QImage is None:
+        print("PyQt5 is needed to load the released versions", file=sys.stderr)
+        return 1
+
+    env = bench_suite.environment()
+    versions = load_versions()
+    results = run(versions, corpus(args.sizes, args.images), paths, max(0, args.strict), max(1, args.repeat))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"environment": env, "versions": list(versions), "strict": args.strict,
+                       "repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"Report written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())